@@ -1,14 +1,19 @@
-from functools import lru_cache
+import functools
 import time
 from src.fhir_client import FHIRClient
 import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
-from src import charts
-from src.ascvd_risk_calculator import ASCVDRiskCalculator
-from src.forecast import get_patient_name_by_id, forecasting
+from src import charts, interactive_charts, metrics, profiling, warmup
+from src.ascvd_risk_calculator import assess_risk
+from src.forecast import DEFAULT_LATENCY_BUDGET, FORECAST_FEATURES, FORECAST_MODES, get_patient_name_by_id
+from src.forecast_jobs import ForecastJobManager
+from src.forecast_store import get_stored_forecast
+from src.patient_cache import PatientCache
+from src.prefetch import Prefetcher
 import os
 import hashlib
+import uuid
 from dotenv import load_dotenv
 
 
@@ -21,22 +26,58 @@ DOCTOR_ID = os.getenv("DOCTOR_ID")
 
 st.set_page_config(layout="wide")
 
-JSON_DATABASE = 'data/json_database.json'
+JSON_DATABASE = os.getenv("CARDICARE_DATABASE", 'data/json_database.json')
 fullUrl = "http://tutsgnfhir.com"
 
+# Seconds between status checks of a running forecast job
+FORECAST_POLL_INTERVAL = 0.5
+
+# Health trend chart engines: static matplotlib images or zoomable Plotly WebGL charts
+CHART_ENGINES = ["Static", "Interactive"]
+
+
+def _timed_section(name):
+    """
+    Record the server time of each run of a dashboard section in st.session_state.section_timings.
+
+    Sections are fragments, so an interaction inside one reruns only that section; the
+    timings show what an interaction costs (see benchmarks/bench_interactions.py).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                st.session_state.setdefault('section_timings', {})[name] = time.perf_counter() - started
+        return wrapper
+    return decorator
+
+
+def _drop_derived_chart_data(patient_id):
+    # After a data reload no cached chart can be requested again, free them at once
+    if patient_id is None:
+        charts.chart_cache.clear()
+
 
 class DecisionSupportInterface():
     def __init__(self):
         """Initialize the app with lazy loading"""
-        # Initialize client only when needed
-        if 'client' not in st.session_state:
-            with st.spinner("Initializing system..."):
-                st.session_state.client = FHIRClient(
-                    server_url=fullUrl,
-                    json_path=JSON_DATABASE
-                )
-    
-        self.client = st.session_state.client
+        self.client = DecisionSupportInterface.get_client()
+        # Every run picks up a replaced database, in this and every other session
+        if self.client.reload_if_changed():
+            DecisionSupportInterface.get_all_patient_ids.clear()
+            DecisionSupportInterface.build_patient_cache.clear()
+            DecisionSupportInterface.get_patient_cache().invalidate()
+
+    @st.cache_resource(show_spinner="Initializing system...")
+    def get_client():
+        """One FHIR client shared by all sessions, so the database is parsed and held once"""
+        return FHIRClient(
+            server_url=fullUrl,
+            json_path=JSON_DATABASE
+        )
 
     def authenticate_user(self, username, password):
         """
@@ -96,34 +137,50 @@ class DecisionSupportInterface():
                     )
                     st.write("© 2025 WeCare Health Systems")
 
-    @st.cache_data(ttl=3600)
+    @st.cache_resource
+    def get_patient_cache():
+        """One memory-bounded patient cache shared by all sessions"""
+        patient_cache = PatientCache()
+        patient_cache.add_invalidation_hook(_drop_derived_chart_data)
+        return patient_cache
+
+    @st.cache_resource
+    def get_prefetcher():
+        """Background warm-up of the shared patient and chart caches"""
+        return Prefetcher(DecisionSupportInterface.get_patient_cache())
+
+    def _prefetch(self, patient_ids):
+        """Warm the caches for the given patients, replacing this session's pending prefetch"""
+        if 'prefetch_owner' not in st.session_state:
+            st.session_state.prefetch_owner = uuid.uuid4().hex
+        DecisionSupportInterface.get_prefetcher().prefetch(st.session_state.prefetch_owner, self.client, patient_ids)
+
+    @st.cache_resource
+    def start_metrics():
+        """Expose the process-wide caches to the metrics registry and start the local /metrics endpoint"""
+        metrics.register_collector(
+            metrics.cache_stats_collector('patient', DecisionSupportInterface.get_patient_cache().stats),
+            name='patient_cache')
+        return metrics.start_http_server() if metrics.METRICS_PORT else None
+
+    @metrics.timed("app.load_patient_data")
     def load_patient_data(_client, patient_id):
         """Cache patient data retrieval"""
-        return {
-            "demographics": _client.get_demographics(patient_id),
-            "weight_history": _client.get_weight_history(patient_id),
-            "height_history": _client.get_height_history(patient_id),
-            "bmi_history": _client.get_bmi_history(patient_id),
-            "glucose_history": _client.get_glucose_history(patient_id),
-            "systolic_bp_history": _client.get_systolic_blood_pressure_history(patient_id),
-            "diastolic_bp_history": _client.get_diastolic_blood_pressure_history(patient_id),
-            "hr_history": _client.get_heart_rate_history(patient_id),
-            "total_chol": _client.get_latest_total_cholesterol(patient_id),
-            "hdl_chol": _client.get_latest_hdl_cholesterol(patient_id),
-            "systolic_bp": _client.get_latest_systolic_bp(patient_id),
-            "is_treated_bp": _client.is_patient_on_bp_medication(patient_id),
-            "is_smoker": _client.is_patient_smoker(patient_id),
-            "has_diabetes": _client.does_patient_have_diabetes(patient_id)
-        }
+        return DecisionSupportInterface.get_patient_cache().get(_client, patient_id)
     
     @st.cache_data(ttl=3600)
     def get_all_patient_ids(_client):
         """Cache the patient IDs list"""
         return _client.get_all_patient_ids()
     
-    @lru_cache(maxsize=32)
+    @st.cache_resource
+    def get_forecast_job_manager():
+        """Shared by all sessions so identical forecast requests are fitted once"""
+        return ForecastJobManager()
+
+    @st.cache_resource
     def read_csv_data():
-        """Cache CSV reading for forecasting"""
+        """Cache CSV reading for forecasting; the DataFrame is shared, treat it as read-only"""
         return pd.read_csv("src/out.csv")
     
     @st.cache_data(ttl=300)  # Cache for 5 minutes
@@ -347,87 +404,50 @@ class DecisionSupportInterface():
         risk_cache_key = f"risk_{demographics[0]}_{demographics[1]}"
 
         if risk_cache_key not in st.session_state:
+            assessment = assess_risk(demographics, cholesterol_data.get('total_cholesterol'),
+                                     cholesterol_data.get('hdl_cholesterol'), systolic_bp, is_treated_bp, is_smoker,
+                                     has_diabetes)
+            if assessment['status'] != 'success':
+                st.session_state[risk_cache_key] = assessment
+            else:
+                risk = assessment['risk']
+                sex = assessment['sex']
+                total_chol = assessment['total_chol']
+                hdl_chol = assessment['hdl_chol']
+                systolic_bp_value = assessment['systolic_bp']
+
+                normal_ranges = {
+                    "Total Cholesterol": {"min": 125, "max": 200},
+                    "HDL Cholesterol": {"min": 40 if sex == "male" else 50, "max": 60}, 
+                    "Systolic BP": {"min": 90, "max": 120}
+                }
 
-            if not demographics:
-                st.session_state[risk_cache_key] = {"status": "insufficient_data"}
-                return
-
-            total_chol_data = cholesterol_data.get('total_cholesterol')
-            hdl_chol_data = cholesterol_data.get('hdl_cholesterol')
-            
-            if not total_chol_data or not hdl_chol_data:
-                st.info("Missing cholesterol data for risk calculation.")
-                return
-                
-            if not isinstance(total_chol_data, dict) or 'value' not in total_chol_data or not total_chol_data['value']:
-                st.info("Missing cholesterol data for risk calculation.")
-                return
-                
-            if not isinstance(hdl_chol_data, dict) or 'value' not in hdl_chol_data or not hdl_chol_data['value']:
-                st.info("Missing cholesterol data for risk calculation.")
-                return
-                
-            if not systolic_bp or not isinstance(systolic_bp, dict) or 'value' not in systolic_bp:
-                st.info("Missing systolic BP data for risk calculation.")
-                return
-                
-            total_chol = total_chol_data['value']
-            hdl_chol = hdl_chol_data['value']
-            systolic_bp_value = systolic_bp['value']
-
-            _, _, _, age, sex = demographics
-
-            normal_ranges = {
-                "Total Cholesterol": {"min": 125, "max": 200},
-                "HDL Cholesterol": {"min": 40 if sex == "male" else 50, "max": 60}, 
-                "Systolic BP": {"min": 90, "max": 120}
-            }
-
-            tc_status = "normal"
-            if total_chol < normal_ranges["Total Cholesterol"]["min"]:
-                tc_status = "low"
-            elif total_chol > normal_ranges["Total Cholesterol"]["max"]:
-                tc_status = "high"
-                
-            # HDL cholesterol (sex-specific thresholds)
-            hdl_status = "normal"
-            if hdl_chol < normal_ranges["HDL Cholesterol"]["min"]:
-                hdl_status = "low"
-            elif hdl_chol > normal_ranges["HDL Cholesterol"]["max"]:
-                hdl_status = "high"
-                
-            # Systolic BP
-            bp_status = "normal"
-            if systolic_bp_value < normal_ranges["Systolic BP"]["min"]:
-                bp_status = "low"
-            elif systolic_bp_value > normal_ranges["Systolic BP"]["max"]:
-                bp_status = "high"
-
-            risk_calc = ASCVDRiskCalculator()
-            risk = risk_calc.compute_10_year_risk(
-                age=age,
-                sex=sex,  
-                total_cholesterol=total_chol,
-                hdl_cholesterol=hdl_chol,
-                systolic_bp=systolic_bp_value,
-                isBpTreated=is_treated_bp,
-                isSmoker=is_smoker,
-                hasDiabetes=has_diabetes
-            )
-
-            risk_categories = {
-                "Low Risk": 5.0,
-                "Moderate Risk": 7.5,
-                "High Risk": 20.0
-            }
-            
-            if isinstance(risk, dict):
-                st.session_state[risk_cache_key] = {
-                    "status": "error",
-                    "message": risk['message']
+                tc_status = "normal"
+                if total_chol < normal_ranges["Total Cholesterol"]["min"]:
+                    tc_status = "low"
+                elif total_chol > normal_ranges["Total Cholesterol"]["max"]:
+                    tc_status = "high"
+                    
+                # HDL cholesterol (sex-specific thresholds)
+                hdl_status = "normal"
+                if hdl_chol < normal_ranges["HDL Cholesterol"]["min"]:
+                    hdl_status = "low"
+                elif hdl_chol > normal_ranges["HDL Cholesterol"]["max"]:
+                    hdl_status = "high"
+                    
+                # Systolic BP
+                bp_status = "normal"
+                if systolic_bp_value < normal_ranges["Systolic BP"]["min"]:
+                    bp_status = "low"
+                elif systolic_bp_value > normal_ranges["Systolic BP"]["max"]:
+                    bp_status = "high"
+
+                risk_categories = {
+                    "Low Risk": 5.0,
+                    "Moderate Risk": 7.5,
+                    "High Risk": 20.0
                 }
 
-            else:
                 st.session_state[risk_cache_key] = {
                     "status": "success",
                     "risk": risk,
@@ -471,12 +491,11 @@ class DecisionSupportInterface():
 
         cached_result = st.session_state[risk_cache_key]
 
-        if cached_result["status"] == "insufficient_data":
-            st.info("Not enough data to calculate ASCVD risk.")
-        elif cached_result["status"] == "missing_cholesterol":
-            st.info("Missing cholesterol data for risk calculation.")
-        elif cached_result["status"] == "error":
-            st.warning(cached_result["message"])
+        if cached_result["status"] != "success":
+            if cached_result["reason"] == "missing_data":
+                st.info(cached_result["message"])
+            else:
+                st.warning(cached_result["message"])
         else:
             left_col, right_col = st.columns([1, 1])
 
@@ -537,13 +556,26 @@ class DecisionSupportInterface():
                         st.markdown("• Consider aspirin for select patients")
             
     def _display_patient_dashboard(self, patient_id):
-        cache_key = f"patient_{patient_id}"
-        if cache_key not in st.session_state.get('loaded_patients', {}):
+        profile_request = profiling.take_profile_request(patient_id)
+        if profile_request is None:
+            self._render_patient_dashboard(patient_id)
+            return
+
+        if profile_request['cold']:
+            DecisionSupportInterface.get_patient_cache().invalidate(patient_id)
+            charts.chart_cache.clear()
+        with profiling.Profile(f"patient_{patient_id}", profile_request['trace_allocations']) as profile:
+            self._render_patient_dashboard(patient_id)
+        st.session_state.last_profile = {"patient_id": patient_id, "paths": profile.paths, "report": profile.report}
+        st.toast(f"Profile written to {profile.paths['report']}")
+
+    def _render_patient_dashboard(self, patient_id):
+        # Looked up on every rerun rather than copied into the session, the cache hands out shared references
+        if patient_id in DecisionSupportInterface.get_patient_cache():
+            patient_data = DecisionSupportInterface.load_patient_data(self.client, patient_id)
+        else:
             with st.spinner(f"Loading data for patient {patient_id}..."):
-                st.session_state.loaded_patients = st.session_state.get('loaded_patients', {})
-                st.session_state.loaded_patients[cache_key] = DecisionSupportInterface.load_patient_data(self.client, patient_id)
-
-        patient_data = st.session_state.loaded_patients[cache_key]
+                patient_data = DecisionSupportInterface.load_patient_data(self.client, patient_id)
 
         demographics = patient_data["demographics"]
         weight_history = patient_data["weight_history"]
@@ -574,28 +606,10 @@ class DecisionSupportInterface():
         )
 
         with st.expander("Health Trends", expanded=True):
-            row1_col1, row1_col2 = st.columns(2)
-            with row1_col1:
-                charts.plot_weight_height_bmi(weight_history, height_history, bmi_history, demographics, self.client)
-            with row1_col2:
-                charts.plot_blood_glucose_level(glucose_history, self.client)
-        
-            row2_col1, row2_col2 = st.columns(2)
-            with row2_col1:
-                charts.plot_blood_pressure(systolic_bp_history, diastolic_bp_history, demographics, self.client)
-            with row2_col2:
-                charts.plot_heart_rate(hr_history, demographics, self.client)
+            self._display_health_trends(patient_id, patient_data)
 
         with st.expander("### ASCVD Risk Assessment", expanded=True):
-            
-            self.display_risk_score(
-                demographics, 
-                cholesterol_data, 
-                patient_data["systolic_bp"], 
-                patient_data["is_treated_bp"], 
-                patient_data["is_smoker"], 
-                patient_data["has_diabetes"]
-            )
+            self._display_risk_assessment(patient_data)
         with st.expander("ASCVD Information"):
                 st.markdown("""
                     **Atherosclerotic Cardiovascular Disease (ASCVD) Risk Assessment** estimates the likelihood 
@@ -620,80 +634,237 @@ class DecisionSupportInterface():
         with st.expander("Health Forecasting", expanded=True):
             self._display_forecasting(patient_id)
 
+    @st.fragment
+    @_timed_section("health_trends")
+    def _display_health_trends(self, patient_id, patient_data):
+        # A fragment: switching the chart engine or moving the date range reruns only this section
+        chart_engine = st.radio("Chart engine", CHART_ENGINES, horizontal=True, key=f"chart_engine_{patient_id}")
+        if chart_engine == "Interactive":
+            self._display_interactive_charts(patient_id, patient_data)
+        else:
+            # Render all four charts at once in the chart process pool, then place the images
+            chart_images = charts.render_charts(charts.dashboard_chart_args(patient_data))
+
+            row1_col1, row1_col2 = st.columns(2)
+            with row1_col1:
+                charts.show_chart('weight_height_bmi', chart_images)
+            with row1_col2:
+                charts.show_chart('glucose', chart_images)
+
+            row2_col1, row2_col2 = st.columns(2)
+            with row2_col1:
+                charts.show_chart('blood_pressure', chart_images)
+            with row2_col2:
+                charts.show_chart('heart_rate', chart_images)
+
+    @st.fragment
+    @_timed_section("risk_assessment")
+    def _display_risk_assessment(self, patient_data):
+        cholesterol_data = {
+            "total_cholesterol": patient_data["total_chol"],
+            "hdl_cholesterol": patient_data["hdl_chol"]
+        }
+        self.display_risk_score(
+            patient_data["demographics"],
+            cholesterol_data,
+            patient_data["systolic_bp"],
+            patient_data["is_treated_bp"],
+            patient_data["is_smoker"],
+            patient_data["has_diabetes"]
+        )
+
+    def _display_interactive_charts(self, patient_id, patient_data):
+        demographics = patient_data["demographics"]
+        histories = [patient_data[name] for name in ("weight_history", "height_history", "bmi_history",
+                                                     "glucose_history", "systolic_bp_history",
+                                                     "diastolic_bp_history", "hr_history")]
+        dates = interactive_charts.date_range(*histories)
+        if dates is None:
+            st.warning("No health trend data available")
+            return
+
+        # The window is shared by all four charts; every change only sends the buckets inside it.
+        # st.plotly_chart reports selections but not zoom or pan events, so zooming a chart only
+        # magnifies the buckets already sent; re-aggregating a narrower range goes through this slider
+        start, end = dates
+        if start < end:
+            start, end = st.slider("Aggregation window", min_value=dates[0], max_value=dates[1], value=dates,
+                                   format="DD-MM-YYYY", key=f"chart_window_{patient_id}",
+                                   help="Charts are re-aggregated at the finest detail that fits this window. "
+                                        "Zooming inside a chart only enlarges the points already shown.")
+
+        figures = [
+            ('weight_height_bmi', interactive_charts.weight_height_bmi_figure(
+                patient_data["weight_history"], patient_data["height_history"], patient_data["bmi_history"],
+                demographics, start, end)),
+            ('glucose', interactive_charts.glucose_figure(patient_data["glucose_history"], start, end)),
+            ('blood_pressure', interactive_charts.blood_pressure_figure(
+                patient_data["systolic_bp_history"], patient_data["diastolic_bp_history"], demographics, start, end)),
+            ('heart_rate', interactive_charts.heart_rate_figure(patient_data["hr_history"], demographics, start, end))
+        ]
+        for row in (figures[:2], figures[2:]):
+            for column, (name, fig) in zip(st.columns(2), row):
+                with column:
+                    if fig is None:
+                        st.warning(charts.DASHBOARD_CHARTS[name][1])
+                    else:
+                        st.plotly_chart(fig, use_container_width=True, key=f"{name}_{patient_id}")
+
+    @st.fragment
+    @_timed_section("forecasting")
     def _display_forecasting(self, patient_id):
+        # A fragment: the forecast inputs and buttons rerun only this section
         st.markdown("### Forecasting Health Trends")
 
-        df = pd.read_csv("src/out.csv")
+        df = DecisionSupportInterface.read_csv_data()
     
-        allowed_features = [
-            "bmi",
-            "weight",
-            "heart_rate",
-            "Systolic blood pressure", 
-            "Diastolic blood pressure"
-        ]
-
         features_list_from_csv = df["Features"].unique().tolist()
-        filtered_features = [feat for feat in features_list_from_csv if feat in allowed_features]
+        filtered_features = [feat for feat in features_list_from_csv if feat in FORECAST_FEATURES]
         
         # Use columns for layout
-        col1, col2 = st.columns([3, 1])
+        col1, col2, col3, col4 = st.columns([3, 1, 2, 1])
         
         with col1:
-            selected_feat = st.selectbox("Select a health feature", filtered_features)
+            selected_feat = st.selectbox("Select a health feature", filtered_features, key=f"forecast_feat_{patient_id}")
         with col2:
-            duration = st.number_input("Prediction days", min_value=1, max_value=30, value=5)
-        
-        # Add loading state
-        forecast_placeholder = st.empty()
-
+            duration = st.number_input("Prediction days", min_value=1, max_value=30, value=5,
+                                       key=f"forecast_days_{patient_id}")
+        with col3:
+            mode_label = st.selectbox("Forecast method", list(FORECAST_MODES.keys()), key=f"forecast_mode_{patient_id}")
+            mode = FORECAST_MODES[mode_label]
+        with col4:
+            latency_budget = st.number_input("Latency budget (s)", min_value=0.1, max_value=30.0,
+                                             value=DEFAULT_LATENCY_BUDGET, step=0.5,
+                                             key=f"forecast_budget_{patient_id}", disabled=mode != "auto")
+
+        manager = DecisionSupportInterface.get_forecast_job_manager()
+        job_state_key = f"forecast_job_{patient_id}"
+        inputs = (selected_feat, duration, mode, latency_budget)
+
+        # A job submitted for different inputs is no longer wanted by this session
+        job_state = st.session_state.get(job_state_key)
+        if job_state and job_state["inputs"] != inputs:
+            if job_state["job_id"]:
+                manager.release(job_state["job_id"])
+            del st.session_state[job_state_key]
 
         if st.button("Run Forecast", key=f"forecast_{patient_id}"):
-            with forecast_placeholder.container():
-                with st.spinner("Calculating forecast..."):
-                    # Get unit for selected feature
-                    filtered_df = df[(df["Features"] == selected_feat) & 
-                                (df["Name"] == get_patient_name_by_id(patient_id))]
-                    unit = filtered_df["Unit"].iloc[0] if not filtered_df.empty else ""
-                    
-                    result = forecasting(selected_feat, duration, patient_id)
-                    
-                    if isinstance(result, str):
-                        st.warning(result)
-                    else:
-                        st.success(f"Forecasted {selected_feat} for next {duration} days")
-                        
-                        # Create forecast steps
-                        steps = list(range(1, duration + 1))
-                        
-                        # Plot with Plotly
-                        fig = go.Figure()
-                        fig.add_trace(go.Scatter(
-                            x=steps, 
-                            y=result, 
-                            mode='lines+markers',
-                            name=selected_feat,
-                            line=dict(color='royalblue', width=3),
-                            marker=dict(size=8)
-                        ))
-                        
-                        fig.update_layout(
-                            xaxis_title="Future Time Steps (days)",
-                            yaxis_title=f"{selected_feat} ({unit})",
-                            title=f"Forecast for {selected_feat}",
-                            height=400,
-                            margin=dict(l=0, r=0, t=40, b=0),
-                            hovermode="x unified"
-                        )
-                        
-                        st.plotly_chart(fig, use_container_width=True)
+            # Get unit for selected feature
+            try:
+                patient_name = get_patient_name_by_id(patient_id)
+            except ValueError:
+                # Not in the forecasting dataset; the job reports that no forecast can be made
+                patient_name = None
+            filtered_df = df[(df["Features"] == selected_feat) & (df["Name"] == patient_name)]
+            unit = filtered_df["Unit"].iloc[0] if not filtered_df.empty else ""
+
+            previous_state = st.session_state.get(job_state_key)
+            if previous_state and previous_state["job_id"]:
+                manager.release(previous_state["job_id"])
+
+            # Prefer the batch-precomputed ARIMA forecast when one covers the requested horizon
+            stored = get_stored_forecast(patient_id, selected_feat, duration) if mode != "fast" else None
+            if stored is not None:
+                st.session_state[job_state_key] = {"inputs": inputs, "unit": unit, "job_id": None, "result": stored}
+            else:
+                job_id = manager.submit(patient_id, selected_feat, duration, mode, latency_budget)
+                st.session_state[job_state_key] = {"inputs": inputs, "unit": unit, "job_id": job_id}
+
+        if job_state_key in st.session_state:
+            self._display_forecast_job(job_state_key)
+
+    def _display_forecast_job(self, job_state_key):
+        """Show a forecast job, polling it in a fragment so only this section reruns while it is fitting"""
+        manager = DecisionSupportInterface.get_forecast_job_manager()
+        job_id = st.session_state[job_state_key]["job_id"]
+        job = manager.get(job_id) if job_id else None
+        polling = job is not None and not job.finished
+
+        @st.fragment(run_every=FORECAST_POLL_INTERVAL if polling else None)
+        def forecast_status():
+            job_state = st.session_state.get(job_state_key)
+            if not job_state:
+                return
+            selected_feat, duration, _, _ = job_state["inputs"]
+            unit = job_state["unit"]
+
+            if job_state["job_id"] is None:
+                st.success(f"Forecasted {selected_feat} for next {duration} days (ARIMA, precomputed)")
+                st.plotly_chart(self._create_forecast_chart(job_state["result"], selected_feat, unit, duration),
+                                use_container_width=True)
+                return
+
+            job = manager.get(job_state["job_id"])
+            if job is None:
+                st.info("This forecast has expired, please run it again.")
+                return
+
+            if not job.finished:
+                st.progress(job.progress, text=f"{job.stage}...")
+                if job.partial_result is not None:
+                    st.info("Showing a quick estimate while the ARIMA model is fitting...")
+                    st.plotly_chart(self._create_forecast_chart(job.partial_result, selected_feat, unit, duration),
+                                    use_container_width=True)
+                if st.button("Cancel", key=f"cancel_{job_state_key}"):
+                    manager.release(job.id)
+                    del st.session_state[job_state_key]
+                    st.rerun(scope="fragment")
+                return
+
+            if polling:
+                # Rerun the whole script once so the fragment is rebuilt without polling
+                st.rerun()
+
+            if job.status == "done":
+                method_name = "ARIMA" if job.method == "arima" else "exponential smoothing"
+                st.success(f"Forecasted {selected_feat} for next {duration} days ({method_name})")
+                st.plotly_chart(self._create_forecast_chart(job.result, selected_feat, unit, duration),
+                                use_container_width=True)
+            elif job.status == "failed":
+                st.warning(job.message)
+            else:
+                st.info("Forecast cancelled.")
+
+        forecast_status()
 
+    def _create_forecast_chart(self, result, selected_feat, unit, duration):
+        # Create forecast steps
+        steps = list(range(1, duration + 1))
+        
+        # Plot with Plotly
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=steps, 
+            y=list(result), 
+            mode='lines+markers',
+            name=selected_feat,
+            line=dict(color='royalblue', width=3),
+            marker=dict(size=8)
+        ))
+        
+        fig.update_layout(
+            xaxis_title="Future Time Steps (days)",
+            yaxis_title=f"{selected_feat} ({unit})",
+            title=f"Forecast for {selected_feat}",
+            height=400,
+            margin=dict(l=0, r=0, t=40, b=0),
+            hovermode="x unified"
+        )
+        
+        return fig
+
+    @_timed_section("dashboard")
     def dashboard(self):
         doctor_name = DOCTOR_NAME
         doctor_id = DOCTOR_ID
         st.title("CARDICARE Cardiac Health Support Interface")
-        if 'patient_ids' not in st.session_state:
-            st.session_state.patient_ids = self.client.get_all_patient_ids()
+        st.session_state.patient_ids = self.client.get_all_patient_ids()
+
+        if 'panel_prefetched' not in st.session_state:
+            # Right after login, load the chart and forecast libraries and warm up the patients on the doctor's panel
+            st.session_state.panel_prefetched = True
+            warmup.start_warm_up()
+            self._prefetch(self.client.get_panel_patient_ids(doctor_id))
             
         with st.sidebar:
             with st.container(border=True):
@@ -703,8 +874,16 @@ class DecisionSupportInterface():
 
                 if st.button("Logout", use_container_width=True):
                     st.session_state.authenticated = False
+                    st.session_state.pop('panel_prefetched', None)
+                    if 'prefetch_owner' in st.session_state:
+                        DecisionSupportInterface.get_prefetcher().cancel(st.session_state.prefetch_owner)
                     st.rerun()
 
+            if metrics.enabled():
+                self._display_metrics_panel()
+            if profiling.PROFILING_ENABLED:
+                self._display_profiling_panel()
+
         if 'previous_search_query' not in st.session_state:
             st.session_state.previous_search_query = ""
 
@@ -723,14 +902,14 @@ class DecisionSupportInterface():
 
                     st.session_state.previous_search_query = search_query
                 
-                    st.session_state.loaded_patients = {}
-                
                     # Clear risk calculation cache
                     for key in list(st.session_state.keys()):
                         if key.startswith('risk_'):
                             del st.session_state[key]
                         
                 st.session_state.search_results = self.search_patients(search_query, st.session_state.patient_ids)
+                # Warm up the results while the dashboard renders; this cancels the previous query's warm-up
+                self._prefetch(st.session_state.search_results)
         
         if 'search_results' in st.session_state and st.session_state.search_results:
             filtered_patients = st.session_state.search_results
@@ -748,8 +927,64 @@ class DecisionSupportInterface():
         elif 'search_results' in st.session_state:
             st.warning("No matching patients found")
 
+    def _display_metrics_panel(self):
+        """Stage latencies and cache hit rates of this server process, for the logged-in administrator"""
+        with st.expander("Performance metrics"):
+            snapshot = metrics.snapshot()
+            if snapshot['stages']:
+                st.dataframe(pd.DataFrame([
+                    {"Stage": stage, "Calls": stage_stats['calls'],
+                     "Mean (ms)": round(stage_stats['mean_seconds'] * 1000, 2),
+                     "Total (s)": round(stage_stats['total_seconds'], 3),
+                     "p99 under (s)": stage_stats['p99_bucket_seconds']}
+                    for stage, stage_stats in snapshot['stages'].items()
+                ]), hide_index=True, use_container_width=True)
+            else:
+                st.info("No stage has run since metrics were enabled.")
+
+            caches = {}
+            for name, labels, value, _ in snapshot['samples']:
+                if 'cache' in labels:
+                    caches.setdefault(labels['cache'], {})[name.replace('cache_', '').replace('_total', '')] = value
+            rows = []
+            for cache, cache_stats in sorted(caches.items()):
+                lookups = cache_stats.get('hits', 0) + cache_stats.get('misses', 0)
+                rows.append({"Cache": cache, "Hits": cache_stats.get('hits', 0), "Misses": cache_stats.get('misses', 0),
+                             "Hit rate": f"{cache_stats.get('hits', 0) / lookups:.0%}" if lookups else "-",
+                             "Entries": cache_stats.get('entries'), "Bytes": cache_stats.get('bytes')})
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+            st.caption("The patient and chart caches keep their own hit, miss and eviction counters since "
+                       "the server started; resetting clears the stage latencies and the other caches' counts only.")
+
+            if st.button("Reset metrics", use_container_width=True,
+                         help="Clears stage latencies and lookup counts; patient and chart cache counters are kept"):
+                metrics.reset()
+                st.rerun()
+
+    def _display_profiling_panel(self):
+        """Profile the next dashboard load of a patient, for the logged-in administrator"""
+        with st.expander("Profiling"):
+            with st.form("profile_form", border=False):
+                patient_id = st.text_input("Patient ID")
+                cold = st.checkbox("Cold caches", help="Extract the patient data and render the charts again")
+                trace_allocations = st.checkbox("Trace allocations",
+                                                help="Attribute memory to functions; slows the profiled run down")
+                if st.form_submit_button("Profile next load", use_container_width=True) and patient_id:
+                    profiling.request_profile(patient_id.strip(), cold=cold, trace_allocations=trace_allocations)
+                    st.success(f"The next dashboard load of patient {patient_id} will be profiled.")
+
+            last_profile = st.session_state.get("last_profile")
+            if last_profile:
+                st.markdown(f"**Last profile: patient {last_profile['patient_id']}**")
+                st.code(last_profile["report"], language=None)
+                with open(last_profile["paths"]["speedscope"], "rb") as speedscope_file:
+                    st.download_button("Download flame graph (speedscope)", speedscope_file.read(),
+                                       file_name=os.path.basename(last_profile["paths"]["speedscope"]),
+                                       mime="application/json", use_container_width=True)
+
     def main(self):
-        
+        DecisionSupportInterface.start_metrics()
+
         if 'authenticated' not in st.session_state:
             st.session_state.authenticated = False
         
@@ -0,0 +1,109 @@
+"""
+Time the dashboard chart renderers for synthetic histories of increasing length,
+both uncached and as a chart cache hit, and the whole dashboard rendered serially
+and on the chart process pool.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_charts --points 10 100 500 2000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from src import charts
+from src.fhir_client import Observation, ObservationHistory
+
+DEMOGRAPHICS = ("Jane", "Doe", "02-05-1960", 65, "female")
+
+
+def make_history(n_points, mean, spread, unit, name, measurement=None, seed=0):
+    """Build an observation history shaped like FHIRClient._get_observation_history output"""
+    rng = random.Random(seed)
+    start = datetime(2000, 1, 1)
+    history = ObservationHistory()
+    for i in range(n_points):
+        date = start + timedelta(days=7 * i)
+        value = rng.gauss(mean, spread)
+        history.append(Observation(date, value, unit, name, measurement or name, unit))
+    return history
+
+
+def make_patient(n_points):
+    weight = make_history(n_points, 70, 5, 'kg', 'weight', seed=1)
+    height = make_history(n_points, 168, 1, 'cm', 'height', seed=2)
+    return {
+        'weight_history': weight,
+        'height_history': height,
+        'bmi_history': make_history(n_points, 24, 3, 'kg/m2', 'bmi', seed=3),
+        'glucose_history': make_history(n_points, 120, 40, 'mg/dL', 'glucose', 'Glucose SerPl-mCnc', seed=4),
+        'systolic_bp_history': make_history(n_points, 125, 15, 'mm[Hg]', 'systolic blood pressure', seed=5),
+        'diastolic_bp_history': make_history(n_points, 80, 10, 'mm[Hg]', 'diastolic blood pressure', seed=6),
+        'hr_history': make_history(n_points, 72, 12, '{beats}/min', 'heart rate', seed=7)
+    }
+
+
+def chart_renders(patient):
+    """Return (renderer, arguments) for every dashboard chart"""
+    return {
+        'weight_height_bmi': (charts.render_weight_height_bmi, (
+            patient['weight_history'], patient['height_history'], patient['bmi_history'], DEMOGRAPHICS)),
+        'glucose': (charts.render_blood_glucose_level, (patient['glucose_history'],)),
+        'blood_pressure': (charts.render_blood_pressure, (
+            patient['systolic_bp_history'], patient['diastolic_bp_history'], DEMOGRAPHICS)),
+        'heart_rate': (charts.render_heart_rate, (patient['hr_history'], DEMOGRAPHICS))
+    }
+
+
+def time_call(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chart rendering time against series length.")
+    parser.add_argument("--points", type=int, nargs="+", default=[10, 100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest is reported")
+    parser.add_argument("--workers", type=int, default=charts.RENDER_WORKERS, help="Chart render processes")
+    args = parser.parse_args()
+
+    rendered = {}
+    cached = {}
+    dashboard = {}
+    for n_points in args.points:
+        chart_args = {name: render_args for name, (_, render_args) in chart_renders(make_patient(n_points)).items()}
+        for label, workers in (('serial', 0), (f'{args.workers} workers', args.workers)):
+            # Warm the pool up first so worker start-up is not counted
+            charts.chart_cache.clear()
+            charts.render_charts(chart_args, workers)
+
+            def render_dashboard():
+                charts.chart_cache.clear()
+                charts.render_charts(chart_args, workers)
+            dashboard.setdefault(label, []).append(time_call(render_dashboard, args.repeat))
+
+        for name, (render, render_args) in chart_renders(make_patient(n_points)).items():
+            rendered.setdefault(name, []).append(time_call(lambda: render(*render_args), args.repeat))
+            charts._cached_render(render, *render_args)
+            cached.setdefault(name, []).append(
+                time_call(lambda: charts._cached_render(render, *render_args), args.repeat))
+
+    header = f"{'chart':<20}" + "".join(f"{n:>12}" for n in args.points)
+    print("Render (uncached)\n" + header)
+    for name, timings in rendered.items():
+        print(f"{name:<20}" + "".join(f"{t * 1000:>10.0f}ms" for t in timings))
+    print("\nChart cache hit\n" + header)
+    for name, timings in cached.items():
+        print(f"{name:<20}" + "".join(f"{t * 1000:>10.3f}ms" for t in timings))
+    print("\nDashboard (all charts, uncached)\n" + header)
+    for label, timings in dashboard.items():
+        print(f"{label:<20}" + "".join(f"{t * 1000:>10.0f}ms" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
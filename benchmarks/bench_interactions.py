@@ -0,0 +1,93 @@
+"""
+Measure the server time of dashboard interactions.
+
+Drives app.py headlessly with Streamlit's AppTest: logs in, opens a patient and then
+changes one widget of each dashboard section. For every interaction it reports the
+time of a whole script run, which is what every interaction cost before the sections
+became fragments, and the time of the section the widget belongs to, which is what
+the fragment rerun costs now. Section times come from st.session_state.section_timings.
+
+Measured on the reference machine (one CPU) for patient 665677 in a database with 30
+visits per patient, fastest of 5 runs; the forecast interactions ran with the static
+chart engine selected:
+
+    interaction          section           full rerun (s)  section rerun (s)
+    Forecast days        forecasting                0.746              0.003
+    Forecast feature     forecasting                0.742              0.003
+    Run forecast         forecasting                0.632              0.011
+    Interactive charts   health_trends              0.150              0.068
+    Static charts        health_trends              0.581              0.507
+
+Run from the repository root:
+
+    python -m benchmarks.bench_interactions --patient 665677
+    python -m benchmarks.bench_interactions --database data/json_database.json
+"""
+import argparse
+import os
+import time
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+USERNAME = "benchmark"
+PASSWORD = "benchmark"
+
+
+def open_dashboard(patient_id, timeout):
+    os.environ["CARDICARE_USERNAME"] = USERNAME
+    os.environ["CARDICARE_PASSWORD"] = PASSWORD
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+    at.text_input[0].input(USERNAME)
+    at.text_input[1].input(PASSWORD)
+    at.button[0].click()
+    at.run()
+    at.text_input[0].input(patient_id)
+    next(button for button in at.button if button.label == "Search").click()
+    at.run()
+    return at
+
+
+def interactions(at, patient_id):
+    """Yield (description, section, action) for one widget of each section"""
+    yield ("Forecast days", "forecasting",
+           lambda: at.number_input(key=f"forecast_days_{patient_id}").increment())
+    yield ("Forecast feature", "forecasting",
+           lambda: at.selectbox(key=f"forecast_feat_{patient_id}").select_index(1))
+    yield ("Run forecast", "forecasting",
+           lambda: at.button(key=f"forecast_{patient_id}").click())
+    yield ("Interactive charts", "health_trends",
+           lambda: at.radio(key=f"chart_engine_{patient_id}").set_value("Interactive"))
+    yield ("Static charts", "health_trends",
+           lambda: at.radio(key=f"chart_engine_{patient_id}").set_value("Static"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-interaction server time of the dashboard.")
+    parser.add_argument("--patient", default="665677", help="Patient ID to open")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per interaction, the fastest is reported")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds allowed for one script run")
+    parser.add_argument("--database", default=None, help="JSON database to serve instead of the app's default")
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ["CARDICARE_DATABASE"] = args.database
+    at = open_dashboard(args.patient, args.timeout)
+    if at.exception:
+        raise SystemExit(f"Dashboard failed: {at.exception[0].value}")
+
+    print(f"{'interaction':<20} {'section':<16} {'full rerun (s)':>15} {'section rerun (s)':>18}")
+    for description, section, action in interactions(at, args.patient):
+        full_runs, section_runs = [], []
+        for _ in range(args.repeat):
+            action()
+            start = time.perf_counter()
+            at.run()
+            full_runs.append(time.perf_counter() - start)
+            section_runs.append(at.session_state["section_timings"][section])
+        print(f"{description:<20} {section:<16} {min(full_runs):>15.3f} {min(section_runs):>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure the cost of the observation records FHIRClient builds for every reading.
+
+Extracts every vital-sign history of a synthetic population with long histories and
+reports, per observation: the extraction time, the memory the records keep alive
+(traced with tracemalloc), the size PatientCache accounts for them and the size of
+their pickle, which is what the chart cache hashes and the chart pool receives.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_observations --patients 50 --visits 200
+"""
+import argparse
+import os
+import pickle
+import time
+import tracemalloc
+
+from benchmarks.synthetic_fhir import write_database
+from src.fhir_client import FHIRClient, fullUrl
+from src.patient_cache import estimate_size
+
+HISTORIES = ['get_weight_history', 'get_height_history', 'get_bmi_history', 'get_glucose_history',
+             'get_systolic_blood_pressure_history', 'get_diastolic_blood_pressure_history',
+             'get_heart_rate_history']
+
+
+def extract(client, patient_ids):
+    return [getattr(client, history)(patient_id) for patient_id in patient_ids for history in HISTORIES]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark observation record extraction and memory.")
+    parser.add_argument("--patients", type=int, default=50, help="Patients in the synthetic population")
+    parser.add_argument("--visits", type=int, default=200, help="Average visits per patient")
+    parser.add_argument("--repeat", type=int, default=5, help="Extraction runs, the fastest is reported")
+    parser.add_argument("--data-dir", default="data/synthetic", help="Where generated databases are kept")
+    args = parser.parse_args()
+
+    database = os.path.join(args.data_dir, f"patients_{args.patients}_visits_{args.visits}_seed_0.json")
+    if not os.path.exists(database):
+        os.makedirs(args.data_dir, exist_ok=True)
+        write_database(database, args.patients, 0, args.visits)
+    client = FHIRClient(server_url=fullUrl, json_path=database)
+    patient_ids = client.get_all_patient_ids()
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        extract(client, patient_ids)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    histories = extract(client, patient_ids)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n_observations = sum(len(history) for history in histories)
+    print(f"{len(patient_ids)} patients, {n_observations} observations")
+    print(f"extraction       {min(timings) / n_observations * 1e6:>8.2f} us per observation")
+    print(f"memory (traced)  {(after - before) / n_observations:>8.1f} bytes per observation")
+    print(f"estimate_size    {estimate_size(histories) / n_observations:>8.1f} bytes per observation")
+    print(f"pickle           {len(pickle.dumps(histories, protocol=pickle.HIGHEST_PROTOCOL)) / n_observations:>8.1f} "
+          f"bytes per observation")
+
+
+if __name__ == "__main__":
+    main()
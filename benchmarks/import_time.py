@@ -0,0 +1,98 @@
+"""
+Check the app's import time against a budget.
+
+Imports app.py in fresh interpreters with `python -X importtime`, reports the modules
+that take longest and fails (exit status 1) when the fastest import exceeds --budget
+seconds or when any part of a package that should load on first use
+(src.warmup.DEFERRED_PACKAGES) is imported at startup; the chain of imports that
+pulled it in is printed.
+
+Run from the repository root:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget 2.0 --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from src.warmup import DEFERRED_PACKAGES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds; importing app.py took about 1.3s on the reference machine, 4.2s before the deferred imports
+DEFAULT_BUDGET = 2.0
+TOP_N = 15
+
+
+def measure(module="app"):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+    --------
+    list
+        (name, self seconds, cumulative seconds, depth) of every imported module, in
+        the order -X importtime reports them: a module follows everything it imported.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT,
+                               capture_output=True, text=True)
+    if completed.returncode:
+        raise SystemExit(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return imports
+
+
+def import_chain(imports, index):
+    """Names from the top-level import down to the module at `index`"""
+    chain = [imports[index][0]]
+    depth = imports[index][3]
+    for name, _, _, parent_depth in imports[index + 1:]:
+        if parent_depth < depth:
+            chain.append(name)
+            depth = parent_depth
+    return list(reversed(chain))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the app's import time against a budget.")
+    parser.add_argument("--module", default="app", help="Module to import")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="Seconds allowed for the import")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh imports, the fastest is checked")
+    args = parser.parse_args()
+
+    def total(imports):
+        return next(cumulative for name, _, cumulative, depth in imports if name == args.module and depth == 0)
+
+    imports = min((measure(args.module) for _ in range(args.repeat)), key=total)
+    seconds = total(imports)
+
+    print(f"{'cumulative (s)':>15} {'self (s)':>9}  module")
+    for name, self_seconds, cumulative, _ in sorted(imports, key=lambda item: item[2], reverse=True)[:TOP_N]:
+        print(f"{cumulative:>15.3f} {self_seconds:>9.3f}  {name}")
+
+    failed = False
+    for package in DEFERRED_PACKAGES:
+        # The first module of the package imported is the one the rest of the app pulled in
+        index = next((i for i, (name, _, _, _) in enumerate(imports)
+                      if name == package or name.startswith(f"{package}.")), None)
+        if index is not None:
+            failed = True
+            print(f"\n{package} is imported at startup: {' -> '.join(import_chain(imports, index))}")
+
+    print(f"\nImporting {args.module} took {seconds:.3f}s (fastest of {args.repeat}), budget {args.budget:.3f}s")
+    if seconds > args.budget:
+        failed = True
+        print("Over budget")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
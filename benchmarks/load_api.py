@@ -0,0 +1,127 @@
+"""
+Load-test the JSON/HTTP API and report latency percentiles and throughput per endpoint.
+
+Either targets a running server (--url) or starts one in this process (the default).
+Requests are issued by --concurrency client threads over the patients of the local
+database, one endpoint at a time. Forecasts are requested only for the patients that
+also have a series in the forecasting dataset, and batch risk requests carry at most
+MAX_BATCH_SIZE patients. Every response other than 2xx counts as an error, so a run
+whose requests were rejected does not pass for a fast one.
+
+Run from the repository root:
+
+    python -m benchmarks.load_api --requests 500 --concurrency 16
+    python -m benchmarks.load_api --url http://127.0.0.1:8000 --endpoints summary risk
+"""
+import argparse
+import json
+from collections import Counter
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+
+from src.api_server import API_WORKERS, MAX_BATCH_SIZE, ApiServer, PatientApi
+from src.fhir_client import JSON_DATABASE, FHIRClient, fullUrl
+from src.forecast import FORECAST_FEATURES, get_forecast_patient_ids
+
+ENDPOINTS = ['summary', 'risk', 'forecast', 'batch_risk']
+
+
+def build_request(base_url, endpoint, patient_ids, i):
+    """Return the urllib Request of the i-th call to an endpoint"""
+    patient_id = quote(patient_ids[i % len(patient_ids)])
+    if endpoint == 'batch_risk':
+        body = json.dumps({'patient_ids': patient_ids[:MAX_BATCH_SIZE]}).encode('utf-8')
+        return urllib.request.Request(f"{base_url}/risk", data=body, headers={'Content-Type': 'application/json'})
+    if endpoint == 'forecast':
+        feature = quote(FORECAST_FEATURES[i % len(FORECAST_FEATURES)])
+        return urllib.request.Request(f"{base_url}/patients/{patient_id}/forecast?feature={feature}&days=5")
+    return urllib.request.Request(f"{base_url}/patients/{patient_id}/{endpoint}")
+
+
+def call(request, timeout):
+    """Send one request, returning (latency in seconds, HTTP status)"""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def load_endpoint(base_url, endpoint, patient_ids, n_requests, concurrency, timeout):
+    requests = [build_request(base_url, endpoint, patient_ids, i) for i in range(n_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda request: call(request, timeout), requests))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    failed = Counter('timeout' if status is None else status for _, status in results
+                     if status is None or not 200 <= status < 300)
+    return {
+        'requests': n_requests,
+        'errors': sum(failed.values()),
+        'error_statuses': dict(failed),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'requests_per_second': n_requests / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the patient API.")
+    parser.add_argument("--url", default=None, help="Base URL of a running server, one is started when omitted")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Client threads")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Server threads when starting a server")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds allowed per request")
+    parser.add_argument("--database", default=JSON_DATABASE, help="Path of the JSON patient database")
+    args = parser.parse_args()
+
+    client = FHIRClient(server_url=fullUrl, json_path=args.database)
+    patient_ids = client.get_all_patient_ids()
+    database_ids = set(patient_ids)
+    forecast_ids = [patient_id for patient_id in get_forecast_patient_ids() if patient_id in database_ids]
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = ApiServer(("127.0.0.1", 0), PatientApi(client), workers=args.workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        print(f"{len(patient_ids)} patients, {args.requests} requests per endpoint, concurrency {args.concurrency}")
+        print(f"{'endpoint':<12} {'p50 (ms)':>10} {'p99 (ms)':>10} {'req/s':>10} {'errors':>8}")
+        for endpoint in args.endpoints:
+            endpoint_ids = forecast_ids if endpoint == 'forecast' else patient_ids
+            if not endpoint_ids:
+                print(f"{endpoint:<12} skipped, no patient of the database has a series in the forecasting dataset")
+                continue
+            result = load_endpoint(base_url.rstrip('/'), endpoint, endpoint_ids, args.requests, args.concurrency,
+                                   args.timeout)
+            print(f"{endpoint:<12} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+                  f"{result['requests_per_second']:>10.1f} {result['errors']:>8}")
+            if result['errors']:
+                statuses = ', '.join(f"{status}: {count}" for status, count in result['error_statuses'].items())
+                print(f"{'':<12} failed requests by status: {statuses}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Load-test the dashboard with concurrent clinician sessions and report how latency scales.
+
+Every simulated clinician drives app.py headlessly with Streamlit's AppTest through a
+whole visit: open the app, log in, search a patient by ID (which opens the patient's
+dashboard), click Run Forecast and wait for the result, and log out. --users clinicians
+do this concurrently, each running --journeys visits in a row, at every concurrency level.
+
+All sessions run in this process, as they would in one Streamlit worker, and share its
+caches, job pools and memory. Streamlit's websocket transport and the browser are not
+part of the measurement. For every level the script reports per-step latency
+percentiles, visits completed per second and the resident memory of the process.
+
+The database is a synthetic population from benchmarks.synthetic_fhir, so no external
+service is needed. Synthetic patients have no series in the forecasting dataset, so
+their forecast step measures the job round trip, not an ARIMA fit; run with
+--database data/json_database.json to fit real forecasts.
+
+Run from the repository root:
+
+    python -m benchmarks.load_sessions --users 1 2 4 8 --journeys 2
+    python -m benchmarks.load_sessions --users 4 --database data/json_database.json
+"""
+import argparse
+import os
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.synthetic_fhir import DEFAULT_VISITS, write_database
+from src.fhir_client import FHIRClient, fullUrl
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+USERNAME = "benchmark"
+PASSWORD = "benchmark"
+STEPS = ["open", "login", "search_open", "forecast", "logout"]
+# Seconds between reruns while a forecast is running, as the app's polling fragment does
+FORECAST_POLL_INTERVAL = 0.5
+
+
+def rss_bytes():
+    """Current resident memory of this process, or the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _run(at, step, timings):
+    start = time.perf_counter()
+    at.run()
+    timings[step] = timings.get(step, 0.0) + time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{step} failed: {at.exception[0].value}")
+
+
+def journey(patient_id, timeout, forecast_timeout):
+    """
+    Run one clinician visit in a new session.
+
+    Returns:
+    --------
+    dict
+        Server seconds of every step; the forecast step includes the polling reruns.
+    """
+    timings = {}
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _run(at, "open", timings)
+
+    at.text_input[0].input(USERNAME)
+    at.text_input[1].input(PASSWORD)
+    at.button[0].click()
+    _run(at, "login", timings)
+
+    at.text_input[0].input(patient_id)
+    next(button for button in at.button if button.label == "Search").click()
+    _run(at, "search_open", timings)
+
+    at.button(key=f"forecast_{patient_id}").click()
+    _run(at, "forecast", timings)
+    deadline = time.perf_counter() + forecast_timeout
+    # AppTest does not drive run_every fragments, poll with reruns until the progress bar is gone
+    while at.get("progress") and time.perf_counter() < deadline:
+        time.sleep(FORECAST_POLL_INTERVAL)
+        _run(at, "forecast", timings)
+
+    next(button for button in at.sidebar.button if button.label == "Logout").click()
+    _run(at, "logout", timings)
+    return timings
+
+
+def run_level(users, journeys, patient_ids, timeout, forecast_timeout):
+    """Run `users` concurrent clinicians, `journeys` visits each, and summarise the step latencies"""
+    durations = {step: [] for step in STEPS}
+    errors = []
+    lock = threading.Lock()
+    peak_rss = [rss_bytes()]
+    stop = threading.Event()
+
+    def sample_memory():
+        while not stop.wait(0.1):
+            peak_rss[0] = max(peak_rss[0], rss_bytes())
+
+    def clinician(user):
+        for i in range(journeys):
+            patient_id = patient_ids[(user * journeys + i) % len(patient_ids)]
+            try:
+                timings = journey(patient_id, timeout, forecast_timeout)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{patient_id}: {e}")
+                continue
+            with lock:
+                for step, seconds in timings.items():
+                    durations[step].append(seconds)
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(clinician, range(users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    steps = {}
+    for step, values in durations.items():
+        if values:
+            latencies = np.array(values) * 1000
+            steps[step] = {'p50_ms': float(np.percentile(latencies, 50)),
+                           'p95_ms': float(np.percentile(latencies, 95)),
+                           'p99_ms': float(np.percentile(latencies, 99))}
+    completed = len(durations["logout"])
+    return {'steps': steps, 'completed': completed, 'errors': errors, 'journeys_per_second': completed / elapsed,
+            'rss_mb': rss_bytes() / 1e6, 'peak_rss_mb': peak_rss[0] / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with concurrent sessions.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrency levels")
+    parser.add_argument("--journeys", type=int, default=2, help="Visits run by every clinician at each level")
+    parser.add_argument("--patients", type=int, default=1000, help="Size of the synthetic population")
+    parser.add_argument("--visits", type=int, default=DEFAULT_VISITS, help="Average visits per synthetic patient")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default="data/synthetic", help="Where generated databases are kept")
+    parser.add_argument("--database", default=None, help="Use this JSON database instead of a synthetic one")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds allowed for one script run")
+    parser.add_argument("--forecast-timeout", type=float, default=120, help="Seconds allowed for one forecast")
+    args = parser.parse_args()
+
+    database = args.database
+    if database is None:
+        database = os.path.join(args.data_dir, f"patients_{args.patients}_visits_{args.visits}_seed_{args.seed}.json")
+        if not os.path.exists(database):
+            print(f"Generating {args.patients} patients into {database}...")
+            os.makedirs(args.data_dir, exist_ok=True)
+            write_database(database, args.patients, args.seed, args.visits)
+    os.environ["CARDICARE_DATABASE"] = database
+    os.environ["CARDICARE_USERNAME"] = USERNAME
+    os.environ["CARDICARE_PASSWORD"] = PASSWORD
+
+    patient_ids = FHIRClient(server_url=fullUrl, json_path=database).get_all_patient_ids()
+    # Distinct patients across the whole run where the population allows, so levels do not reuse warm entries
+    patient_ids = random.Random(args.seed).sample(patient_ids, len(patient_ids))
+
+    print(f"{database}: {len(patient_ids)} patients, {args.journeys} visit(s) per clinician, "
+          f"process RSS {rss_bytes() / 1e6:.0f} MB")
+    offset = 0
+    for users in args.users:
+        level_ids = patient_ids[offset:] + patient_ids[:offset]
+        offset = (offset + users * args.journeys) % len(patient_ids)
+        result = run_level(users, args.journeys, level_ids, args.timeout, args.forecast_timeout)
+
+        print(f"\n{users} concurrent clinician(s): {result['completed']} visits, "
+              f"{result['journeys_per_second']:.2f} visits/s, RSS {result['rss_mb']:.0f} MB "
+              f"(peak {result['peak_rss_mb']:.0f} MB), {len(result['errors'])} error(s)")
+        print(f"  {'step':<12} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+        for step, latency in result['steps'].items():
+            print(f"  {step:<12} {latency['p50_ms']:>10.1f} {latency['p95_ms']:>10.1f} {latency['p99_ms']:>10.1f}")
+        for error in result['errors'][:5]:
+            print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Soak test for the chart renderers: render thousands of dashboards and check that the
+process RSS stays flat. Exits with status 1 if memory grows beyond the tolerance or a
+figure is left registered with pyplot.
+
+Run from the repository root:
+
+    python -m benchmarks.soak_charts --dashboards 2000
+"""
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import os
+import resource
+import sys
+import time
+
+from matplotlib import _pylab_helpers
+
+from benchmarks.bench_charts import chart_renders, make_patient
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # No procfs (e.g. macOS): fall back to the peak RSS, which still catches steady growth
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def release_free_memory():
+    """
+    Collect garbage and hand freed heap pages back to the OS.
+
+    glibc keeps freed memory (such as the Agg render buffers) in its arenas, so without
+    a trim RSS reflects the allocator's high-water mark rather than live memory and
+    steps up at random points of the run.
+    """
+    gc.collect()
+    libc_name = ctypes.util.find_library('c')
+    if libc_name:
+        libc = ctypes.CDLL(libc_name)
+        if hasattr(libc, 'malloc_trim'):
+            libc.malloc_trim(0)
+
+
+def render_dashboard(patient):
+    for render, render_args in chart_renders(patient).values():
+        render(*render_args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that rendering dashboards does not grow memory.")
+    parser.add_argument("--dashboards", type=int, default=2000, help="Dashboards to render after warm-up")
+    parser.add_argument("--warmup", type=int, default=50, help="Dashboards rendered before the baseline")
+    parser.add_argument("--points", type=int, default=30, help="Observations per series")
+    parser.add_argument("--tolerance-mb", type=float, default=20.0, help="Allowed RSS growth over the baseline")
+    parser.add_argument("--sample-every", type=int, default=200, help="Dashboards between RSS samples")
+    args = parser.parse_args()
+
+    # A few distinct patients so renders are not all identical
+    patients = [make_patient(args.points + i) for i in range(5)]
+
+    for i in range(args.warmup):
+        render_dashboard(patients[i % len(patients)])
+    release_free_memory()
+    baseline = current_rss_mb()
+    print(f"baseline RSS after {args.warmup} dashboards: {baseline:.1f} MB")
+
+    start = time.perf_counter()
+    peak_growth = 0.0
+    for i in range(1, args.dashboards + 1):
+        render_dashboard(patients[i % len(patients)])
+        if i % args.sample_every == 0 or i == args.dashboards:
+            release_free_memory()
+            rss = current_rss_mb()
+            peak_growth = max(peak_growth, rss - baseline)
+            print(f"{i:>7} dashboards  RSS {rss:8.1f} MB  ({rss - baseline:+.1f} MB)")
+    elapsed = time.perf_counter() - start
+
+    open_figures = _pylab_helpers.Gcf.get_num_fig_managers()
+    print(f"{args.dashboards} dashboards in {elapsed:.1f}s, peak growth {peak_growth:+.1f} MB, "
+          f"{open_figures} pyplot figures open")
+
+    if open_figures or peak_growth > args.tolerance_mb:
+        print("FAIL: chart rendering leaks memory")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
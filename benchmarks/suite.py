@@ -0,0 +1,218 @@
+"""
+End-to-end performance benchmarks on a synthetic population, with JSON baselines.
+
+Times every stage a dashboard request goes through: loading the database, opening a
+patient, searching, rendering each chart, batch ASCVD risk scoring and forecasting.
+Results are written as JSON; compared with a baseline, every stage slower than the
+baseline by more than --threshold is flagged and the run exits with status 1.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --patients 1000 10000 --output benchmarks/results.json
+    python -m benchmarks.suite --patients 1000 --baseline benchmarks/baselines/1k.json
+    python -m benchmarks.suite --patients 1000 --save-baseline benchmarks/baselines/1k.json
+
+Databases are generated with benchmarks.synthetic_fhir into --data-dir and reused
+while their parameters are unchanged.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.synthetic_fhir import DEFAULT_VISITS, write_database
+from src import charts
+from src.api_server import PatientApi
+from src.fhir_client import FHIRClient, fullUrl
+from src.arima_order import get_order
+from src.forecast import (DEFAULT_ORDER, FORECAST_FEATURES, MIN_ARIMA_POINTS, arima_forecast, forecast_with_budget,
+                          get_forecast_patient_ids, get_series)
+from src.patient_cache import PatientCache
+
+DEFAULT_THRESHOLD = 0.2
+# Patients sampled for the per-patient stages
+SAMPLE_SIZE = 20
+BATCH_RISK_SIZE = 200
+
+
+def timed_runs(call, repeat):
+    """Run `call` `repeat` times and return the durations in seconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _result(durations, **extra):
+    return dict(extra, median=statistics.median(durations), min=min(durations), runs=len(durations))
+
+
+def search(client, query, index=None):
+    """Search the way the dashboard does: build the demographics index, then match names and IDs"""
+    if index is None:
+        index = {patient_id: client.get_demographics(patient_id) for patient_id in client.get_all_patient_ids()}
+    query = query.lower()
+    return [patient_id for patient_id, demographics in index.items()
+            if demographics and (query in f"{demographics[0]} {demographics[1]}".lower() or query in patient_id)]
+
+
+def run_population(database, repeat, rng):
+    """Benchmark every stage on one database, returning stage name -> result"""
+    results = {}
+
+    load_durations = []
+    client = None
+    for _ in range(repeat):
+        # Drop the previous client first, so large databases are never held twice
+        client = None
+        start = time.perf_counter()
+        client = FHIRClient(server_url=fullUrl, json_path=database)
+        load_durations.append(time.perf_counter() - start)
+    results['database_load'] = _result(load_durations)
+    patient_ids = client.get_all_patient_ids()
+    sample = rng.sample(patient_ids, min(SAMPLE_SIZE, len(patient_ids)))
+
+    # One run opens every sampled patient; the median is per patient
+    per_patient = [duration / len(sample) for duration in timed_runs(
+        lambda: [client.get_patient_summary(patient_id) for patient_id in sample], repeat)]
+    results['patient_open'] = _result(per_patient, patients=len(sample))
+
+    index = {}
+    results['search_index_build'] = _result(timed_runs(
+        lambda: index.update((patient_id, client.get_demographics(patient_id)) for patient_id in patient_ids),
+        max(1, repeat // 3)))
+    results['search_query'] = _result(timed_runs(lambda: search(client, "morgan", index), repeat))
+
+    summary = client.get_patient_summary(sample[0])
+    for name, args in charts.dashboard_chart_args(summary).items():
+        render = charts.DASHBOARD_CHARTS[name][0]
+        results[f'chart_{name}'] = _result(timed_runs(lambda: render(*args), repeat))
+
+    batch = patient_ids[:BATCH_RISK_SIZE]
+    # A fresh cache per run, so every run extracts the summaries it scores
+    results['batch_risk'] = _result(timed_runs(
+        lambda: PatientApi(client, PatientCache()).batch_risk(batch), repeat), patients=len(batch))
+    return results
+
+
+def run_forecasting(repeat):
+    """
+    Forecasting reads the bundled out.csv series, not the FHIR database, so it is timed once.
+
+    ARIMA is timed as two stages: the order search of every series, with an empty
+    order cache each run, and the fit with the order then read from the cache. The
+    order cache is a temporary file, so neither stage depends on data/arima_orders.json.
+    """
+    patient_id = get_forecast_patient_ids()[0]
+    results = {'forecast_fast': _result(timed_runs(
+        lambda: [forecast_with_budget(feature, 5, patient_id, mode="fast") for feature in FORECAST_FEATURES],
+        repeat), features=len(FORECAST_FEATURES))}
+
+    # The series the 'arima' mode fits, shorter ones are always forecast with smoothing
+    series = {feature: get_series(feature, patient_id) for feature in FORECAST_FEATURES}
+    series = {feature: values for feature, values in series.items()
+              if not isinstance(values, str) and len(values) >= MIN_ARIMA_POINTS}
+    with tempfile.TemporaryDirectory() as order_dir:
+        order_caches = [os.path.join(order_dir, f"arima_orders_{run}.json") for run in range(repeat)]
+        runs = iter(order_caches)
+
+        def search():
+            order_cache = next(runs)
+            for feature, values in series.items():
+                get_order(patient_id, feature, values, default=DEFAULT_ORDER, path=order_cache)
+
+        def fit_cached():
+            for feature, values in series.items():
+                arima_forecast(values, 5, get_order(patient_id, feature, values, default=DEFAULT_ORDER,
+                                                    path=order_caches[-1]))
+
+        results['forecast_arima_order_search'] = _result(timed_runs(search, repeat), features=len(series))
+        results['forecast_arima_cached_order'] = _result(timed_runs(fit_cached, repeat), features=len(series))
+    return results
+
+
+def flatten(report):
+    """Map 'population/stage' to the stage's median for every stage of a report"""
+    return {f"{population}/{stage}": result['median']
+            for population, stages in report['results'].items() for stage, result in stages.items()}
+
+
+def compare(report, baseline, threshold):
+    """Return (key, baseline seconds, current seconds, ratio) of every stage slower than the baseline by > threshold"""
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    for key, seconds in sorted(current.items()):
+        if key in previous and previous[key] > 0 and seconds > previous[key] * (1 + threshold):
+            regressions.append((key, previous[key], seconds, seconds / previous[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the end-to-end performance benchmarks.")
+    parser.add_argument("--patients", type=int, nargs="+", default=[1000], help="Population sizes to benchmark")
+    parser.add_argument("--visits", type=int, default=DEFAULT_VISITS, help="Average visits per synthetic patient")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage, the median is reported")
+    parser.add_argument("--data-dir", default="data/synthetic", help="Where generated databases are kept")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare with the results in this JSON file")
+    parser.add_argument("--save-baseline", default=None, help="Also write the results to this baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown flagged as a regression, as a fraction of the baseline")
+    parser.add_argument("--skip-forecast", action="store_true", help="Do not benchmark forecasting")
+    args = parser.parse_args()
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'parameters': {'visits': args.visits, 'seed': args.seed, 'repeat': args.repeat},
+        'results': {}
+    }
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    for n_patients in args.patients:
+        database = os.path.join(args.data_dir, f"patients_{n_patients}_visits_{args.visits}_seed_{args.seed}.json")
+        if not os.path.exists(database):
+            print(f"Generating {n_patients} patients into {database}...")
+            write_database(database, n_patients, args.seed, args.visits)
+        print(f"Benchmarking {n_patients} patients...")
+        report['results'][f"{n_patients}_patients"] = run_population(database, args.repeat,
+                                                                     random.Random(args.seed))
+    if not args.skip_forecast:
+        print("Benchmarking forecasting...")
+        report['results']['forecasting'] = run_forecasting(args.repeat)
+
+    print(f"\n{'stage':<45} {'median (ms)':>12} {'min (ms)':>10}")
+    for population, stages in report['results'].items():
+        for stage, result in stages.items():
+            print(f"{population + '/' + stage:<45} {result['median'] * 1000:>12.2f} {result['min'] * 1000:>10.2f}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w') as report_file:
+                json.dump(report, report_file, indent=1)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%} of {args.baseline}:")
+            for key, previous, seconds, ratio in regressions:
+                print(f"  {key}: {previous * 1000:.2f} ms -> {seconds * 1000:.2f} ms ({ratio:.2f}x)")
+            sys.exit(1)
+        print(f"\nNo regression beyond {args.threshold:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
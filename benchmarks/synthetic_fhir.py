@@ -0,0 +1,179 @@
+"""
+Generate a synthetic patient database in the JSON layout FHIRClient reads.
+
+Every patient is a bundle: the Patient resource first, then Observations for each
+vital sign taken at clinic visits, cholesterol panels, a smoking status and, for
+some patients, diabetes or hypertension Conditions. Patient i is generated from its
+own seeded random stream, so a database is reproducible and any patient can be
+regenerated on its own. Patients are written one at a time, so databases far larger
+than memory (up to millions of patients) can be produced; FHIRClient itself still
+loads the whole file.
+
+Run from the repository root:
+
+    python -m benchmarks.synthetic_fhir --patients 1000 --output data/synthetic_1k.json
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import date, timedelta
+
+from src.fhir_client import fullUrl
+
+# Average clinic visits per patient; every visit records the vital signs
+DEFAULT_VISITS = 20
+# Share of visits that also measure glucose, and that include a cholesterol panel
+GLUCOSE_RATE = 0.5
+LIPID_PANEL_RATE = 0.25
+FIRST_VISIT = date(2005, 1, 1)
+LAST_VISIT = date(2024, 12, 31)
+
+GIVEN_NAMES = {
+    'female': ["Ruth", "Sophia", "Amy", "Sarah", "Maria", "Linda", "Grace", "Helen", "Chloe", "Nora"],
+    'male': ["James", "Robert", "David", "Daniel", "Omar", "Lucas", "Henry", "Samuel", "Victor", "Leo"]
+}
+FAMILY_NAMES = ["Black", "Reynolds", "Morgan", "Graham", "Himston", "Nguyen", "Garcia", "Okafor", "Kowalski",
+                "Patel", "Schmidt", "Rossi", "Tanaka", "Silva", "Murphy", "Cohen", "Ivanov", "Larsen"]
+
+VITALS = [
+    # (LOINC code, display, unit)
+    ('3141-9', "Body Weight", 'kg'),
+    ('8302-2', "Body Height", 'cm'),
+    ('39156-5', "Body Mass Index", 'kg/m2'),
+    ('8480-6', "Systolic blood pressure", 'mm[Hg]'),
+    ('8462-4', "Diastolic blood pressure", 'mm[Hg]'),
+    ('8867-4', "Heart rate", '{beats}/min')
+]
+
+
+def patient_id(index):
+    return str(1000000 + index)
+
+
+def _observation(observation_id, code, display, value, unit, when):
+    return {
+        'fullUrl': f"{fullUrl}/Observation/{observation_id}",
+        'resource': {
+            'resourceType': 'Observation',
+            'code': {'coding': [{'system': 'http://loinc.org', 'code': code, 'display': display}]},
+            'valueQuantity': {'value': round(value, 2), 'unit': unit},
+            'effectiveDateTime': when.isoformat()
+        }
+    }
+
+
+def _condition(text):
+    return {'fullUrl': f"{fullUrl}/Condition/x", 'resource': {'resourceType': 'Condition', 'code': {'text': text}}}
+
+
+def generate_patient(index, seed=0, visits=DEFAULT_VISITS):
+    """
+    Return the bundle of one synthetic patient.
+
+    Parameters:
+    -----------
+    index : int
+        Position of the patient in the population; with `seed` it determines the patient.
+    visits : int
+        Average number of visits; the actual number is Poisson distributed around it.
+    """
+    rng = random.Random(seed * 1000003 + index)
+    pid = patient_id(index)
+    gender = rng.choice(['female', 'male'])
+    birth = date(rng.randint(1935, 1990), rng.randint(1, 12), rng.randint(1, 28))
+    bundle = [{
+        'fullUrl': f"{fullUrl}/Patient/{pid}",
+        'resource': {
+            'resourceType': 'Patient',
+            'id': pid,
+            'name': [{'given': [rng.choice(GIVEN_NAMES[gender])], 'family': [rng.choice(FAMILY_NAMES)]}],
+            'birthDate': birth.isoformat(),
+            'gender': gender
+        }
+    }]
+
+    height = rng.gauss(176 if gender == 'male' else 163, 7)
+    weight = rng.gauss(84 if gender == 'male' else 70, 12)
+    systolic, diastolic, heart_rate = rng.gauss(124, 12), rng.gauss(79, 7), rng.gauss(72, 8)
+    glucose = math.exp(rng.gauss(math.log(100), 0.2))
+    total_chol, hdl = rng.gauss(200, 30), rng.gauss(55 if gender == 'female' else 47, 10)
+    diabetic = glucose > 125 or rng.random() < 0.05
+    hypertensive = systolic > 135 or rng.random() < 0.1
+
+    # Poisson number of visits (Knuth), spread over the observation period in date order
+    n_visits, threshold, product = 0, math.exp(-visits), rng.random()
+    while product > threshold:
+        n_visits += 1
+        product *= rng.random()
+    span = (LAST_VISIT - FIRST_VISIT).days
+    visit_days = sorted(rng.sample(range(span), min(max(n_visits, 1), span)))
+
+    n = 0
+    for day in visit_days:
+        when = FIRST_VISIT + timedelta(days=day)
+        # Slow random walks around the patient's own baseline
+        weight += rng.gauss(0, 0.8)
+        systolic += rng.gauss(0, 3) + (124 - systolic) * 0.05
+        diastolic += rng.gauss(0, 2) + (79 - diastolic) * 0.05
+        heart_rate += rng.gauss(0, 2) + (72 - heart_rate) * 0.1
+        values = [weight, height, weight / (height / 100) ** 2, systolic + rng.gauss(0, 5),
+                  diastolic + rng.gauss(0, 3), heart_rate + rng.gauss(0, 4)]
+        for (code, display, unit), value in zip(VITALS, values):
+            n += 1
+            bundle.append(_observation(f"{pid}-{n}", code, display, value, unit, when))
+        if rng.random() < GLUCOSE_RATE:
+            n += 1
+            bundle.append(_observation(f"{pid}-{n}", '2345-7', "Glucose SerPl-mCnc",
+                                       glucose * math.exp(rng.gauss(0, 0.1)), 'mg/dL', when))
+        if rng.random() < LIPID_PANEL_RATE:
+            bundle.append(_observation(f"{pid}-{n + 1}", '2093-3', "Cholest SerPl-mCnc",
+                                       total_chol + rng.gauss(0, 10), 'mg/dL', when))
+            bundle.append(_observation(f"{pid}-{n + 2}", '2085-9', "HDLc SerPl-mCnc",
+                                       hdl + rng.gauss(0, 4), 'mg/dL', when))
+            n += 2
+
+    smoking = rng.choices(["Never smoker", "Former smoker", "Current every day smoker"], [0.6, 0.25, 0.15])[0]
+    bundle.append({
+        'fullUrl': f"{fullUrl}/Observation/{pid}-smoking",
+        'resource': {
+            'resourceType': 'Observation',
+            'code': {'coding': [{'system': 'http://loinc.org', 'code': '72166-2', 'display': "Tobacco smoking status"}]},
+            'valueCodeableConcept': {'text': smoking},
+            'effectiveDateTime': (FIRST_VISIT + timedelta(days=visit_days[-1])).isoformat()
+        }
+    })
+    if diabetic:
+        bundle.append(_condition("Diabetes mellitus type 2"))
+    if hypertensive:
+        bundle.append(_condition("Essential hypertension"))
+    return bundle
+
+
+def write_database(path, n_patients, seed=0, visits=DEFAULT_VISITS):
+    """Write a database of `n_patients` synthetic patients to `path`, one bundle at a time"""
+    with open(path, 'w') as database_file:
+        database_file.write("[")
+        for index in range(n_patients):
+            if index:
+                database_file.write(",\n")
+            json.dump(generate_patient(index, seed, visits), database_file, separators=(',', ':'))
+        database_file.write("]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic FHIR patient database.")
+    parser.add_argument("--patients", type=int, default=1000, help="Number of patients")
+    parser.add_argument("--visits", type=int, default=DEFAULT_VISITS, help="Average visits per patient")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the population")
+    parser.add_argument("--output", required=True, help="Path of the JSON database to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_database(args.output, args.patients, args.seed, args.visits)
+    print(f"Wrote {args.patients} patients to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
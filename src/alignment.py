@@ -0,0 +1,109 @@
+import numpy as np
+
+
+def history_arrays(history):
+    """
+    Convert an observation history into parallel NumPy arrays.
+
+    Parameters:
+    -----------
+    history : list
+        Observations as returned by the FHIRClient *_history methods.
+
+    Returns:
+    --------
+    tuple
+        (dates, values): dates as datetime64[D] and the observed values as floats,
+        in the order of the history.
+    """
+    dates = np.array([entry['date'] for entry in history], dtype='datetime64[D]')
+    values = np.array([entry['value'] for entry in history], dtype=float)
+    return dates, values
+
+
+def match_dates(dates, other_dates, tolerance=0):
+    """
+    Find, for every date, the matching observation of another series with a sorted merge.
+
+    Parameters:
+    -----------
+    dates : numpy.ndarray
+        datetime64[D] dates to look up, in any order.
+    other_dates : numpy.ndarray
+        datetime64[D] dates of the series being matched against.
+    tolerance : int
+        Largest distance in days for a match. 0 joins on exact dates; otherwise the
+        nearest observation within the window is used, the earlier one on a tie.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Index into other_dates for every date, or -1 when nothing matches. A date that
+        occurs several times in other_dates matches its last occurrence.
+    """
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    other_days = np.asarray(other_dates, dtype='datetime64[D]').astype(np.int64)
+    if len(days) == 0 or len(other_days) == 0:
+        return np.full(len(days), -1)
+
+    order = np.argsort(other_days, kind='stable')
+    sorted_days = other_days[order]
+
+    # Last observation on or before each date, and the first one after it
+    before = np.searchsorted(sorted_days, days, side='right') - 1
+    after = before + 1
+    before_gap = np.where(before >= 0, days - sorted_days[np.maximum(before, 0)], tolerance + 1)
+    after_gap = np.where(after < len(sorted_days), sorted_days[np.minimum(after, len(sorted_days) - 1)] - days,
+                         tolerance + 1)
+
+    before_ok = before_gap <= tolerance
+    use_after = (after_gap <= tolerance) & (~before_ok | (after_gap < before_gap))
+    positions = np.where(use_after, after, np.where(before_ok, before, -1))
+    return np.where(positions >= 0, order[np.maximum(positions, 0)], -1)
+
+
+def align(*histories, how='inner', tolerance=0):
+    """
+    Join observation histories on their dates.
+
+    Parameters:
+    -----------
+    histories : list
+        Two or more observation histories. The first one is the base of the join.
+    how : str
+        'inner' keeps the distinct dates, sorted, that every history has an observation for.
+        'left' keeps every observation of the first history, with NaN where another
+        history has no matching observation.
+    tolerance : int
+        Largest distance in days between joined observations, see match_dates.
+
+    Returns:
+    --------
+    tuple
+        (dates, values_0, values_1, ...): the joined dates followed by one float array
+        per history, all of the same length.
+    """
+    if how not in ('inner', 'left'):
+        raise ValueError(f"Unknown join type: {how}")
+
+    base_dates, base_values = history_arrays(histories[0])
+    if how == 'inner':
+        # Distinct dates, the last observation of a repeated date wins
+        base_dates, last = np.unique(base_dates[::-1], return_index=True)
+        base_values = base_values[::-1][last]
+
+    columns = [base_values]
+    matched = np.ones(len(base_dates), dtype=bool)
+    for history in histories[1:]:
+        other_dates, other_values = history_arrays(history)
+        positions = match_dates(base_dates, other_dates, tolerance)
+        found = positions >= 0
+        column = np.full(len(base_dates), np.nan)
+        column[found] = other_values[positions[found]]
+        columns.append(column)
+        matched &= found
+
+    if how == 'inner':
+        base_dates = base_dates[matched]
+        columns = [column[matched] for column in columns]
+    return (base_dates, *columns)
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from src import metrics
+from src.ascvd_risk_calculator import assess_summary_risk
+from src.fhir_client import JSON_DATABASE, FHIRClient, fullUrl
+from src.forecast import DEFAULT_LATENCY_BUDGET, FORECAST_FEATURES, FORECAST_MODES, forecast_with_budget
+from src.forecast_store import get_stored_forecast
+from src.patient_cache import PatientCache
+
+DEFAULT_PORT = int(os.getenv("API_PORT", 8000))
+# Threads serving requests; connections beyond this wait in the listen queue
+API_WORKERS = int(os.getenv("API_WORKERS", 8))
+# Most patients accepted by one batch risk request
+MAX_BATCH_SIZE = 500
+# Forecast horizons accepted, the same as the dashboard's
+MAX_FORECAST_DAYS = 30
+# Most seconds a forecast request may wait for ARIMA in auto mode, it holds a request worker meanwhile
+MAX_LATENCY_BUDGET = 10.0
+
+VITALS = {
+    'weight': 'weight_history',
+    'height': 'height_history',
+    'bmi': 'bmi_history',
+    'glucose': 'glucose_history',
+    'systolic_bp': 'systolic_bp_history',
+    'diastolic_bp': 'diastolic_bp_history',
+    'heart_rate': 'hr_history'
+}
+
+
+class ApiError(Exception):
+    """Error answered with the given HTTP status and a JSON {"error": message} body"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _reading(observation):
+    return {'date': observation['date'], 'value': observation['value'], 'unit': observation['unit']}
+
+
+class PatientApi(object):
+    """
+    The API's operations on top of the FHIR client, independent of HTTP.
+
+    Patient summaries come from a PatientCache, so repeated requests for the same
+    patient skip the extraction. Risk uses the same calculation as the batch reports
+    and forecasts prefer the batch-precomputed ARIMA forecast, like the dashboard.
+    """
+
+    def __init__(self, client, patient_cache=None):
+        self.client = client
+        self.patient_cache = patient_cache if patient_cache is not None else PatientCache()
+        metrics.register_collector(metrics.cache_stats_collector('patient', self.patient_cache.stats),
+                                   name='patient_cache')
+        self._patient_ids = set(client.get_all_patient_ids())
+
+    def _summary(self, patient_id):
+        if patient_id not in self._patient_ids:
+            raise ApiError(404, f"Unknown patient {patient_id}")
+        return self.patient_cache.get(self.client, patient_id)
+
+    def summary(self, patient_id):
+        summary = self._summary(patient_id)
+        given, surname, birthdate, age, gender = summary['demographics']
+        return {
+            'patient_id': patient_id,
+            'given_name': given,
+            'family_name': surname,
+            'birth_date': birthdate,
+            'age': age,
+            'gender': gender,
+            'vitals': {name: {'count': len(summary[key]), 'latest': _reading(summary[key][-1]) if summary[key] else None}
+                       for name, key in VITALS.items()},
+            'total_cholesterol': summary['total_chol'],
+            'hdl_cholesterol': summary['hdl_chol'],
+            'systolic_bp': summary['systolic_bp'],
+            'is_treated_bp': summary['is_treated_bp'],
+            'is_smoker': summary['is_smoker'],
+            'has_diabetes': summary['has_diabetes']
+        }
+
+    def risk(self, patient_id):
+        return dict(assess_summary_risk(self._summary(patient_id)), patient_id=patient_id)
+
+    def batch_risk(self, patient_ids):
+        if not isinstance(patient_ids, list) or not all(isinstance(patient_id, str) for patient_id in patient_ids):
+            raise ApiError(400, "patient_ids must be a list of patient ID strings")
+        if len(patient_ids) > MAX_BATCH_SIZE:
+            raise ApiError(413, f"At most {MAX_BATCH_SIZE} patients per request")
+        results = []
+        for patient_id in patient_ids:
+            try:
+                results.append(self.risk(patient_id))
+            except ApiError as e:
+                results.append({'patient_id': patient_id, 'status': 'error', 'message': e.message})
+        return {'results': results}
+
+    def forecast(self, patient_id, feature, days, mode="auto", latency_budget=DEFAULT_LATENCY_BUDGET):
+        if patient_id not in self._patient_ids:
+            raise ApiError(404, f"Unknown patient {patient_id}")
+        if feature not in FORECAST_FEATURES:
+            raise ApiError(400, f"feature must be one of: {', '.join(FORECAST_FEATURES)}")
+        if not 1 <= days <= MAX_FORECAST_DAYS:
+            raise ApiError(400, f"days must be between 1 and {MAX_FORECAST_DAYS}")
+        if mode not in FORECAST_MODES.values():
+            raise ApiError(400, f"mode must be one of: {', '.join(FORECAST_MODES.values())}")
+        if not 0 < latency_budget <= MAX_LATENCY_BUDGET:
+            raise ApiError(400, f"latency_budget must be above 0 and at most {MAX_LATENCY_BUDGET:g} seconds")
+
+        stored = get_stored_forecast(patient_id, feature, days) if mode != "fast" else None
+        if stored is not None:
+            values, method = stored, "arima"
+        else:
+            outcome = forecast_with_budget(feature, days, patient_id, mode=mode, latency_budget=latency_budget)
+            if isinstance(outcome, str):
+                raise ApiError(422, outcome)
+            values, method = outcome
+        return {'patient_id': patient_id, 'feature': feature, 'days': days, 'method': method,
+                'values': [float(value) for value in values]}
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes requests to the server's PatientApi and answers in JSON:
+
+        GET  /patients/{id}/summary                    demographics, latest vitals and risk factors
+        GET  /patients/{id}/risk                       ASCVD 10-year risk
+        GET  /patients/{id}/forecast?feature=&days=    forecast of one feature, optionally &mode=
+        POST /risk  {"patient_ids": [...]}             ASCVD risk of several patients
+        GET  /metrics                                  Prometheus text format, see src.metrics
+
+    Run from the repository root with python -m src.api_server --port 8000.
+    """
+
+    ROUTES = [
+        ('GET', re.compile(r'^/patients/(?P<patient_id>[^/]+)/summary$'), 'summary'),
+        ('GET', re.compile(r'^/patients/(?P<patient_id>[^/]+)/risk$'), 'risk'),
+        ('GET', re.compile(r'^/patients/(?P<patient_id>[^/]+)/forecast$'), 'forecast'),
+        ('POST', re.compile(r'^/risk$'), 'batch_risk')
+    ]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        if method == 'GET' and url.path == '/metrics':
+            self._send_text(200, metrics.render_prometheus())
+            return
+        try:
+            for route_method, pattern, operation in self.ROUTES:
+                match = pattern.match(url.path)
+                if match is None:
+                    continue
+                if route_method != method:
+                    raise ApiError(405, f"{method} is not allowed on {url.path}")
+                body = getattr(self, f"_{operation}")(parse_qs(url.query), **match.groupdict())
+                self._send(200, body)
+                return
+            raise ApiError(404, f"No endpoint {url.path}")
+        except ApiError as e:
+            self._send(e.status, {'error': e.message})
+        except Exception as e:
+            self.log_error("%s failed: %r", self.path, e)
+            self._send(500, {'error': "Internal server error"})
+
+    @metrics.timed("api.summary")
+    def _summary(self, query, patient_id):
+        return self.server.api.summary(patient_id)
+
+    @metrics.timed("api.risk")
+    def _risk(self, query, patient_id):
+        return self.server.api.risk(patient_id)
+
+    @metrics.timed("api.forecast")
+    def _forecast(self, query, patient_id):
+        feature = query.get('feature', [None])[0]
+        try:
+            days = int(query.get('days', ['5'])[0])
+            latency_budget = float(query.get('latency_budget', [DEFAULT_LATENCY_BUDGET])[0])
+        except ValueError:
+            raise ApiError(400, "days and latency_budget must be numbers")
+        mode = query.get('mode', ['auto'])[0]
+        return self.server.api.forecast(patient_id, feature, days, mode, latency_budget)
+
+    @metrics.timed("api.batch_risk")
+    def _batch_risk(self, query):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return self.server.api.batch_risk(payload.get('patient_ids'))
+
+    def _send(self, status, body):
+        self._send_bytes(status, json.dumps(body, default=_json_default).encode('utf-8'), 'application/json')
+
+    def _send_text(self, status, text):
+        self._send_bytes(status, text.encode('utf-8'), 'text/plain; version=0.0.4')
+
+    def _send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ApiServer(HTTPServer):
+    """
+    HTTP server handing every connection to a bounded thread pool.
+
+    The accept loop waits for a free worker before it hands over a connection, so at
+    most `workers` connections are open and busy at a time and the rest wait, unaccepted,
+    in the listen queue instead of piling up in the pool's queue.
+    """
+
+    # Connections waiting for a worker; the socketserver default of 5 drops bursts
+    request_queue_size = 128
+
+    def __init__(self, address, api, workers=API_WORKERS, verbose=False):
+        super().__init__(address, ApiRequestHandler)
+        self.api = api
+        self.verbose = verbose
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self._idle_workers = threading.BoundedSemaphore(workers)
+
+    def process_request(self, request, client_address):
+        self._idle_workers.acquire()
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except BaseException:
+            self._idle_workers.release()
+            raise
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._idle_workers.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve patient summaries, ASCVD risk and forecasts as JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Request handler threads")
+    parser.add_argument("--database", default=JSON_DATABASE, help="Path of the JSON patient database")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    parser.add_argument("--metrics", action="store_true", help="Record stage latencies and cache counters for /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.set_enabled(True)
+
+    api = PatientApi(FHIRClient(server_url=fullUrl, json_path=args.database))
+    server = ApiServer((args.host, args.port), api, workers=args.workers, verbose=args.verbose)
+    print(f"Serving on http://{args.host}:{server.server_port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are only serialized within the process
+    fcntl = None
+
+import numpy as np
+
+from src import metrics
+
+ORDER_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'arima_orders.json'))
+
+# Bounds of the (p, d, q) search grid
+MAX_P = 3
+MAX_D = 1
+MAX_Q = 3
+# Number of complexity layers without improvement after which the search stops
+PATIENCE = 2
+# Smallest information criterion decrease that counts as an improvement
+MIN_IMPROVEMENT = 1.0
+# Significance level of the KPSS stationarity test that picks the differencing order
+KPSS_ALPHA = 0.05
+# Stored with every cached order; entries of an older search are searched again
+ORDER_SEARCH_VERSION = 2
+
+_order_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _fit_candidate(values, order, warm_params, criterion):
+    """
+    Fit one candidate order and return (order, criterion value, fitted params by name).
+
+    `warm_params` maps parameter names of a neighbouring fit (e.g. 'ar.L1', 'ma.L2',
+    'sigma2') to their estimates. Parameters the neighbour did not have start at zero.
+    If the warm start cannot be used the candidate is refitted from the default start.
+    """
+    from statsmodels.tsa.arima.model import ARIMA
+
+    values = np.asarray(values, dtype=float)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model = ARIMA(values, order=order)
+
+        start_params = None
+        if warm_params:
+            start_params = np.array([warm_params.get(name, 0.0) for name in model.param_names])
+            if 'sigma2' in model.param_names and 'sigma2' not in warm_params:
+                start_params[model.param_names.index('sigma2')] = np.var(values)
+
+        try:
+            result = model.fit(start_params=start_params)
+        except Exception:
+            if start_params is None:
+                return order, math.inf, None
+            try:
+                result = model.fit()
+            except Exception:
+                return order, math.inf, None
+
+    score = getattr(result, criterion)
+    if not np.isfinite(score):
+        return order, math.inf, None
+    return order, float(score), dict(zip(model.param_names, np.asarray(result.params, dtype=float)))
+
+
+def select_d(values, max_d=MAX_D, alpha=KPSS_ALPHA):
+    """
+    Choose the differencing order with repeated KPSS tests.
+
+    The series is differenced until the KPSS test no longer rejects stationarity at
+    `alpha`, at most `max_d` times. Likelihoods of models fitted at different d are
+    computed on different series and their information criteria are not comparable,
+    so the order search fixes d first and compares (p, q) at that d only.
+    """
+    from statsmodels.tsa.stattools import kpss
+
+    series = np.asarray(values, dtype=float)
+    for d in range(max_d):
+        if len(series) < 3 or np.ptp(series) == 0:
+            return d
+        with warnings.catch_warnings():
+            # p-values beyond the test's lookup table are clipped with a warning
+            warnings.simplefilter('ignore')
+            try:
+                _, p_value, _, _ = kpss(series, regression='c', nlags='auto')
+            except (ValueError, np.linalg.LinAlgError):
+                return d
+        if p_value >= alpha:
+            return d
+        series = np.diff(series)
+    return max_d
+
+
+def _candidate_layers(n_points, max_p, d, max_q):
+    """
+    Group the (p, q) grid at differencing order d into layers of equal p + q,
+    skipping orders the series cannot fit.
+    """
+    layers = []
+    for complexity in range(max_p + max_q + 1):
+        layer = [(p, d, complexity - p)
+                 for p in range(max_p + 1)
+                 if 0 <= complexity - p <= max_q and p + d + (complexity - p) + 2 <= n_points]
+        if layer:
+            layers.append(layer)
+    return layers
+
+
+def select_order(values, criterion='aic', max_p=MAX_P, max_d=MAX_D, max_q=MAX_Q, max_workers=None,
+                 patience=PATIENCE):
+    """
+    Search a bounded (p, d, q) grid for the ARIMA order with the lowest information criterion.
+
+    d is chosen first with select_d, then (p, q) are searched at that d. Candidates
+    are visited in layers of increasing p + q. Every layer is fitted in parallel
+    worker processes, each candidate warm-started from the best fitted neighbour of
+    the previous layer with one AR or MA term less. The search stops once `patience`
+    consecutive layers fail to improve the best criterion value.
+
+    Parameters:
+    -----------
+    values : array-like
+        Observed series.
+    criterion : str
+        'aic' or 'bic'.
+    max_workers : int, optional
+        Number of worker processes, None for one per CPU. Pass 1 to fit in the calling
+        process, which is required when already running inside a worker and is what
+        request paths (the dashboard and the API) do.
+
+    Returns:
+    --------
+    tuple
+        ((p, d, q), criterion value). The value is inf if no candidate could be fitted.
+    """
+    values = [float(value) for value in values]
+    layers = _candidate_layers(len(values), max_p, select_d(values, max_d), max_q)
+
+    best_order, best_score = None, math.inf
+    fitted = {}
+    stale_layers = 0
+
+    # Spawned rather than forked, callers may be multi-threaded servers (see src/charts.py)
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) \
+        if max_workers != 1 else None
+    try:
+        for layer in layers:
+            previous_best = best_score
+            jobs = []
+            for p, d, q in layer:
+                neighbours = [fitted[n] for n in ((p - 1, d, q), (p, d, q - 1)) if n in fitted]
+                warm_params = min(neighbours, key=lambda fit: fit[0])[1] if neighbours else None
+                jobs.append(((p, d, q), warm_params))
+
+            if executor:
+                futures = [executor.submit(_fit_candidate, values, order, warm, criterion) for order, warm in jobs]
+                outcomes = [future.result() for future in futures]
+            else:
+                outcomes = [_fit_candidate(values, order, warm, criterion) for order, warm in jobs]
+
+            for order, score, params in outcomes:
+                if params is None:
+                    continue
+                fitted[order] = (score, params)
+                if score < best_score:
+                    best_order, best_score = order, score
+
+            if best_score < previous_best - MIN_IMPROVEMENT:
+                stale_layers = 0
+            else:
+                stale_layers += 1
+                if stale_layers >= patience:
+                    break
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return best_order, best_score
+
+
+def _load_order_cache(path):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+
+    cached = _order_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r') as cache_file:
+        orders = json.load(cache_file)
+    _order_cache[path] = (mtime, orders)
+    return orders
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on a sidecar file next to `path`, shared by every process saving to it"""
+    with open(f"{path}.lock", 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        yield
+
+
+def _cache_key(patient_id, feature):
+    return f"{patient_id}|{feature}"
+
+
+def get_cached_order(patient_id, feature, n_points=None, path=ORDER_CACHE):
+    """
+    Return the cached order for a (patient, feature) series, or None.
+
+    When `n_points` is given an entry selected for a series of a different length
+    is treated as stale, as is an entry selected by an older version of the search.
+    """
+    entry = _load_order_cache(path).get(_cache_key(patient_id, feature))
+    hit = bool(entry) and entry.get('search') == ORDER_SEARCH_VERSION and \
+        (n_points is None or entry['n_points'] == n_points)
+    metrics.cache_lookup('arima_order', hit)
+    return tuple(entry['order']) if hit else None
+
+
+def save_orders(selections, path=ORDER_CACHE):
+    """
+    Merge selected orders into the order cache file.
+
+    Parameters:
+    -----------
+    selections : list
+        Tuples of (patient_id, feature, order, n_points).
+    """
+    # The thread lock serializes saves within the process, the file lock saves by other processes
+    # (the batch job, the API and the dashboard), so none of them merges into a stale copy
+    with _cache_lock, _file_lock(path):
+        # Reread under the lock, the mtime check could miss a write made within its resolution
+        _order_cache.pop(path, None)
+        orders = dict(_load_order_cache(path))
+        for patient_id, feature, order, n_points in selections:
+            orders[_cache_key(patient_id, feature)] = {'order': list(order), 'n_points': n_points,
+                                                       'search': ORDER_SEARCH_VERSION}
+
+        # Written next to the cache and swapped in, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(orders, cache_file, indent=1)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        _order_cache.pop(path, None)
+
+
+def get_order(patient_id, feature, values, default=None, max_workers=1, path=ORDER_CACHE):
+    """
+    Return the ARIMA order for a series, searching and caching it on the first request.
+
+    The search runs serially in the calling thread by default: this is called while
+    serving requests, which must not start a process pool each. The batch forecast
+    job fills the cache for the whole dataset ahead of time.
+
+    Falls back to `default` when no candidate order can be fitted.
+    """
+    order = get_cached_order(patient_id, feature, len(values), path)
+    if order is not None:
+        return order
+
+    order, _ = select_order(values, max_workers=max_workers)
+    if order is None:
+        return default
+
+    save_orders([(patient_id, feature, order, len(values))], path)
+    return order
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import math
+from src import metrics
 
 class ASCVDRiskCalculator:
 
@@ -37,6 +38,7 @@ class ASCVDRiskCalculator:
                 }
             }
 
+    @metrics.timed("risk.compute_10_year_risk")
     def compute_10_year_risk(self, age, sex, total_cholesterol, hdl_cholesterol,
                                systolic_bp, isBpTreated, isSmoker, hasDiabetes):
     
@@ -117,7 +119,8 @@ class ASCVDRiskCalculator:
         
         return {'status': 'ok'}
     
-    def _get_risk_category(self, risk_percent):
+    def get_risk_category(self, risk_percent):
+        """Return the ACC/AHA category of a 10-year risk: 'Low', 'Borderline', 'Intermediate' or 'High'"""
 
         if risk_percent < 5:
             return 'Low'
@@ -130,7 +133,61 @@ class ASCVDRiskCalculator:
         
         else:
             return 'High'
-        
+
+
+def assess_risk(demographics, total_chol, hdl_chol, systolic_bp, is_treated_bp, is_smoker, has_diabetes):
+    """
+    Compute the ASCVD 10-year risk from a patient's latest readings.
+
+    The one place that checks whether the readings allow a risk to be given, used by
+    the dashboard, the batch reports and the API.
+
+    Parameters:
+    -----------
+    demographics : tuple or None
+        (given name, family name, birth date, age, sex) as returned by FHIRClient.
+    total_chol, hdl_chol, systolic_bp : dict or None
+        The latest readings, each with a 'value'.
+    is_treated_bp, is_smoker, has_diabetes : bool
+        Risk factors.
+
+    Returns:
+    --------
+    dict
+        'status' is 'success' with the 'risk' percentage, its 'category' and the 'age',
+        'sex', 'total_chol', 'hdl_chol' and 'systolic_bp' values used, or 'unavailable'
+        with a 'message' and a 'reason': 'missing_data' when a reading is missing,
+        'invalid_input' when the calculator does not accept the values.
+    """
+    if not demographics:
+        return {'status': 'unavailable', 'reason': 'missing_data',
+                'message': "Not enough data to calculate ASCVD risk."}
+    if not (isinstance(total_chol, dict) and total_chol.get('value')) or \
+            not (isinstance(hdl_chol, dict) and hdl_chol.get('value')):
+        return {'status': 'unavailable', 'reason': 'missing_data',
+                'message': "Missing cholesterol data for risk calculation."}
+    if not (isinstance(systolic_bp, dict) and 'value' in systolic_bp):
+        return {'status': 'unavailable', 'reason': 'missing_data',
+                'message': "Missing systolic BP data for risk calculation."}
+
+    _, _, _, age, sex = demographics
+    calculator = ASCVDRiskCalculator()
+    risk = calculator.compute_10_year_risk(age=age, sex=sex, total_cholesterol=total_chol['value'],
+                                           hdl_cholesterol=hdl_chol['value'], systolic_bp=systolic_bp['value'],
+                                           isBpTreated=is_treated_bp, isSmoker=is_smoker, hasDiabetes=has_diabetes)
+    if isinstance(risk, dict):
+        return {'status': 'unavailable', 'reason': 'invalid_input', 'message': risk['message']}
+    return {'status': 'success', 'risk': float(risk), 'category': calculator.get_risk_category(risk),
+            'age': age, 'sex': sex, 'total_chol': total_chol['value'], 'hdl_chol': hdl_chol['value'],
+            'systolic_bp': systolic_bp['value']}
+
+
+def assess_summary_risk(summary):
+    """assess_risk() of a FHIRClient.get_patient_summary() dict"""
+    return assess_risk(summary['demographics'], summary['total_chol'], summary['hdl_chol'], summary['systolic_bp'],
+                       summary['is_treated_bp'], summary['is_smoker'], summary['has_diabetes'])
+
+
 def main():
     calculator = ASCVDRiskCalculator()
 
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from src.arima_order import select_order
+from src.forecast import DEFAULT_ORDER, FORECAST_FEATURES, _load_dataset, arima_forecast, holt_forecast
+
+DEFAULT_MAX_HORIZON = 5
+# Observations every rolling origin trains on at minimum
+DEFAULT_MIN_TRAIN = 8
+
+
+def _naive_forecast(train, steps, context):
+    return np.repeat(train[-1], steps)
+
+
+def _holt_forecast(train, steps, context):
+    return holt_forecast(train, steps)
+
+
+def _arima_default_forecast(train, steps, context):
+    return arima_forecast(train, steps, DEFAULT_ORDER)
+
+
+def _arima_auto_forecast(train, steps, context):
+    # Select the order once per series on the first training window and reuse it for later origins
+    if 'order' not in context:
+        order, _ = select_order(train, max_workers=1)
+        context['order'] = order or DEFAULT_ORDER
+    return arima_forecast(train, steps, context['order'])
+
+
+# Forecasting methods compared by the backtest. Each takes (train, steps, context) where
+# context is a per-series dict the method may use to keep state between origins.
+METHODS = {
+    'naive': _naive_forecast,
+    'holt': _holt_forecast,
+    'arima_default': _arima_default_forecast,
+    'arima_auto': _arima_auto_forecast
+}
+
+
+def _backtest_series(name, feature, values, methods, min_train, max_horizon):
+    """
+    Run rolling-origin evaluation of every method on one series.
+
+    For each origin the method is trained on values[:origin] and scored against the
+    following observations up to `max_horizon` steps ahead. Fit time is measured on
+    every origin; peak traced memory is measured on the first origin only, since
+    tracemalloc slows the fit down considerably.
+
+    Returns:
+    --------
+    list
+        One record per (method, origin, horizon) with the absolute and percentage
+        error, plus one record per (method, origin) with fit timing.
+    """
+    warnings.simplefilter('ignore')
+    errors = []
+    fits = []
+
+    for method in methods:
+        forecast_fn = METHODS[method]
+        context = {}
+        for origin in range(min_train, len(values)):
+            train = values[:origin]
+            actual = values[origin:origin + max_horizon]
+            measure_memory = origin == min_train
+
+            if measure_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                forecast = np.asarray(forecast_fn(train, len(actual), context), dtype=float)
+                failed = not np.all(np.isfinite(forecast))
+            except Exception:
+                forecast, failed = None, True
+            fit_seconds = time.perf_counter() - start
+            peak_bytes = None
+            if measure_memory:
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            fits.append({'name': name, 'feature': feature, 'method': method, 'origin': origin,
+                         'fit_seconds': fit_seconds, 'peak_bytes': peak_bytes, 'failed': failed})
+            if failed:
+                continue
+
+            for horizon, (predicted, observed) in enumerate(zip(forecast, actual), start=1):
+                abs_error = abs(predicted - observed)
+                errors.append({'name': name, 'feature': feature, 'method': method, 'origin': origin,
+                               'horizon': horizon, 'abs_error': abs_error,
+                               'pct_error': abs_error / abs(observed) * 100 if observed != 0 else np.nan})
+    return errors, fits
+
+
+def iter_series(features=None, min_points=DEFAULT_MIN_TRAIN + 1):
+    """Yield (name, feature, values) for every series in the forecasting dataset long enough to backtest"""
+    df = _load_dataset()
+    features = features or FORECAST_FEATURES
+    df = df[df["Features"].isin(features)]
+    for (name, feature), group in df.groupby(["Name", "Features"], sort=True):
+        values = group["Values"].to_numpy(dtype=float)
+        if len(values) >= min_points:
+            yield name, feature, values
+
+
+def run_backtest(features=None, methods=None, min_train=DEFAULT_MIN_TRAIN, max_horizon=DEFAULT_MAX_HORIZON,
+                 max_workers=None, progress=None):
+    """
+    Backtest forecasting methods on every (patient, feature) series using a process pool.
+
+    Parameters:
+    -----------
+    features : list, optional
+        Features to evaluate. Defaults to FORECAST_FEATURES.
+    methods : list, optional
+        Names from METHODS to compare. Defaults to all of them.
+    min_train : int
+        Length of the first training window.
+    max_horizon : int
+        Furthest step ahead that is scored.
+    max_workers : int, optional
+        Size of the process pool.
+    progress : callable, optional
+        Called as progress(done, total) after every finished series.
+
+    Returns:
+    --------
+    tuple
+        (errors, fits) DataFrames with one row per scored forecast step and per model fit.
+    """
+    methods = methods or list(METHODS)
+    series = list(iter_series(features, min_train + 1))
+
+    errors, fits = [], []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_backtest_series, name, feature, values, methods, min_train, max_horizon)
+                   for name, feature, values in series]
+        for done, future in enumerate(as_completed(futures), start=1):
+            series_errors, series_fits = future.result()
+            errors.extend(series_errors)
+            fits.extend(series_fits)
+            if progress:
+                progress(done, len(futures))
+
+    return pd.DataFrame(errors), pd.DataFrame(fits)
+
+
+def summarize(errors, fits):
+    """
+    Build the method comparison report.
+
+    Returns:
+    --------
+    tuple
+        (accuracy, performance) DataFrames. accuracy holds MAE and MAPE per method and
+        horizon; performance holds fit time percentiles, peak memory and failure rate
+        per method.
+    """
+    accuracy = errors.groupby(["method", "horizon"]).agg(
+        mae=("abs_error", "mean"),
+        mape=("pct_error", "mean"),
+        n=("abs_error", "size")
+    ).reset_index()
+
+    performance = fits.groupby("method").agg(
+        fits=("fit_seconds", "size"),
+        mean_fit_ms=("fit_seconds", lambda s: s.mean() * 1000),
+        p95_fit_ms=("fit_seconds", lambda s: s.quantile(0.95) * 1000),
+        max_peak_kb=("peak_bytes", lambda s: s.max() / 1024),
+        failure_rate=("failed", "mean")
+    ).reset_index()
+    return accuracy, performance
+
+
+def format_report(accuracy, performance):
+    """Render the comparison report as plain text tables"""
+    mae = accuracy.pivot(index="horizon", columns="method", values="mae")
+    mape = accuracy.pivot(index="horizon", columns="method", values="mape")
+    return "\n\n".join([
+        "MAE by horizon\n" + mae.to_string(float_format="%.3f"),
+        "MAPE (%) by horizon\n" + mape.to_string(float_format="%.2f"),
+        "Fit performance\n" + performance.to_string(index=False, float_format="%.2f")
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the forecasting methods.")
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("--horizon", type=int, default=DEFAULT_MAX_HORIZON, help="Furthest horizon to score")
+    parser.add_argument("--min-train", type=int, default=DEFAULT_MIN_TRAIN, help="First training window length")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--output", default=None, help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    errors, fits = run_backtest(methods=args.methods, min_train=args.min_train, max_horizon=args.horizon,
+                                max_workers=args.workers or os.cpu_count(),
+                                progress=lambda done, total: print(f"[{done}/{total}] series done"))
+    if errors.empty:
+        print("No series long enough to backtest.")
+        return
+
+    accuracy, performance = summarize(errors, fits)
+    print(format_report(accuracy, performance))
+    print(f"\nBacktested {fits.groupby(['name', 'feature']).ngroups} series in {time.perf_counter() - start:.1f}s")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'accuracy': accuracy.to_dict(orient='records'),
+                'performance': performance.to_dict(orient='records')
+            }, output_file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
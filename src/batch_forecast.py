@@ -0,0 +1,204 @@
+import argparse
+import math
+import os
+import signal
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
+
+from src.arima_order import ORDER_CACHE, get_cached_order, save_orders, select_order
+from src.forecast import (DEFAULT_ORDER, FORECAST_FEATURES, _load_dataset, arima_forecast, get_dataset_version,
+                          get_forecast_patient_ids, get_series)
+from src.forecast_store import FORECAST_STORE, save_forecast_store
+
+DEFAULT_DURATION = 5
+DEFAULT_TASK_TIMEOUT = 30
+
+
+class ForecastTimeout(BaseException):
+    # Not an Exception subclass so the broad handlers around individual model fits cannot swallow it
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ForecastTimeout()
+
+
+def _init_worker():
+    """Load the dataset once per worker process instead of once per task"""
+    _load_dataset()
+
+
+def _forecast_task(patient_id, feature, duration, timeout, order_cache):
+    """
+    Forecast a single (patient, feature) series inside a worker process.
+
+    The ARIMA order comes from the order cache; on a miss it is searched serially in
+    this worker (pools cannot be nested) and returned as 'selected_order' so the
+    parent can cache it.
+
+    The per-task timeout is enforced with SIGALRM in the worker itself, so a stuck fit
+    frees its worker for the next task. On platforms without SIGALRM tasks run
+    without a time limit.
+
+    Returns:
+    --------
+    dict
+        'status' is one of 'ok', 'no_data', 'failed' or 'timeout'. Successful results
+        carry the forecast 'values' and a 'converged' flag that is False when
+        statsmodels reported a convergence problem.
+    """
+    result = {'patient_id': patient_id, 'feature': feature}
+    use_alarm = bool(timeout) and hasattr(signal, 'SIGALRM')
+    start = time.perf_counter()
+
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+    try:
+        # The timer is stopped before any handler runs, so a late alarm cannot escape the task
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            values = get_series(feature, patient_id)
+            if isinstance(values, str):
+                result.update(status='no_data', message=values)
+            else:
+                order = get_cached_order(patient_id, feature, len(values), order_cache)
+                if order is None:
+                    order, _ = select_order(values, max_workers=1)
+                    if order is not None:
+                        result['selected_order'] = (list(order), len(values))
+                order = order or DEFAULT_ORDER
+                result['order'] = list(order)
+
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always', ConvergenceWarning)
+                    forecast = arima_forecast(values, duration, order)
+
+                forecast_values = [float(value) for value in forecast]
+                if all(math.isfinite(value) for value in forecast_values):
+                    converged = not any(issubclass(w.category, ConvergenceWarning) for w in caught)
+                    result.update(status='ok', values=forecast_values, converged=converged)
+                else:
+                    result.update(status='failed', message="Forecast contains non-finite values")
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except ForecastTimeout:
+        result.update(status='timeout', message=f"Fit exceeded {timeout}s")
+    except Exception as e:
+        result.update(status='failed', message=f"{type(e).__name__}: {e}")
+
+    result['fit_seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch_forecast(patient_ids=None, features=None, duration=DEFAULT_DURATION, max_workers=None,
+                       task_timeout=DEFAULT_TASK_TIMEOUT, store_path=FORECAST_STORE, order_cache=ORDER_CACHE,
+                       progress=None):
+    """
+    Forecast every (patient, feature) pair on a process pool and write the results to the forecast store.
+
+    Parameters:
+    -----------
+    patient_ids : list, optional
+        Patients to forecast. Defaults to every patient in the forecasting dataset.
+    features : list, optional
+        Features to forecast. Defaults to FORECAST_FEATURES.
+    duration : int
+        Number of days to forecast for each series.
+    max_workers : int, optional
+        Size of the process pool. Defaults to the number of CPUs.
+    task_timeout : float
+        Seconds allowed for a single series before it is recorded as timed out.
+    store_path : str or None
+        Where to write the forecast store. Pass None to skip writing.
+    order_cache : str
+        ARIMA order cache to read, and to update with orders selected during the run.
+    progress : callable, optional
+        Called as progress(done, total, result) after every finished task.
+
+    Returns:
+    --------
+    dict
+        'results' with one entry per series, 'counts' per status, 'elapsed_seconds'
+        and 'series_per_second'.
+    """
+    patient_ids = patient_ids or get_forecast_patient_ids()
+    features = features or FORECAST_FEATURES
+    tasks = [(str(patient_id), feature) for patient_id in patient_ids for feature in features]
+
+    # Load once in the parent so forked workers share the parsed dataset; the version is
+    # taken first so a dataset replaced during the run leaves the store looking stale
+    dataset_version = get_dataset_version()
+    _load_dataset()
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(_forecast_task, patient_id, feature, duration, task_timeout, order_cache):
+                (patient_id, feature)
+            for patient_id, feature in tasks
+        }
+        for future in as_completed(futures):
+            patient_id, feature = futures[future]
+            try:
+                result = future.result()
+            except ForecastTimeout:
+                # Raised outside the task's handlers; one slow series must not abort the batch
+                result = {'patient_id': patient_id, 'feature': feature, 'status': 'timeout',
+                          'message': f"Fit exceeded {task_timeout}s", 'fit_seconds': None}
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                result = {'patient_id': patient_id, 'feature': feature, 'status': 'failed',
+                          'message': f"{type(e).__name__}: {e}", 'fit_seconds': None}
+            results.append(result)
+            if progress:
+                progress(len(results), len(tasks), result)
+    elapsed = time.perf_counter() - start
+
+    selections = [(result['patient_id'], result['feature'], *result.pop('selected_order'))
+                  for result in results if 'selected_order' in result]
+    if selections:
+        save_orders(selections, order_cache)
+
+    if store_path:
+        save_forecast_store(results, duration, store_path, dataset_version)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    return {
+        'results': results,
+        'counts': counts,
+        'elapsed_seconds': elapsed,
+        'series_per_second': len(results) / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute forecasts for all patients and features.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DURATION, help="Forecast horizon in days")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TASK_TIMEOUT, help="Per-series timeout in seconds")
+    parser.add_argument("--store", default=FORECAST_STORE, help="Path of the forecast store to write")
+    args = parser.parse_args()
+
+    def report(done, total, result):
+        print(f"[{done}/{total}] {result['patient_id']} {result['feature']}: {result['status']}")
+
+    summary = run_batch_forecast(duration=args.days, max_workers=args.workers or os.cpu_count(),
+                                 task_timeout=args.timeout, store_path=args.store, progress=report)
+
+    counts = ", ".join(f"{status}={count}" for status, count in sorted(summary['counts'].items()))
+    print(f"Forecasted {len(summary['results'])} series in {summary['elapsed_seconds']:.2f}s "
+          f"({summary['series_per_second']:.1f} series/s): {counts}")
+    print(f"Results written to {args.store}")
+
+
+if __name__ == "__main__":
+    main()
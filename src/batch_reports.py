@@ -0,0 +1,320 @@
+import argparse
+import base64
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from io import BytesIO
+
+import matplotlib.image as mimage
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from src import charts
+from src.ascvd_risk_calculator import assess_summary_risk
+from src.fhir_client import JSON_DATABASE, FHIRClient, fullUrl
+from src.forecast import FORECAST_FEATURES, forecast_with_budget
+from src.forecast_store import get_stored_forecast
+
+REPORT_DIR = 'data/reports'
+REPORT_FORMATS = ['html', 'pdf']
+DEFAULT_FORECAST_DAYS = 5
+# Printed reports must not depend on machine load, so they use a mode without a latency
+# budget: 'arima' always fits (searching the order serially on a cache miss), 'fast'
+# always uses exponential smoothing
+REPORT_FORECAST_MODES = ['arima', 'fast']
+DEFAULT_REPORT_FORECAST_MODE = 'arima'
+
+# Client of the worker process. Created in the parent before the pool starts, so forked
+# workers share the parsed JSON database instead of each loading their own copy.
+_client = None
+
+
+def _get_client(json_path=JSON_DATABASE):
+    global _client
+    if _client is None or _client.json_path != json_path:
+        _client = FHIRClient(server_url=fullUrl, json_path=json_path)
+    return _client
+
+
+def _latest(history):
+    if not history:
+        return "No data"
+    return f"{history[-1]['display']} ({history[-1]['formatted_date']})"
+
+
+def _latest_value(entry, unit):
+    if isinstance(entry, dict) and entry.get('value'):
+        return f"{entry['value']} {unit} ({entry['date']})"
+    return "No data"
+
+
+def patient_forecasts(patient_id, days, mode=DEFAULT_REPORT_FORECAST_MODE):
+    """
+    Forecast every forecasting feature of a patient.
+
+    In 'arima' mode the batch-precomputed ARIMA forecast is used where the forecast
+    store has one, otherwise the feature is forecast in this process. 'fast' forecasts
+    every feature with exponential smoothing.
+
+    Returns:
+    --------
+    dict
+        Feature to (values, method), for the features that can be forecast.
+    """
+    forecasts = {}
+    for feature in FORECAST_FEATURES:
+        stored = get_stored_forecast(patient_id, feature, days) if mode == 'arima' else None
+        if stored is not None:
+            forecasts[feature] = (list(stored), 'arima')
+            continue
+        outcome = forecast_with_budget(feature, days, patient_id, mode=mode)
+        if not isinstance(outcome, str):
+            values, method = outcome
+            forecasts[feature] = ([float(value) for value in values], method)
+    return forecasts
+
+
+def build_report(summary, forecasts=None):
+    """
+    Assemble the contents of a patient report, independent of the output format.
+
+    Returns:
+    --------
+    dict
+        'title', the 'information' rows as (label, value) pairs, the chart PNGs (None
+        when a chart has no data), the 'risk' assessment and the 'forecasts'.
+    """
+    given, surname, birthdate, age, sex = summary['demographics']
+    information = [
+        ("Date of birth", birthdate),
+        ("Age", f"{age} years"),
+        ("Sex", sex),
+        ("Height", _latest(summary['height_history'])),
+        ("Weight", _latest(summary['weight_history'])),
+        ("Total cholesterol", _latest_value(summary['total_chol'], "mg/dL")),
+        ("HDL cholesterol", _latest_value(summary['hdl_chol'], "mg/dL")),
+        ("Systolic BP", _latest_value(summary['systolic_bp'], "mmHg")),
+        ("Smoking status", "Current smoker" if summary['is_smoker'] else "Non-smoker"),
+        ("Diabetes", "Yes" if summary['has_diabetes'] else "No"),
+        ("On BP medication", "Yes" if summary['is_treated_bp'] else "No")
+    ]
+    # Rendered on this process: report workers are already spread over the cores
+    chart_images = {name: charts.DASHBOARD_CHARTS[name][0](*args)
+                    for name, args in charts.dashboard_chart_args(summary).items()}
+    return {
+        'title': f"{given} {surname}",
+        'information': information,
+        'charts': chart_images,
+        'risk': assess_summary_risk(summary),
+        'forecasts': forecasts or {}
+    }
+
+
+def _risk_text(risk):
+    if risk['status'] != 'success':
+        return risk['message']
+    return f"10-year ASCVD risk: {risk['risk']:.1f}% ({risk['category']})"
+
+
+def write_html(report, path):
+    """Write a report as a self-contained HTML file with the charts embedded as PNG data URIs"""
+    rows = "".join(f"<tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>"
+                   for label, value in report['information'])
+    chart_blocks = []
+    for name, image in report['charts'].items():
+        if image is None:
+            chart_blocks.append(f"<p class='empty'>{html.escape(charts.DASHBOARD_CHARTS[name][1])}</p>")
+        else:
+            chart_blocks.append(f"<img src='data:image/png;base64,{base64.b64encode(image).decode()}' alt='{name}'>")
+    forecast_rows = "".join(
+        f"<tr><th>{html.escape(feature)}</th><td>{method}</td>"
+        f"<td>{', '.join(f'{value:.1f}' for value in values)}</td></tr>"
+        for feature, (values, method) in report['forecasts'].items())
+    forecast_section = (f"<h2>Forecasts</h2><table><tr><th>Feature</th><th>Method</th><th>Next days</th></tr>"
+                        f"{forecast_rows}</table>") if forecast_rows else ""
+
+    document = f"""<!DOCTYPE html>
+<html><head><meta charset='utf-8'><title>{html.escape(report['title'])}</title>
+<style>
+body {{ font-family: Arial, sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 1em; }}
+th, td {{ text-align: left; padding: 4px 12px; border-bottom: 1px solid #ddd; }}
+.charts {{ display: grid; grid-template-columns: 1fr 1fr; gap: 1em; }}
+.charts img {{ width: 100%; }}
+.empty {{ color: #996600; }}
+</style></head>
+<body>
+<h1>{html.escape(report['title'])}</h1>
+<p>Report generated {date.today().strftime('%d-%m-%Y')}</p>
+<h2>Patient information</h2><table>{rows}</table>
+<h2>Health trends</h2><div class='charts'>{''.join(chart_blocks)}</div>
+<h2>ASCVD risk assessment</h2><p>{html.escape(_risk_text(report['risk']))}</p>
+{forecast_section}
+</body></html>
+"""
+    with open(path, 'w', encoding='utf-8') as report_file:
+        report_file.write(document)
+
+
+def write_pdf(report, path):
+    """Write a report as a two-page A4 PDF: patient information, risk and forecasts, then the charts"""
+    with PdfPages(path) as pdf:
+        fig = Figure(figsize=(8.27, 11.69))
+        lines = [report['title'], ""] + [f"{label}: {value}" for label, value in report['information']]
+        lines += ["", "ASCVD risk assessment", _risk_text(report['risk'])]
+        if report['forecasts']:
+            lines += ["", "Forecasts"]
+            lines += [f"{feature} ({method}): {', '.join(f'{value:.1f}' for value in values)}"
+                      for feature, (values, method) in report['forecasts'].items()]
+        for row, line in enumerate(lines):
+            fig.text(0.08, 0.94 - row * 0.025, line, fontsize=16 if row == 0 else 10,
+                     fontweight='bold' if row == 0 or line in ("ASCVD risk assessment", "Forecasts") else 'normal')
+        pdf.savefig(fig)
+
+        fig = Figure(figsize=(8.27, 11.69))
+        for position, (name, image) in enumerate(report['charts'].items(), start=1):
+            ax = fig.add_subplot(4, 1, position)
+            ax.axis('off')
+            if image is None:
+                ax.text(0.5, 0.5, charts.DASHBOARD_CHARTS[name][1], ha='center', va='center')
+            else:
+                ax.imshow(mimage.imread(BytesIO(image), format='png'))
+        pdf.savefig(fig)
+
+
+REPORT_WRITERS = {'html': write_html, 'pdf': write_pdf}
+
+
+def _report_task(patient_id, report_format, output_dir, forecast_days, forecast_mode, json_path):
+    """
+    Build and write the report of one patient inside a worker process.
+
+    Returns:
+    --------
+    dict
+        'status' is 'ok' with the report 'path', 'no_data' for an unknown patient or
+        'failed' with a 'message'.
+    """
+    result = {'patient_id': patient_id}
+    start = time.perf_counter()
+    try:
+        summary = _get_client(json_path).get_patient_summary(patient_id)
+        if not summary['demographics']:
+            result.update(status='no_data', message="Patient not found")
+        else:
+            forecasts = patient_forecasts(patient_id, forecast_days, forecast_mode) if forecast_days else None
+            path = os.path.join(output_dir, f"{patient_id}.{report_format}")
+            REPORT_WRITERS[report_format](build_report(summary, forecasts), path)
+            result.update(status='ok', path=path)
+    except Exception as e:
+        result.update(status='failed', message=f"{type(e).__name__}: {e}")
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch_reports(patient_ids=None, report_format='html', output_dir=REPORT_DIR, forecast_days=None,
+                      max_workers=None, json_path=JSON_DATABASE, progress=None,
+                      forecast_mode=DEFAULT_REPORT_FORECAST_MODE):
+    """
+    Write one report per patient on a process pool.
+
+    Parameters:
+    -----------
+    patient_ids : list, optional
+        Patients to report on. Defaults to every patient in the JSON database.
+    report_format : str
+        'html' or 'pdf'.
+    output_dir : str
+        Directory the reports are written to, one file per patient named after its ID.
+    forecast_days : int, optional
+        Include forecasts of this many days for every forecasting feature. No
+        forecasts when omitted.
+    forecast_mode : str
+        'arima' or 'fast', see REPORT_FORECAST_MODES.
+    max_workers : int, optional
+        Size of the process pool. Defaults to the number of CPUs.
+    json_path : str
+        JSON database to read the patients from.
+    progress : callable, optional
+        Called as progress(done, total, result) after every finished report.
+
+    Returns:
+    --------
+    dict
+        'results' with one entry per patient, 'counts' per status, 'elapsed_seconds'
+        and 'reports_per_minute'.
+    """
+    # Load once in the parent so forked workers share the parsed database
+    client = _get_client(json_path)
+    # Duplicates are dropped so no two workers write the same file
+    patient_ids = list(dict.fromkeys(str(patient_id) for patient_id in (patient_ids or client.get_all_patient_ids())))
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_report_task, patient_id, report_format, output_dir, forecast_days, forecast_mode,
+                            json_path): patient_id
+            for patient_id in patient_ids
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                result = {'patient_id': futures[future], 'status': 'failed', 'message': f"{type(e).__name__}: {e}",
+                          'seconds': None}
+            results.append(result)
+            if progress:
+                progress(len(results), len(patient_ids), result)
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    return {
+        'results': results,
+        'counts': counts,
+        'elapsed_seconds': elapsed,
+        'reports_per_minute': len(results) / elapsed * 60 if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a dashboard report for every patient of a clinic list.")
+    parser.add_argument("patients", nargs="*", help="Patient IDs, all patients in the database when omitted")
+    parser.add_argument("--patient-file", default=None, help="File with one patient ID per line")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default='html', help="Report file format")
+    parser.add_argument("--output", default=REPORT_DIR, help="Directory to write the reports to")
+    parser.add_argument("--forecast-days", type=int, default=None,
+                        help=f"Include forecasts of this many days (e.g. {DEFAULT_FORECAST_DAYS})")
+    parser.add_argument("--forecast-mode", choices=REPORT_FORECAST_MODES, default=DEFAULT_REPORT_FORECAST_MODE,
+                        help="'arima' fits every forecast, 'fast' uses exponential smoothing")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--database", default=JSON_DATABASE, help="Path of the JSON patient database")
+    args = parser.parse_args()
+
+    patient_ids = list(args.patients)
+    if args.patient_file:
+        with open(args.patient_file) as patient_file:
+            patient_ids += [line.strip() for line in patient_file if line.strip()]
+
+    def report(done, total, result):
+        detail = result.get('path') or result.get('message')
+        print(f"[{done}/{total}] {result['patient_id']}: {result['status']} {detail}")
+
+    summary = run_batch_reports(patient_ids, args.format, args.output, args.forecast_days,
+                                max_workers=args.workers or os.cpu_count(), json_path=args.database,
+                                progress=report, forecast_mode=args.forecast_mode)
+
+    counts = ", ".join(f"{status}={count}" for status, count in sorted(summary['counts'].items()))
+    print(f"Wrote {summary['counts'].get('ok', 0)} reports in {summary['elapsed_seconds']:.1f}s "
+          f"({summary['reports_per_minute']:.1f} reports/min): {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+import threading
+import weakref
+from collections import OrderedDict
+
+from src import metrics
+
+# Memory cap for rendered chart images shared by all sessions of the server process
+DEFAULT_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Number of list digests remembered by identity
+DIGEST_MEMO_SIZE = 256
+
+_digest_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _digest(part):
+    return hashlib.blake2b(pickle.dumps(part, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16).digest()
+
+
+def _list_digest(part):
+    # Sessions hand the same history lists to the charts on every rerun, so their digest is
+    # remembered by identity. The memo holds a weak reference only, so it does not keep a
+    # history alive after PatientCache has dropped it, and an id reused by another list
+    # is told apart by the dead reference.
+    with _memo_lock:
+        memo = _digest_memo.get(id(part))
+        if memo is not None and memo[0]() is part and memo[1] == len(part):
+            _digest_memo.move_to_end(id(part))
+            metrics.cache_lookup('chart_digest', True)
+            return memo[2]
+
+    metrics.cache_lookup('chart_digest', False)
+
+    digest = _digest(part)
+    try:
+        reference = weakref.ref(part)
+    except TypeError:
+        # Plain lists cannot be referenced weakly, only ObservationHistory digests are remembered
+        return digest
+    with _memo_lock:
+        _digest_memo[id(part)] = (reference, len(part), digest)
+        while len(_digest_memo) > DIGEST_MEMO_SIZE:
+            _digest_memo.popitem(last=False)
+    return digest
+
+
+def fingerprint(*parts):
+    """
+    Hash chart inputs into a cache key.
+
+    The parts must be picklable; observation histories, demographics tuples and
+    version strings all are. Observation histories are treated as immutable once
+    they have been fingerprinted.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(_list_digest(part) if isinstance(part, list) else _digest(part))
+    return digest.hexdigest()
+
+
+class ChartCache(object):
+    """
+    Thread-safe LRU cache of rendered chart images bounded by their total size in bytes.
+
+    Streamlit serves every session from the same process, so one instance is shared
+    by all sessions and an image rendered for one clinician is reused by the next.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached image for `key`, or None"""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        """Store an image, evicting the least recently used ones to stay within max_bytes"""
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -1,195 +1,370 @@
-import matplotlib.pyplot as plt
-import streamlit as st
-import csv
+import multiprocessing
 import os
-import matplotlib.lines as mlines
-import matplotlib.font_manager as fm
-from matplotlib.patches import Patch
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import streamlit as st
 import numpy as np
-
-# Open and read the CSV file. Return dictionary containing the data.
-def load_data(file_path):
-    bmi_data = []
-    with open(file_path, mode='r') as file:
-        reader = csv.DictReader(file, delimiter=';')
-        for row in reader:
-            bmi_data.append(row)
-    return bmi_data
-
-
-def get_bmi_ranges(data, age):
-    # If the age is 19 or older, return the row with age >= 19
-    if age >= 19:
-        return data[-1]  # Get the last row for age >= 19
+from src import alignment, downsample, metrics, reference_ranges, warmup
+from src.chart_cache import ChartCache, fingerprint
+from src.fhir_client import calculate_ages
+
+# Most date labels drawn on an x-axis, longer series label every k-th point
+MAX_XTICK_LABELS = 40
+
+MARKER_SIZE = 8 ** 2  # scatter sizes are in points^2, matching markersize=8 of the legend handles
+
+# Most observations drawn per chart. Longer histories are downsampled with LTTB, out-of-range
+# readings are always drawn.
+DEFAULT_POINT_BUDGET = int(os.getenv("CHART_POINT_BUDGET", 300))
+POINT_BUDGETS = dict.fromkeys(['weight_height_bmi', 'glucose', 'blood_pressure', 'heart_rate'], DEFAULT_POINT_BUDGET)
+
+# Rendered chart images shared by all sessions, keyed by a fingerprint of the chart inputs
+chart_cache = ChartCache()
+metrics.register_collector(metrics.cache_stats_collector('chart', chart_cache.stats), name='chart_cache')
+
+# Worker processes rendering the dashboard charts side by side, 0 renders them on the script thread
+RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+# Cache keys being rendered right now, so a second thread asking for the same chart
+# (the prefetcher and the dashboard, or two sessions) waits instead of drawing it again
+_rendering = {}
+_rendering_lock = threading.Lock()
+
+def _new_figure(figsize=(10, 5)):
+    """
+    Create a figure on its own Agg canvas.
+
+    Figures are built with the object-oriented API instead of pyplot, so they are never
+    registered with pyplot's global figure manager and are freed as soon as the
+    renderer drops its last reference.
+    """
+    # matplotlib is imported on the first render rather than with the app (see src/warmup.py)
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _figure_to_png(fig):
+    # Same output settings st.pyplot uses
+    buffer = BytesIO()
+    try:
+        fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    finally:
+        # Break the figure/artist reference cycles now rather than waiting for the cyclic GC
+        fig.clear()
+    return buffer.getvalue()
+
+
+def _cached_render(render, *args):
+    """
+    Return the PNG produced by render(*args), rendering only on a cache miss.
+
+    The key covers the renderer, all of its inputs and the reference-table version,
+    so a chart is re-rendered whenever its data or its ranges change.
+    """
+    key = fingerprint(render.__name__, reference_ranges.TABLE_VERSION, *args)
+    image = chart_cache.get(key)
+    if image is None:
+        image = render(*args)
+        if image is not None:
+            chart_cache.put(key, image)
+    return image
+
+
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Spawned rather than forked: the Streamlit server is multi-threaded and forking it is unsafe
+            # Workers load matplotlib as they start, not in the middle of their first render
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'),
+                                               initializer=warmup.import_deferred,
+                                               initargs=(warmup.CHART_MODULES,))
+        return _render_pool
+
+
+def _reset_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+            _render_pool = None
+
+
+@metrics.timed("charts.render_charts")
+def render_charts(chart_args, workers=None):
+    """
+    Render several charts concurrently, reusing cached images.
+
+    Parameters:
+    -----------
+    chart_args : dict
+        Maps a chart name from DASHBOARD_CHARTS to the arguments of its renderer.
+    workers : int, optional
+        Number of render processes, defaults to RENDER_WORKERS. With fewer than two
+        workers, or a single chart to draw, the charts are rendered on the calling thread.
+
+    Returns:
+    --------
+    dict
+        Chart name to PNG bytes, or to None when the chart has no data.
+
+    Cache lookups happen in this process; only the misses are sent to the pool, so
+    the dashboard waits roughly as long as its slowest uncached chart. A miss that
+    another thread is already rendering waits for that render instead. Should the pool
+    be unavailable or a worker die, the affected charts are rendered serially.
+    """
+    workers = RENDER_WORKERS if workers is None else workers
+    images = {}
+    misses = {}
+    in_progress = {}
+    for name, args in chart_args.items():
+        render = DASHBOARD_CHARTS[name][0]
+        key = fingerprint(render.__name__, reference_ranges.TABLE_VERSION, *args)
+        image = chart_cache.get(key)
+        if image is not None:
+            images[name] = image
+            continue
+        with _rendering_lock:
+            done = _rendering.get(key)
+            if done is None:
+                _rendering[key] = threading.Event()
+        if done is None:
+            misses[name] = (key, render, args)
+        else:
+            in_progress[name] = (key, render, args, done)
+
+    try:
+        images.update(_render_misses(misses, workers))
+    finally:
+        with _rendering_lock:
+            for key, _, _ in misses.values():
+                _rendering.pop(key).set()
+
+    for name, (key, render, args, done) in in_progress.items():
+        done.wait()
+        image = chart_cache.get(key)
+        # Charts without data are not cached, nor are images the other render failed to produce
+        images[name] = image if image is not None else render(*args)
+    return images
+
+
+def _render_misses(misses, workers):
+
+    images = {}
+    futures = {}
+    if workers > 1 and len(misses) > 1:
+        try:
+            pool = _get_render_pool()
+            futures = {name: pool.submit(render, *args) for name, (_, render, args) in misses.items()}
+        except (BrokenProcessPool, OSError, RuntimeError):
+            _reset_render_pool()
+
+    for name, (key, render, args) in misses.items():
+        try:
+            image = futures[name].result() if name in futures else render(*args)
+        except BrokenProcessPool:
+            _reset_render_pool()
+            image = render(*args)
+        if image is not None:
+            chart_cache.put(key, image)
+        images[name] = image
+    return images
+
+
+def show_chart(name, images):
+    """Place a chart rendered by render_charts, or its empty-data warning"""
+    _show_chart(images.get(name), DASHBOARD_CHARTS[name][1])
+
+
+def _show_chart(image, empty_message):
+    if image is None:
+        st.warning(empty_message)
     else:
-        for row in data:
-            if int(row['age']) == age:
-                return row
+        st.image(image, use_container_width=True)
+
+
+def _interval_bounds(indices):
+    # Each point owns the interval from its index to the next one, the last interval is 1/n wide
+    ends = np.append(indices[1:], indices[-1] + 1 / len(indices)) if len(indices) else np.array([])
+    return np.asarray(indices, dtype=float), ends
+
+
+def _add_range_bands(ax, starts, ends, bounds, colors, alpha=0.7):
+    """
+    Draw the background range bands of a chart as a single PolyCollection.
+
+    Parameters:
+    -----------
+    starts, ends : numpy.ndarray
+        x-extent of every data interval.
+    bounds : numpy.ndarray
+        Shape (n_intervals, n_bands + 1). Row i holds the band boundaries (bottom to top)
+        for interval i.
+    colors : list
+        One fill colour per band.
+
+    Adjacent intervals whose boundaries are identical are merged into one rectangle per
+    band, so a long series with constant thresholds draws only len(colors) polygons.
+    Intervals with unknown (NaN) boundaries get no background.
+    """
+    if len(starts) == 0:
+        return
 
+    bounds = np.asarray(bounds, dtype=float)
+    changed = np.any(bounds[1:] != bounds[:-1], axis=1)
+    run_starts = np.flatnonzero(np.concatenate(([True], changed)))
+    run_ends = np.append(run_starts[1:], len(starts)) - 1
+    known = ~np.isnan(bounds[run_starts]).any(axis=1)
+    run_starts, run_ends = run_starts[known], run_ends[known]
+    if len(run_starts) == 0:
+        return
 
-def plot_weight_height_bmi(weight_history, height_history, bmi_history, demographics, client):
+    x0 = starts[run_starts][:, None]
+    x1 = ends[run_ends][:, None]
+    lower = bounds[run_starts, :-1]
+    upper = bounds[run_starts, 1:]
+    x0, x1 = np.broadcast_to(x0, lower.shape), np.broadcast_to(x1, lower.shape)
+
+    # One rectangle per (run, band), vertices ordered bottom-left, top-left, top-right, bottom-right
+    verts = np.stack([
+        np.stack([x0, lower], axis=-1),
+        np.stack([x0, upper], axis=-1),
+        np.stack([x1, upper], axis=-1),
+        np.stack([x1, lower], axis=-1)
+    ], axis=2).reshape(-1, 4, 2)
+    facecolors = np.tile(colors, len(run_starts))
+
+    from matplotlib.collections import PolyCollection
+    bands = PolyCollection(verts, facecolors=facecolors, edgecolors='face', alpha=alpha)
+    ax.add_collection(bands)
+    ax.autoscale_view()
+
+
+def _category_colors(categories, colors, unknown='gray'):
+    # Category -1 (no reference range) indexes the trailing unknown colour
+    return np.array(list(colors) + [unknown])[categories]
+
+
+def _plot_markers(ax, x, y, edgecolors):
+    """Draw all category-coloured markers of a series with a single scatter call"""
+    ax.scatter(x, y, s=MARKER_SIZE, facecolors='white', edgecolors=edgecolors, linewidths=2, zorder=3)
+
+
+def _points_to_draw(dates, series, budget, out_of_range):
+    """
+    Select the observations a chart draws.
+
+    Parameters:
+    -----------
+    dates : array-like
+        Observation dates, in ascending order.
+    series : list
+        Value arrays plotted against the dates.
+    budget : int
+        Number of points to aim for.
+    out_of_range : numpy.ndarray
+        Boolean mask of readings outside their reference range, these are always drawn.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Sorted indices of the observations to draw, all of them when the history fits the budget.
+    """
+    x = np.asarray(dates, dtype='datetime64[D]').astype(float)
+    return downsample.select_points(x, series, budget, keep=out_of_range)
+
+
+def _set_date_ticks(ax, x_centers, dates, rotation=45):
+    # Label at most MAX_XTICK_LABELS evenly spaced points so the labels stay readable and cheap to draw
+    step = max(1, int(np.ceil(len(x_centers) / MAX_XTICK_LABELS)))
+    ax.set_xticks(list(x_centers)[::step])
+    labels = np.asarray(dates, dtype='datetime64[D]')[::step].astype(object)
+    ax.set_xticklabels([date.strftime('%d-%m-%Y') for date in labels], rotation=rotation, ha='right', fontsize=9)
+
+
+@metrics.timed("charts.render_weight_height_bmi")
+def render_weight_height_bmi(weight_history, height_history, bmi_history, demographics, max_points=None):
+    """Render the weight, height and BMI chart as PNG bytes, or return None when there is no data"""
+    import matplotlib.font_manager as fm
+    import matplotlib.lines as mlines
+    from matplotlib.patches import Patch
     birthdate = demographics[2]
     gender = demographics[4]
 
-    weight_dates = []
-    weight_values = []
-    weight_indices = []
-    x_centers_weight = []
-
-    height_dates = []
-    height_values = []
-    height_indices = []
-    x_centers_height = []
-
-    bmi_dates = []
-    bmi_values = []
-    bmi_indices = []
-    x_centers_bmi = []
-
-    # Extract data from database
-    if(len(weight_history) >= len(height_history)):
-
-        extract_data = lambda history: ([entry['date'] for entry in history],
-                                        [float(entry['display'].split()[0]) for entry in history],
-                                        np.linspace(0, 1, len(history))) if history else ([], [], [])
-
-        weight_dates, weight_values, weight_indices = extract_data(weight_history)
-        bmi_dates, bmi_values, bmi_indices = extract_data(bmi_history)
-
-        height_dict = {entry['date']: float(entry['display'].split()[0]) for entry in height_history}
-        index = 0
-        for idx, weight_entry in enumerate(weight_history):
-            date = weight_entry['date']
-            if date in height_dict:
-                height_values.append(height_dict[date])
-                height_dates.append(date)
-                height_indices.append(index)
-                index += 1
-        height_indices = np.linspace(0, 1, len(height_indices))
-    else:
-        extract_data = lambda history: ([entry['date'] for entry in history],
-                                        [float(entry['display'].split()[0]) for entry in history],
-                                        np.linspace(0, 1, len(history))) if history else ([], [], [])
-
-        height_dates, height_values, height_indices = extract_data(height_history)
-        bmi_dates, bmi_values, bmi_indices = extract_data(bmi_history)
-
-        weight_dict = {entry['date']: float(entry['display'].split()[0]) for entry in weight_history}
-        index = 0
-        for idx, height_entry in enumerate(height_history):
-            date = height_entry['date']
-            if date in weight_dict:
-                weight_values.append(weight_dict[date])
-                weight_dates.append(date)
-                weight_indices.append(index)
-                index += 1
-
-    # Load csv files containing the data for bmi ranges
-    if gender == "female":
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-        female_bmi_path = os.path.join(data_dir, 'female_bmi.csv')
-        bmi_ranges_data = load_data(female_bmi_path)
-    else:
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-        male_bmi_path = os.path.join(data_dir, 'male_bmi.csv')
-        bmi_ranges_data = load_data(male_bmi_path)
+    weight_dates, weight_values = alignment.history_arrays(weight_history)
+    height_dates, height_values = alignment.history_arrays(height_history)
+    bmi_dates, bmi_values = alignment.history_arrays(bmi_history)
+
+    # With more heights than weights, only weights taken on a height date are plotted
+    if len(height_history) > len(weight_history):
+        on_height_date = alignment.match_dates(weight_dates, height_dates) >= 0
+        weight_dates, weight_values = weight_dates[on_height_date], weight_values[on_height_date]
 
     # Calculate BMI if it is not in the database and weight and height are
     if not bmi_history and weight_history and height_history:
-        weight_dict = {entry['date']: float(entry['display'].split()[0]) for entry in weight_history}
-        height_dict = {entry['date']: float(entry['display'].split()[0]) for entry in height_history}
+        bmi_dates, weights, heights = alignment.align(weight_history, height_history)
+        bmi_values = weights / ((heights / 100) ** 2)  # BMI formula
 
-        # Find common dates between weight and height histories
-        common_dates = sorted(set(weight_dict.keys()) & set(height_dict.keys()))
+    # Retrieve BMI ranges for the age at every BMI date
+    normal, overweight, obese = reference_ranges.bmi_thresholds(gender, calculate_ages(birthdate, bmi_dates))
+    bmi_categories = reference_ranges.classify(bmi_values, normal, overweight, obese)
 
-        for date in common_dates:
-            weight = weight_dict[date]
-            height = height_dict[date]
-            bmi = weight / ((height / 100) ** 2)  # BMI formula
-            bmi_values.append(bmi)
-            bmi_dates.append(date)
+    # Downsample long histories along the weight series, keeping every weight with an abnormal BMI that day
+    abnormal_bmi_dates = bmi_dates[(bmi_categories >= 0) & (bmi_categories != 1)]
+    shown = _points_to_draw(weight_dates, [weight_values], max_points or POINT_BUDGETS['weight_height_bmi'],
+                            alignment.match_dates(weight_dates, abnormal_bmi_dates) >= 0)
+    weight_dates, weight_values = weight_dates[shown], weight_values[shown]
 
-        bmi_indices = np.linspace(0, 1, len(bmi_values)) # Normalize
+    weight_indices = np.linspace(0, 1, len(weight_dates))  # Normalize
+    bmi_indices = np.linspace(0, 1, len(bmi_dates))
 
-    if weight_dates or height_dates or bmi_dates:
-        fig, ax1 = plt.subplots(figsize=(10, 5))
+    if len(weight_dates) or len(height_dates) or len(bmi_dates):
+        fig = _new_figure()
+        ax1 = fig.subplots()
 
         # Compute x-coordinates for weight data points
-        for i in range(len(weight_indices)):
-            x_start = weight_indices[i]
-            x_end = weight_indices[i] + 1 / len(weight_indices) if i == len(weight_indices) - 1 else weight_indices[
-                i + 1]
-            x_center = (x_start + x_end) / 2
-            x_centers_weight.append(x_center)
-
-        # Align height data points with corresponding weight dates
-        for i in range(len(height_dates)):
-            for j in range(len(weight_dates)):
-                if(weight_dates[j] == height_dates[i]):
-                    x_centers_height.append(x_centers_weight[j])
-
-        # Align BMI data points with corresponding weight dates
-        for i in range(len(bmi_dates)):
-            for j in range(len(weight_dates)):
-                if (weight_dates[j] == bmi_dates[i]):
-                    x_centers_bmi.append(x_centers_weight[j])
+        weight_starts, weight_ends = _interval_bounds(weight_indices)
+        x_centers_weight = (weight_starts + weight_ends) / 2
+
+        # Place height and BMI data points on the x-coordinate of the weight taken the same day
+        height_positions = alignment.match_dates(height_dates, weight_dates)
+        height_aligned = height_positions >= 0
+        x_centers_height = x_centers_weight[height_positions[height_aligned]]
+        bmi_positions = alignment.match_dates(bmi_dates, weight_dates)
+        bmi_aligned = bmi_positions >= 0
+        x_centers_bmi = x_centers_weight[bmi_positions[bmi_aligned]]
 
         # Plot height and weight data
         ax1.plot(x_centers_weight, weight_values, 'o-', linewidth=1.5, color='brown', label="Weight")
-        ax1.plot(x_centers_height, height_values, 'o-', linewidth=1.5, color='#004C99', label="Height")
-
-        # Add background color for BMI ranges
-        for i in range(len(bmi_dates)):
-            x_start = bmi_indices[i]
-            x_end = bmi_indices[i] + 1 / len(bmi_indices) if i == len(bmi_indices) - 1 else bmi_indices[i + 1]
-            date = bmi_dates[i]
-            age_at_date = client._calculate_age(birthdate, date)
-
-            # Retrieve BMI ranges for the provided age
-            bmi_row = get_bmi_ranges(bmi_ranges_data, age_at_date)
-            normal_scaled = (210 / 50) * float(bmi_row['normal'])
-            overweight_scaled = (210 / 50) * float(bmi_row['overweight'])
-            obese_scaled = (210 / 50) * float(bmi_row['obese'])
-
-            # Plot the background colors
-            ax1.fill([x_start, x_start, x_end, x_end], [0, normal_scaled, normal_scaled, 0], color='#BDD7F5',
-                    alpha=0.7)  # underweight
-            ax1.fill([x_start, x_start, x_end, x_end], [normal_scaled, overweight_scaled, overweight_scaled,
-                    normal_scaled], color='#C2DCC1', alpha=0.7)  # normal
-            ax1.fill([x_start, x_start, x_end, x_end], [overweight_scaled, obese_scaled, obese_scaled,
-                     overweight_scaled], color='#FFF2CC', alpha=0.7)  # overweight
-            ax1.fill([x_start, x_start, x_end, x_end], [obese_scaled, 210, 210, obese_scaled],
-                     color='#F8CECC', alpha=0.7)  # obese
+        ax1.plot(x_centers_height, height_values[height_aligned], 'o-', linewidth=1.5, color='#004C99',
+                 label="Height")
+
+        # Add background color for BMI ranges, scaled from the BMI axis to the weight/height axis
+        bmi_starts, bmi_ends = _interval_bounds(bmi_indices)
+        scale = 210 / 50
+        band_bounds = np.column_stack([np.zeros(len(bmi_dates)), normal * scale, overweight * scale,
+                                       obese * scale, np.full(len(bmi_dates), 210.0)])
+        _add_range_bands(ax1, bmi_starts, bmi_ends, band_bounds,
+                         ['#BDD7F5', '#C2DCC1', '#FFF2CC', '#F8CECC'])  # underweight, normal, overweight, obese
 
         # Plot the connecting line for BMI datapoints
         ax2 = ax1.twinx()
-        ax2.plot(x_centers_bmi, bmi_values, '-', linewidth=1.5, color='black', label="BMI")
-
-        for i in range(len(x_centers_bmi)):
-            x_center = x_centers_bmi[i]
-            bmi_data_point = bmi_values[i]
-
-            date = bmi_dates[i]
-            age_at_date = client._calculate_age(birthdate, date)
-
-            # Retrieve BMI ranges for the provided age
-            bmi_row = get_bmi_ranges(bmi_ranges_data, age_at_date)
-            normal = float(bmi_row['normal'])
-            overweight = float(bmi_row['overweight'])
-            obese = float(bmi_row['obese'])
-
-            # Plot individual bmi data points with corresponding color coding
-            if bmi_data_point < normal:
-                markeredgecolor = 'blue'  # Underweight
-            elif normal <= bmi_data_point < overweight:
-                markeredgecolor = 'green'  # Normal
-            elif overweight <= bmi_data_point < obese:
-                markeredgecolor = 'orange'  # Overweight
-            else:
-                markeredgecolor = 'red'  # Obese,
-
-            ax2.plot(x_center, bmi_data_point, 'o', markeredgecolor=markeredgecolor, markerfacecolor='white',
-                markersize=8, markeredgewidth=2)
+        bmi_array = bmi_values[bmi_aligned]
+        ax2.plot(x_centers_bmi, bmi_array, '-', linewidth=1.5, color='black', label="BMI")
+
+        # Plot individual bmi data points with corresponding color coding
+        markeredgecolors = _category_colors(bmi_categories[bmi_aligned], ['blue', 'green', 'orange', 'red'])  # Underweight .. Obese
+        _plot_markers(ax2, x_centers_bmi, bmi_array, markeredgecolors)
 
         # Customize labels
         legend_elements = [
@@ -215,9 +390,8 @@ def plot_weight_height_bmi(weight_history, height_history, bmi_history, demograp
         legend.get_frame().set_facecolor('#D3D3D3')
         legend.get_frame().set_edgecolor('black')
 
-        all_dates = sorted(set(weight_dates + height_dates + bmi_dates))
-        ax1.set_xticks(x_centers_weight)
-        ax1.set_xticklabels([date.strftime('%d-%m-%Y') for date in all_dates], rotation=45, ha='right', fontsize=9)
+        # The ticks sit on the weight dates
+        _set_date_ticks(ax1, x_centers_weight, weight_dates)
 
         ax1.set_ylabel("Weight (kg) & Height (cm)", fontsize=12)
         ax1.set_ylim(0, 210)
@@ -227,90 +401,56 @@ def plot_weight_height_bmi(weight_history, height_history, bmi_history, demograp
         ax2.set_yticks(range(0, 55, 5))
         ax1.set_title("Weight, Height & BMI", fontsize=16, fontweight='bold')
 
-        st.pyplot(fig)
-    else:
-        st.warning("No weight, height, or BMI data available")
-    return
+        return _figure_to_png(fig)
+    return None
 
-def get_glucose_ranges(data, measurement):
-    for row in data:
-        if (row['measurement']) == measurement:
-            return row
 
-def plot_blood_glucose_level(glucose_history, client):
+def plot_weight_height_bmi(weight_history, height_history, bmi_history, demographics, client):
+    image = _cached_render(render_weight_height_bmi, weight_history, height_history, bmi_history, demographics)
+    _show_chart(image, DASHBOARD_CHARTS['weight_height_bmi'][1])
+
+@metrics.timed("charts.render_blood_glucose_level")
+def render_blood_glucose_level(glucose_history, max_points=None):
+    """Render the blood glucose chart as PNG bytes, or return None when there is no data"""
+    import matplotlib.font_manager as fm
+    import matplotlib.lines as mlines
+    from matplotlib.patches import Patch
     if not glucose_history:
-        st.warning("No blood glucose data available")
-        return
+        return None
 
     # Extract dates and glucose values
-    dates = [entry['date'] for entry in glucose_history]
-    glucose_values = [float(entry['display'].split()[0]) for entry in glucose_history]
-    indices = np.linspace(0, 1, len(glucose_history))  # Normalize
-
-    ymin = min(min(glucose_values) - 50, 0)
-    ymax = max(max(glucose_values) + 50, 400)
-
-    fig, ax = plt.subplots(figsize=(10, 5))
-
-    # List to store x_center and glucose_values to plot the line later
-    x_centers = []
-    y_values = []
-
-    # Load glucose range data from CSV
-    data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-    file_path = os.path.join(data_dir, 'glucose_ranges.csv')
-    glucose_ranges_data = load_data(file_path)
-
-    for i in range(len(indices)):
-        x_start = indices[i]
-        x_end = indices[i] + 1 / len(indices) if i == len(indices) - 1 else indices[i + 1]
-
-        x_center = (x_start + x_end) / 2 # Calculate the midpoints for plotting
-
-        # Retrieve glucose ranges for the provided measurement
-        measurement = glucose_history[i]['measurement']
-        glucose_ranges = get_glucose_ranges(glucose_ranges_data, measurement)
-
-        # Determine the prediabetes and diabetes thresholds
-        prediabetes = float(glucose_ranges['prediabetes'])
-        diabetes = float(glucose_ranges['diabetes'])
-        # Plot the background colors
-        ax.fill([x_start, x_start, x_end, x_end], [ymin, prediabetes, prediabetes, ymin], color='#C2DCC1',
-                alpha=0.7)  # Normal
-        ax.fill([x_start, x_start, x_end, x_end], [prediabetes, diabetes, diabetes, prediabetes], color='#FFF2CC',
-                alpha=0.7)  # Prediabetic
-        ax.fill([x_start, x_start, x_end, x_end], [diabetes, ymax, ymax, diabetes], color='#F8CECC',
-                alpha=0.7)  # Diabetic
-
-        # Store x_center and glucose value for later plotting
-        x_centers.append(x_center)
-        glucose_value = glucose_values[i]
-        y_values.append(glucose_value)
+    dates, glucose_values = alignment.history_arrays(glucose_history)
+
+    # Determine the prediabetes and diabetes thresholds for the measurement of every reading,
+    # readings of a measurement without reference ranges get no background and a grey marker
+    prediabetes, diabetes = reference_ranges.glucose_thresholds([entry['measurement'] for entry in glucose_history])
+    categories = reference_ranges.classify(glucose_values, prediabetes, diabetes)
+
+    # Downsample long histories, prediabetic and diabetic readings are always drawn
+    shown = _points_to_draw(dates, [glucose_values], max_points or POINT_BUDGETS['glucose'], categories > 0)
+    dates, glucose_values, categories = dates[shown], glucose_values[shown], categories[shown]
+    prediabetes, diabetes = prediabetes[shown], diabetes[shown]
+    indices = np.linspace(0, 1, len(dates))  # Normalize
+
+    ymin = min(glucose_values.min() - 50, 0)
+    ymax = max(glucose_values.max() + 50, 400)
+
+    fig = _new_figure()
+    ax = fig.subplots()
+
+    # Plot the background colors
+    x_starts, x_ends = _interval_bounds(indices)
+    x_centers = (x_starts + x_ends) / 2  # Calculate the midpoints for plotting
+    band_bounds = np.column_stack([np.full(len(indices), ymin), prediabetes, diabetes, np.full(len(indices), ymax)])
+    _add_range_bands(ax, x_starts, x_ends, band_bounds,
+                     ['#C2DCC1', '#FFF2CC', '#F8CECC'])  # Normal, Prediabetic, Diabetic
 
     # Plot the blood glucose datapoints
-    ax.plot(x_centers, y_values, '-', linewidth=1.5, color='black')
-
-    for i in range(len(indices)):
-        x_center = x_centers[i]
-        glucose_value = glucose_values[i]
-        measurement = glucose_history[i]['measurement']
-        row = get_glucose_ranges(glucose_ranges_data, measurement)
-
-        # Determine the prediabetes and diabetes thresholds
-        prediabetes = float(row['prediabetes'])
-        diabetes = float(row['diabetes'])
-
-        # Assign marker colors based on glucose level category
-        if glucose_value < prediabetes:
-            markeredgecolor = 'green'  # Normal
-        elif prediabetes <= glucose_value < diabetes:
-            markeredgecolor = 'orange'  # Prediabetes
-        else:
-            markeredgecolor = 'red'  # Diabetes
+    ax.plot(x_centers, glucose_values, '-', linewidth=1.5, color='black')
 
-        # Plot individual glucose data points with corresponding color coding
-        ax.plot(x_center, glucose_value, 'o', markeredgecolor=markeredgecolor, markerfacecolor='white',
-                markersize=8, markeredgewidth=2, label=measurement)
+    # Assign marker colors based on glucose level category
+    markeredgecolors = _category_colors(categories, ['green', 'orange', 'red'])  # Normal, Prediabetes, Diabetes
+    _plot_markers(ax, x_centers, glucose_values, markeredgecolors)
 
     # Customize legend
     legend_elements = [
@@ -330,108 +470,64 @@ def plot_blood_glucose_level(glucose_history, client):
     legend.get_frame().set_facecolor('#D3D3D3')
     legend.get_frame().set_edgecolor('black')
 
-    ax.set_xticks(x_centers)
-    if (len(glucose_history) > 40):
+    if (len(dates) > 40):
         rotation = 90
     else:
         rotation = 45
-    ax.set_xticklabels([date.strftime('%d-%m-%Y') for date in dates], rotation=rotation, ha='right', fontsize=9)
+    _set_date_ticks(ax, x_centers, dates, rotation=rotation)
 
     ax.set_ylabel("Blood Glucose Level (mg/dL)", fontsize=12)
     ax.set_ylim(ymin, ymax)
     ax.grid(True, axis='x', linestyle='--', alpha=0.6)
     ax.set_title("Blood Glucose Levels", fontsize=16, fontweight='bold')
 
-    st.pyplot(fig)
+    return _figure_to_png(fig)
 
-def get_bp_ranges(bp_ranges_data, age):
-    age = int(age)
-    for row in bp_ranges_data:
-        if age <= int(row['age']):
-            return row
-    return bp_ranges_data[-1] # Return last row if age > 64
 
-def plot_blood_pressure(systolic_history, diastolic_history, demographics, client):
+def plot_blood_glucose_level(glucose_history, client):
+    _show_chart(_cached_render(render_blood_glucose_level, glucose_history), DASHBOARD_CHARTS['glucose'][1])
+
+@metrics.timed("charts.render_blood_pressure")
+def render_blood_pressure(systolic_history, diastolic_history, demographics, max_points=None):
+    """Render the blood pressure chart as PNG bytes, or return None when there is no data"""
+    import matplotlib.font_manager as fm
+    import matplotlib.lines as mlines
     if not systolic_history or not diastolic_history:
-        st.warning("No blood pressure data available")
-        return
+        return None
 
-    # Extract data from database
+    # Pair the systolic and diastolic readings taken on the same day
     birthdate = demographics[2]
-    systolic_dict = {entry['date']: float(entry['display'].split()[0]) for entry in systolic_history}
-    diastolic_dict = {entry['date']: float(entry['display'].split()[0]) for entry in diastolic_history}
-    common_dates = sorted(set(systolic_dict.keys()) & set(diastolic_dict.keys()))
+    dates, systolic_values, diastolic_values = alignment.align(systolic_history, diastolic_history)
 
-    dates = []
-    systolic_values = []
-    diastolic_values = []
-    x_centers = []
+    sys_low, sys_elevated, dia_low, dia_elevated = reference_ranges.bp_thresholds(calculate_ages(birthdate, dates))
+    systolic_categories = reference_ranges.classify(systolic_values, sys_low, sys_elevated)
+    diastolic_categories = reference_ranges.classify(diastolic_values, dia_low, dia_elevated)
 
-    for date in common_dates:
-        dates.append(date)
-        systolic_values.append(systolic_dict[date])
-        diastolic_values.append(diastolic_dict[date])
+    # Downsample long histories, readings where either pressure is low or elevated are always drawn
+    shown = _points_to_draw(dates, [systolic_values, diastolic_values], max_points or POINT_BUDGETS['blood_pressure'],
+                            (systolic_categories != 1) | (diastolic_categories != 1))
+    dates, systolic_values, diastolic_values = dates[shown], systolic_values[shown], diastolic_values[shown]
+    systolic_categories, diastolic_categories = systolic_categories[shown], diastolic_categories[shown]
 
     indices = np.linspace(0, 1, len(dates))
+    x_starts, x_ends = _interval_bounds(indices)
+    x_centers = (x_starts + x_ends) / 2
 
-    for i in range(len(indices)):
-        x_start = indices[i]
-        x_end = indices[i] + 1 / len(indices) if i == len(indices) - 1 else indices[
-            i + 1]
-        x_center = (x_start + x_end) / 2
-        x_centers.append(x_center)
-
-    # Load BP ranges from CSV
-    data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-    file_path = os.path.join(data_dir, 'bp_ranges.csv')
-    bp_ranges_data = load_data(file_path)
+    ymin = min(diastolic_values.min() - 50, 40) if len(dates) else 40
+    ymax = max(systolic_values.max() + 50, 200) if len(dates) else 200
 
-    ymin = min(min(diastolic_values) - 50, 40)
-    ymax = max(max(systolic_values) + 50, 200)
-
-    fig, ax = plt.subplots(figsize=(10, 5))
+    fig = _new_figure()
+    ax = fig.subplots()
     ax.set_facecolor('#D3D3D3')
 
     # Plot BP points
     ax.plot(x_centers, systolic_values, '-', linewidth=2, color='black')
     ax.plot(x_centers, diastolic_values, '-', linewidth=2, color='brown')
 
-    for i in range(len(dates)):
-        x_center = x_centers[i]
-        sys_value = systolic_values[i]
-        dia_value = diastolic_values[i]
-
-        age = client._calculate_age(birthdate, dates[i])
-        ranges_data = get_bp_ranges(bp_ranges_data, age)
-
-        sys_low = float(ranges_data['systolic low'])
-        sys_elevated = float(ranges_data['systolic elevated'])
-
-        dia_low = float(ranges_data['diastolic low'])
-        dia_elevated = float(ranges_data['diastolic elevated'])
-
-        # Assign marker colors based on glucose level category
-        if sys_value < sys_low:
-            markeredgecolor = 'blue'  # Low
-        elif sys_low <= sys_value < sys_elevated:
-            markeredgecolor = 'green'  # Normal
-        else:
-            markeredgecolor = 'red'  # Elevated
-
-        # Plot individual systolic bp data points with corresponding color coding
-        ax.plot(x_center, sys_value, 'o', markeredgecolor=markeredgecolor, markerfacecolor='white',
-                markersize=8, markeredgewidth=2)
-
-        if dia_value < dia_low:
-            markeredgecolor = 'blue'  # Low
-        elif dia_low <= dia_value < dia_elevated:
-            markeredgecolor = 'green'  # Normal
-        else:
-            markeredgecolor = 'red'  # Elevated
-
-        # Plot individual systolic bp data points with corresponding color coding
-        ax.plot(x_center, dia_value, 'o', markeredgecolor=markeredgecolor, markerfacecolor='white',
-                markersize=8, markeredgewidth=2)
+    # Plot individual systolic and diastolic bp data points with corresponding color coding
+    for values, categories in ((systolic_values, systolic_categories), (diastolic_values, diastolic_categories)):
+        markeredgecolors = _category_colors(categories, ['blue', 'green', 'red'])  # Low, Normal, Elevated
+        _plot_markers(ax, x_centers, values, markeredgecolors)
 
     # Legend
     legend_elements = [
@@ -452,103 +548,64 @@ def plot_blood_pressure(systolic_history, diastolic_history, demographics, clien
     legend.get_frame().set_facecolor('#D3D3D3')
     legend.get_frame().set_edgecolor('black')
 
-    ax.set_xticks(x_centers)
-    ax.set_xticklabels([date.strftime('%d-%m-%Y') for date in dates], rotation=45, ha='right', fontsize=9)
+    _set_date_ticks(ax, x_centers, dates)
     ax.set_ylabel("Blood Pressure (mmHg)", fontsize=12)
     ax.set_ylim(ymin, ymax)
     ax.grid(True, axis='x', linestyle='--', alpha=0.6)
     ax.set_title("Blood Pressure Levels", fontsize=16, fontweight='bold')
 
-    st.pyplot(fig)
+    return _figure_to_png(fig)
 
-def get_hr_ranges(hr_ranges_data, age):
-    age = int(age)
-    for row in hr_ranges_data:
-        if age <= int(row['age']):
-            return row
-    return hr_ranges_data[-1] # Return last row if age > 65
 
-def plot_heart_rate(hr_history, demographics, client):
+def plot_blood_pressure(systolic_history, diastolic_history, demographics, client):
+    image = _cached_render(render_blood_pressure, systolic_history, diastolic_history, demographics)
+    _show_chart(image, DASHBOARD_CHARTS['blood_pressure'][1])
+
+@metrics.timed("charts.render_heart_rate")
+def render_heart_rate(hr_history, demographics, max_points=None):
+    """Render the heart rate chart as PNG bytes, or return None when there is no data"""
+    import matplotlib.font_manager as fm
+    import matplotlib.lines as mlines
+    from matplotlib.patches import Patch
     if not hr_history:
-        st.warning("No heart rate data available")
-        return
+        return None
 
     birthdate = demographics[2]
     gender = demographics[4]
 
     # Extract dates and heart rate values
-    dates = [entry['date'] for entry in hr_history]
-    hr_values = [float(entry['display'].split()[0]) for entry in hr_history]
-    indices = np.linspace(0, 1, len(hr_history))  # Normalize
-
-    ymin = min(min(hr_values) - 50, 0)
-    ymax = max(max(hr_values) + 50, 150)
-
-    fig, ax = plt.subplots(figsize=(10, 5))
-
-    x_centers = []
-    for i in range(len(indices)):
-        x_start = indices[i]
-        x_end = indices[i] + 1 / len(indices) if i == len(indices) - 1 else indices[
-            i + 1]
-        x_center = (x_start + x_end) / 2
-        x_centers.append(x_center)
-
-    if gender == "female":
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-        female_hr_path = os.path.join(data_dir, 'female_hr_ranges.csv')
-        hr_ranges_data = load_data(female_hr_path)
-    else:
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
-        male_hr_path = os.path.join(data_dir, 'male_hr_ranges.csv')
-        hr_ranges_data = load_data(male_hr_path)
+    dates, hr_values = alignment.history_arrays(hr_history)
+
+    # Retrieve HR ranges for the age at every date
+    low, elevated = reference_ranges.hr_thresholds(gender, calculate_ages(birthdate, dates))
+    categories = reference_ranges.classify(hr_values, low, elevated)
 
-    ax.plot(x_centers, hr_values, 'o-', linewidth=2, color='black')
+    # Downsample long histories, low and elevated readings are always drawn
+    shown = _points_to_draw(dates, [hr_values], max_points or POINT_BUDGETS['heart_rate'],
+                            (categories == 0) | (categories == 2))
+    dates, hr_values, categories = dates[shown], hr_values[shown], categories[shown]
+    low, elevated = low[shown], elevated[shown]
+    indices = np.linspace(0, 1, len(dates))  # Normalize
+
+    ymin = min(hr_values.min() - 50, 0)
+    ymax = max(hr_values.max() + 50, 150)
+
+    fig = _new_figure()
+    ax = fig.subplots()
+
+    x_starts, x_ends = _interval_bounds(indices)
+    x_centers = (x_starts + x_ends) / 2
 
     # Add background color for HR ranges
-    for i in range(len(dates)):
-        x_start = indices[i]
-        x_end = indices[i] + 1 / len(indices) if i == len(indices) - 1 else indices[i + 1]
-        date = dates[i]
-        age_at_date = client._calculate_age(birthdate, date)
-
-        # Retrieve BMI ranges for the provided age
-        hr_ranges = get_hr_ranges(hr_ranges_data, age_at_date)
-        low = float(hr_ranges['low'])
-        elevated = float(hr_ranges['elevated'])
-
-        # Plot the background colors
-        ax.fill([x_start, x_start, x_end, x_end], [ymin, low, low, ymin], color='#BDD7F5',
-                 alpha=0.7)  # Low
-        ax.fill([x_start, x_start, x_end, x_end], [low, elevated, elevated, low], color='#C2DCC1', alpha=0.7)  # Normal
-        ax.fill([x_start, x_start, x_end, x_end], [elevated, ymax, ymax, elevated],
-                 color='#F8CECC', alpha=0.7)  # Elevated
+    band_bounds = np.column_stack([np.full(len(dates), ymin), low, elevated, np.full(len(dates), ymax)])
+    _add_range_bands(ax, x_starts, x_ends, band_bounds, ['#BDD7F5', '#C2DCC1', '#F8CECC'])  # Low, Normal, Elevated
 
     # Plot the connecting line for hr datapoints
     ax.plot(x_centers, hr_values, '-', linewidth=2, color='black')
 
-    for i in range(len(dates)):
-        x_center = x_centers[i]
-        hr_value = hr_values[i]
-        date = dates[i]
-        age_at_date = client._calculate_age(birthdate, date)
-
-        # Retrieve HR ranges for the provided age
-        hr_ranges = get_hr_ranges(hr_ranges_data, age_at_date)
-        low = float(hr_ranges['low'])
-        elevated = float(hr_ranges['elevated'])
-
-        # Assign marker colors based on heart rate ranges
-        if hr_value < low:
-            markeredgecolor = 'blue'  # Low
-        elif low <= hr_value < elevated:
-            markeredgecolor = 'green'  # Normal
-        else:
-            markeredgecolor = 'red'  # Elevated
-
-        # Plot individual hr data points with corresponding color coding
-        ax.plot(x_center, hr_value, 'o', markeredgecolor=markeredgecolor, markerfacecolor='white',
-                markersize=8, markeredgewidth=2)
+    # Assign marker colors based on heart rate ranges
+    markeredgecolors = _category_colors(categories, ['blue', 'green', 'red'])  # Low, Normal, Elevated
+    _plot_markers(ax, x_centers, hr_values, markeredgecolors)
 
     legend_elements = [
         mlines.Line2D([], [], color='black', markeredgecolor='red', marker='o',
@@ -567,14 +624,40 @@ def plot_heart_rate(hr_history, demographics, client):
     legend.get_frame().set_facecolor('#D3D3D3')
     legend.get_frame().set_edgecolor('black')
 
-    ax.set_xticks(x_centers)
-    ax.set_xticklabels([date.strftime('%d-%m-%Y') for date in dates], rotation=45, ha='right', fontsize=9)
+    _set_date_ticks(ax, x_centers, dates)
     ax.set_ylabel("Heart Rate (bpm)", fontsize=12)
     ax.set_ylim(ymin, ymax)
     ax.grid(True, axis='x', linestyle='--', alpha=0.6)
     ax.set_title("Heart Rate", fontsize=16, fontweight='bold')
 
-    st.pyplot(fig)
+    return _figure_to_png(fig)
+
+
+def plot_heart_rate(hr_history, demographics, client):
+    _show_chart(_cached_render(render_heart_rate, hr_history, demographics), DASHBOARD_CHARTS['heart_rate'][1])
+
+
+# Charts of the patient dashboard: name -> (renderer, message shown when there is no data)
+DASHBOARD_CHARTS = {
+    'weight_height_bmi': (render_weight_height_bmi, "No weight, height, or BMI data available"),
+    'glucose': (render_blood_glucose_level, "No blood glucose data available"),
+    'blood_pressure': (render_blood_pressure, "No blood pressure data available"),
+    'heart_rate': (render_heart_rate, "No heart rate data available")
+}
+
+# Patient summary fields passed to each dashboard chart renderer, see FHIRClient.get_patient_summary
+DASHBOARD_CHART_FIELDS = {
+    'weight_height_bmi': ('weight_history', 'height_history', 'bmi_history', 'demographics'),
+    'glucose': ('glucose_history',),
+    'blood_pressure': ('systolic_bp_history', 'diastolic_bp_history', 'demographics'),
+    'heart_rate': ('hr_history', 'demographics')
+}
+
+
+def dashboard_chart_args(summary):
+    """Return the render_charts arguments of every dashboard chart for a patient summary"""
+    return {name: tuple(summary[field] for field in fields) for name, fields in DASHBOARD_CHART_FIELDS.items()}
+
 
 
 
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Pick the points of a series to draw with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points in between are split
+    into n_out - 2 equally sized buckets, and from each bucket LTTB keeps the
+    point that forms the largest triangle with two others. Those are the point
+    kept from the previous bucket and the mean of the next bucket. Peaks and
+    troughs survive, so the shape of the line is preserved with far fewer points.
+
+    Parameters:
+    -----------
+    x, y : numpy.ndarray
+        Coordinates of the series, x in ascending order.
+    n_out : int
+        Number of points to keep, at least 3.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Sorted indices of the kept points. Runs in O(len(x)): one vectorised area
+        computation per bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    n_out = max(int(n_out), 3)
+    if n <= n_out:
+        return np.arange(n)
+
+    # Bucket b covers the points edges[b]:edges[b + 1]; the first and last points are buckets of their own
+    edges = np.concatenate(([0], np.linspace(1, n - 1, n_out - 1).astype(int), [n]))
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / counts
+    mean_y = np.add.reduceat(y, edges[:-1]) / counts
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(1, n_out - 1):
+        start, end = edges[bucket], edges[bucket + 1]
+        ax, ay = x[previous], y[previous]
+        cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+        # Twice the triangle area, the constant factor does not change the argmax
+        areas = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        previous = start + int(np.argmax(areas))
+        selected[bucket] = previous
+    return selected
+
+
+def select_points(x, ys, budget, keep=None):
+    """
+    Choose which observations of one or more series sharing an x-axis to draw.
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        Shared x-coordinates, in ascending order.
+    ys : list
+        One y array per series, e.g. systolic and diastolic pressure.
+    budget : int
+        Number of points to aim for.
+    keep : numpy.ndarray, optional
+        Boolean mask of observations that must be drawn whatever the budget, such as
+        out-of-range readings.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Sorted indices of the observations to draw. The budget left after the
+        forced observations is shared between the series, and each series is
+        reduced with LTTB. The result can exceed the budget when more
+        observations are forced than the budget allows.
+    """
+    n = len(x)
+    if n <= budget:
+        return np.arange(n)
+
+    forced = np.flatnonzero(keep) if keep is not None else np.array([], dtype=int)
+    per_series = max((budget - len(forced)) // len(ys), 3)
+    chosen = [forced] + [lttb(x, y, per_series) for y in ys]
+    return np.unique(np.concatenate(chosen))
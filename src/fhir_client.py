@@ -1,14 +1,155 @@
 import json
-from datetime import date, datetime
-JSON_DATABASE = 'data/json_database.json'
+import os
+import sys
+import threading
+from datetime import date, datetime, time
+from operator import attrgetter
+import numpy as np
+from src import metrics
+# Patient database, overridable to point the app and tools at a synthetic population
+JSON_DATABASE = os.getenv("CARDICARE_DATABASE", 'data/json_database.json')
 fullUrl = "http://tutsgnfhir.com"
 
+
+def calculate_ages(born, reference_dates):
+    """
+    Compute the age in whole years at every reference date in one vectorized operation.
+
+    Parameters:
+    -----------
+    born : str or datetime
+        Birthdate, as a '%d-%m-%Y' string (the format of get_demographics) or a datetime.
+    reference_dates : array-like
+        Observation dates as datetimes or datetime64 values.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Integer ages, one per reference date.
+    """
+    if isinstance(born, str):
+        born = datetime.strptime(born, '%d-%m-%Y')
+
+    dates = np.asarray(reference_dates, dtype='datetime64[D]')
+    years = dates.astype('datetime64[Y]').astype(int) + 1970
+    months = dates.astype('datetime64[M]').astype(int) % 12 + 1
+    days = (dates - dates.astype('datetime64[M]')).astype(int) + 1
+    before_birthday = months * 100 + days < born.month * 100 + born.day
+    return years - born.year - before_birthday
+
+
+class Observation(object):
+    """
+    One reading of an observation history.
+
+    A slotted record instead of a dict: histories hold one per reading, so the per-key
+    dict and the two formatted strings every reading used to carry add up. The unit,
+    name and measurement strings are interned and shared by all readings, and
+    formatted_date and display are computed when they are read.
+
+    Records also support the read-only dict access the dashboard, reports and charts
+    use: observation['value'], observation.get('formatted_date', '') and 'value' in
+    observation.
+    """
+
+    __slots__ = ('date', 'value', 'unit', 'name', 'measurement', 'display_unit')
+
+    KEYS = ('date', 'value', 'unit', 'formatted_date', 'display', 'name', 'measurement')
+
+    def __init__(self, date, value, unit, name, measurement, display_unit):
+        self.date = date
+        self.value = value
+        self.unit = unit
+        self.name = name
+        self.measurement = measurement
+        # The unit the history is displayed in, which the reading's own unit may spell differently
+        self.display_unit = display_unit
+
+    @property
+    def formatted_date(self):
+        return self.date.strftime('%d-%m-%Y')
+
+    @property
+    def display(self):
+        return f"{self.value:.2f} {self.display_unit}"
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def keys(self):
+        return list(self.KEYS)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    def __repr__(self):
+        return f"Observation({self.to_dict()!r})"
+
+
+class ObservationHistory(list):
+    """
+    A date-ordered list of Observation records.
+
+    A plain list otherwise; unlike one it can be referenced weakly, so the chart
+    cache can remember its digest without keeping it alive.
+    """
+
+    __slots__ = ('__weakref__',)
+
+
+def _intern(text):
+    return sys.intern(text) if isinstance(text, str) else text
+
+
 class FHIRClient(object):
     def __init__(self, server_url, json_path):
         self.server_url = server_url
         self.json_path = json_path
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def _file_version(self):
+        return os.stat(self.json_path).st_mtime_ns if os.path.exists(self.json_path) else 0
+
+    def reload(self):
+        """
+        (Re)read the JSON database.
+
+        data_version is the modification time of the file that was read, so caches of
+        patient data can tell which of two clients holds newer data. It is set after
+        the data, so a reader that sees the new version also sees the new data.
+        """
+        data_version = self._file_version()
         self.patient_data = self._load_json_data()
         self.patient_ids = self._get_patient_ids()
+        self.data_version = data_version
+
+    def reload_if_changed(self):
+        """
+        Reload the JSON database if the file has been replaced since it was read.
+
+        A client shared by several sessions calls this on every run; only one caller
+        reloads and a file that has disappeared leaves the loaded data in place.
+
+        Returns:
+        --------
+        bool
+            True if the data was reloaded.
+        """
+        with self._reload_lock:
+            file_version = self._file_version()
+            if not file_version or file_version == self.data_version:
+                return False
+            self.reload()
+            return True
 
     def _load_json_data(self):
         try:
@@ -25,6 +166,7 @@ class FHIRClient(object):
             id_list.append(id)
         return id_list
     
+    @metrics.timed("fhir.bundle_scan")
     def get_all_patient_data(self, patient_id):
         request_url = f"{self.server_url}/Patient/{patient_id}"
         for patient in self.patient_data:
@@ -32,6 +174,7 @@ class FHIRClient(object):
                 return patient
         return None
     
+    @metrics.timed("fhir.get_demographics")
     def get_demographics(self, patient_id):
         request_url = f"{self.server_url}/Patient/{patient_id}"
         for patient in self.patient_data:
@@ -59,6 +202,21 @@ class FHIRClient(object):
     def get_all_patient_ids(self):
         """Return list of all patient IDs"""
         return self.patient_ids
+
+    def get_panel_patient_ids(self, practitioner_id):
+        """Return IDs of the patients whose generalPractitioner references the given practitioner"""
+        if not practitioner_id:
+            return []
+        reference = f"Practitioner/{practitioner_id}"
+        panel = []
+        for patient in self.patient_data:
+            resource = patient[0]['resource']
+            if resource['resourceType'] != 'Patient':
+                continue
+            if any(practitioner.get('reference', '').endswith(reference)
+                   for practitioner in resource.get('generalPractitioner', [])):
+                panel.append(resource['id'])
+        return panel
     
     def _get_coding(self, resource):
         """
@@ -86,7 +244,7 @@ class FHIRClient(object):
         """
         Append FHIR observation data to a list of observations.
         This method extracts relevant information from a FHIR observation resource 
-        and adds it to the provided observations list in a structured format.
+        and adds it to the provided observations list as an Observation record.
         Args:
             observations (list): List to append the observation data to
             resource (dict): FHIR observation resource containing the data
@@ -96,26 +254,24 @@ class FHIRClient(object):
             list: Updated observations list with the new observation appended
         Note:
             The resource is expected to contain 'valueQuantity' and 'effectiveDateTime' fields.
-            The formatted observation includes the date, value, unit, a formatted date string,
-            a display string, the observation name, and the measurement.
+            The record holds the date, value, unit, the observation name and the measurement,
+            and formats the date and the display string on access.
         """
         
-        value = resource['valueQuantity'].get('value')
-        observation_unit = resource['valueQuantity'].get('unit', unit)
-        date_str = resource['effectiveDateTime']
-        observation_date = datetime.strptime(date_str, '%Y-%m-%d')
-        measurement = resource['code']['coding'][0].get('display')
-        observations.append({
-            'date': observation_date,
-            'value': value,
-            'unit': observation_unit,
-            'formatted_date': observation_date.strftime('%d-%m-%Y'),
-            'display': f"{value:.2f} {unit}",
-            'name': name,
-            'measurement': measurement
-        })
+        value_quantity = resource['valueQuantity']
+        observations.append(Observation(
+            # Only the YYYY-MM-DD part is kept, so every date is naive midnight and a timestamp with an offset
+            # cannot make the date sort compare aware and naive values; fromisoformat is far faster than strptime
+            date=datetime.combine(date.fromisoformat(resource['effectiveDateTime'][:10]), time()),
+            value=value_quantity.get('value'),
+            unit=_intern(value_quantity.get('unit', unit)),
+            name=_intern(name),
+            measurement=_intern(resource['code']['coding'][0].get('display')),
+            display_unit=_intern(unit)
+        ))
         return observations
         
+    @metrics.timed("fhir.observation_history")
     def _get_observation_history(self, patient_id, observation_codes, default_unit='', name=''):
         """
         Retrieves observation history for a patient with the specified observation codes.
@@ -133,16 +289,16 @@ class FHIRClient(object):
             Name of the observation to filter by display name. Defaults to empty string.
         Returns:
         -------
-        list
-            A list of dictionaries containing observation data, sorted by date.
-            Each dictionary contains date, value, and unit information.
+        ObservationHistory
+            A list of Observation records, sorted by date.
+            Each record contains date, value, and unit information.
             Returns an empty list if patient data is not found or no matching observations exist.
         """
         patient_data = self.get_all_patient_data(patient_id)
-        observations = []
+        observations = ObservationHistory()
         
         if not patient_data:
-            return []
+            return observations
         
         for entry in patient_data:
             if 'resource' not in entry:
@@ -176,7 +332,7 @@ class FHIRClient(object):
                 continue
 
             observations = self._append_observation_data(observations, resource=resource, unit=default_unit, name=name)
-        observations.sort(key=lambda x: x['date'])
+        observations.sort(key=attrgetter('date'))
         return observations
     
     def get_weight_history(self, patient_id):
@@ -364,3 +520,31 @@ class FHIRClient(object):
                     return True
         return False
 
+
+    @metrics.timed("fhir.get_patient_summary")
+    def get_patient_summary(self, patient_id):
+        """
+        Collect everything the patient dashboard and reports show for one patient.
+
+        Returns:
+        --------
+        dict
+            Demographics, every vital-sign history, the latest cholesterol and systolic
+            BP values and the treatment, smoking and diabetes flags.
+        """
+        return {
+            "demographics": self.get_demographics(patient_id),
+            "weight_history": self.get_weight_history(patient_id),
+            "height_history": self.get_height_history(patient_id),
+            "bmi_history": self.get_bmi_history(patient_id),
+            "glucose_history": self.get_glucose_history(patient_id),
+            "systolic_bp_history": self.get_systolic_blood_pressure_history(patient_id),
+            "diastolic_bp_history": self.get_diastolic_blood_pressure_history(patient_id),
+            "hr_history": self.get_heart_rate_history(patient_id),
+            "total_chol": self.get_latest_total_cholesterol(patient_id),
+            "hdl_chol": self.get_latest_hdl_cholesterol(patient_id),
+            "systolic_bp": self.get_latest_systolic_bp(patient_id),
+            "is_treated_bp": self.is_patient_on_bp_medication(patient_id),
+            "is_smoker": self.is_patient_smoker(patient_id),
+            "has_diabetes": self.does_patient_have_diabetes(patient_id)
+        }
@@ -1,53 +1,300 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-from statsmodels.tsa.arima.model import ARIMA
+from src import metrics
+from src.arima_order import get_order
+
+# Features offered for forecasting in the dashboard and precomputed by the batch engine
+FORECAST_FEATURES = [
+    "bmi",
+    "weight",
+    "heart_rate",
+    "Systolic blood pressure",
+    "Diastolic blood pressure"
+]
+
+# Forecast modes offered in the dashboard, keyed by their display label
+FORECAST_MODES = {
+    "Auto": "auto",
+    "Fast (exponential smoothing)": "fast",
+    "ARIMA": "arima"
+}
+
+# Used when automatic order selection cannot fit any candidate
+DEFAULT_ORDER = (1, 1, 2)
+# Series shorter than this are forecast with exponential smoothing only, ARIMA is not worth its cost
+MIN_ARIMA_POINTS = 10
+# Seconds the auto mode waits for ARIMA before settling for the smoothing forecast
+DEFAULT_LATENCY_BUDGET = 2.0
+
+# Smoothing parameter grid searched by holt_forecast
+_ALPHA_GRID = np.linspace(0.1, 0.9, 9)
+_BETA_GRID = np.linspace(0.05, 0.5, 10)
+
+# Forecasting dataset, one row per (patient name, feature, date) observation
+DATASET_PATH = os.path.join(os.path.dirname(__file__), "out.csv")
+
+# Threads fitting ARIMA for the auto mode
+ARIMA_WORKERS = 2
+
+# ARIMA fits that outlive their latency budget keep running here instead of blocking the caller
+_arima_executor = ThreadPoolExecutor(max_workers=ARIMA_WORKERS, thread_name_prefix="arima")
+# Submitted fits that have not finished, by (patient, feature, steps, series length)
+_arima_fits = {}
+_arima_fits_lock = threading.Lock()
+
+_PATIENT_NAMES = ['Ruth C. Black', 'Sophia Reynolds', 'Amy C. Morgan', 'Sarah Y. Graham', 'Billie H. Himston',
+                  'Mary C. Long', 'Ruth C. Cook', 'Thomas Q. Moore', 'Steve Richey', 'Yolanda Warren',
+                  'Paul Luttrell', 'Kimberly Revis', 'Angela Montgomery', 'Amy R. Lee', 'Philip Jones',
+                  'Tiffany Westin', 'Kristyn Walker', 'George McKay', 'Michelle Z. Harris', 'Kimberly S. Moore',
+                  'Donna G. Wilson', 'Carl U. Lee', 'Anthony X. Shaw', 'Anthony Z. Coleman', 'Charles B. Williams',
+                  'Kevin H. Lee', 'Michael I. Lewis', 'Joseph P. Shaw', 'Michelle T. Wilson', 'Sharon P. Green',
+                  'Karen L. Lewis', 'Steven F. Coleman', 'Lisa U. Young', 'Dorothy I. Owens',
+                  'Christopher T. Sherman', 'Penny M. Love', 'Michael J. Peters', 'Mildred E. Hoffman',
+                  'Joshua H. Hill', 'Joshua U. Diaz', 'Amy V. Shaw', 'Joseph I. Ross', 'Robert P. Hill',
+                  'Patrick G. Taylor', 'Joshua P. Williams', 'Carol U. Hughes', 'Daniel A. Johnson',
+                  'Brian Q. Gracia', 'Stephan P. Graham', 'Daniel X. Adams']
+_PATIENT_IDS = ['665677', '6666001', '724111', '731673', '7321938', '736230', '765583', '767980', '7777701',
+                '7777702', '7777703', '7777704', '7777705', '880378', '8888801', '8888802', '8888803', '8888804',
+                '629528', '640264', '644201', '1768562', '1796238', '1869612', '1951076', '2004454', '2042917',
+                '2080416', '2081539', '2113340', '2169591', '2347217', '2354220', '2502813', '4444001', '5555001',
+                '5555002', '5555003', '613876', '621799', '1032702', '1081332', '1098667', '1134281', '1137192',
+                '1157764', '1186747', '1213208', '1272431', '1288992']
+
+
+@lru_cache(maxsize=1)
+def _load_dataset():
+    """Read the forecasting dataset once per process."""
+    return pd.read_csv(DATASET_PATH)
+
+def get_dataset_version():
+    """Return the modification time of the forecasting dataset in nanoseconds, or None if it is missing"""
+    try:
+        return os.stat(DATASET_PATH).st_mtime_ns
+    except OSError:
+        return None
 
 def get_feature_list():
-    csv_path = os.path.join(os.path.dirname(__file__), "out.csv")
-    df = pd.read_csv(csv_path)
+    df = _load_dataset()
     return df["Features"].unique().tolist()
 
+def get_forecast_patient_ids():
+    """Return the IDs of all patients that have a series in the forecasting dataset"""
+    return list(_PATIENT_IDS)
+
 def get_patient_name_by_id(patient_id):
-    only_name_list = ['Ruth C. Black', 'Sophia Reynolds', 'Amy C. Morgan', 'Sarah Y. Graham', 'Billie H. Himston',
-                      'Mary C. Long', 'Ruth C. Cook', 'Thomas Q. Moore', 'Steve Richey', 'Yolanda Warren',
-                      'Paul Luttrell', 'Kimberly Revis', 'Angela Montgomery', 'Amy R. Lee', 'Philip Jones',
-                      'Tiffany Westin', 'Kristyn Walker', 'George McKay', 'Michelle Z. Harris', 'Kimberly S. Moore',
-                      'Donna G. Wilson', 'Carl U. Lee', 'Anthony X. Shaw', 'Anthony Z. Coleman', 'Charles B. Williams',
-                      'Kevin H. Lee', 'Michael I. Lewis', 'Joseph P. Shaw', 'Michelle T. Wilson', 'Sharon P. Green',
-                      'Karen L. Lewis', 'Steven F. Coleman', 'Lisa U. Young', 'Dorothy I. Owens',
-                      'Christopher T. Sherman', 'Penny M. Love', 'Michael J. Peters', 'Mildred E. Hoffman',
-                      'Joshua H. Hill', 'Joshua U. Diaz', 'Amy V. Shaw', 'Joseph I. Ross', 'Robert P. Hill',
-                      'Patrick G. Taylor', 'Joshua P. Williams', 'Carol U. Hughes', 'Daniel A. Johnson',
-                      'Brian Q. Gracia', 'Stephan P. Graham', 'Daniel X. Adams']
-    only_pat_id = ['665677', '6666001', '724111', '731673', '7321938', '736230', '765583', '767980', '7777701',
-                   '7777702', '7777703', '7777704', '7777705', '880378', '8888801', '8888802', '8888803', '8888804',
-                   '629528', '640264', '644201', '1768562', '1796238', '1869612', '1951076', '2004454', '2042917',
-                   '2080416', '2081539', '2113340', '2169591', '2347217', '2354220', '2502813', '4444001', '5555001',
-                   '5555002', '5555003', '613876', '621799', '1032702', '1081332', '1098667', '1134281', '1137192',
-                   '1157764', '1186747', '1213208', '1272431', '1288992']
-
-    return only_name_list[only_pat_id.index(str(patient_id))]
-
-
-def forecasting(feat, duration, patient_id):
-    df_path = os.path.join(os.path.dirname(__file__), "out.csv")
-    df = pd.read_csv(df_path)
+    return _PATIENT_NAMES[_PATIENT_IDS.index(str(patient_id))]
+
+
+def get_series(feat, patient_id):
+    """
+    Return the observed values of a feature for a patient in date order.
+
+    Returns:
+    --------
+    numpy.ndarray or str
+        The series values, or a message explaining why no forecast can be made.
+    """
+    df = _load_dataset()
 
     try:
         id_to_name = get_patient_name_by_id(patient_id)
     except ValueError:
         return "Patient ID not found."
 
-    varall = df[df["Name"] == id_to_name]
-    vare = varall[varall["Features"] == feat]
-    vare = vare.drop(columns=['Features', 'Unit', 'Name'])
+    vare = df[(df["Name"] == id_to_name) & (df["Features"] == feat)]
 
     if vare.empty or len(vare["Values"]) < 2:
         return "Not enough data to do prediction."
 
-    vare.rename(columns={'Values': feat}, inplace=True)
-    model = ARIMA(vare[feat], order=(1, 1, 2))  # A more general model
+    return vare["Values"].to_numpy(dtype=float)
+
+
+def arima_forecast(values, steps, order=DEFAULT_ORDER):
+    """Fit an ARIMA model to a series and forecast the next `steps` values"""
+    # statsmodels takes seconds to import, it is loaded with the first fit rather than with the app
+    from statsmodels.tsa.arima.model import ARIMA
+
+    model = ARIMA(np.asarray(values, dtype=float), order=order)
     model = model.fit()
-    forecast = model.forecast(steps=duration)
-    return forecast
-# forecasting("oxygen_saturation", 5, 665677)
\ No newline at end of file
+    return model.forecast(steps=steps)
+
+
+def holt_forecast(values, steps, damped=True, phi=0.98):
+    """
+    Forecast with Holt's linear (or damped) trend exponential smoothing.
+
+    The level/trend recursions are run for every (alpha, beta) pair of the parameter
+    grid at once as NumPy arrays, and the pair with the lowest one-step-ahead squared
+    error produces the forecast, so the cost is a single pass over the series.
+
+    Parameters:
+    -----------
+    values : array-like
+        Observed series, at least two points.
+    steps : int
+        Number of future values to forecast.
+    damped : bool
+        Damp the trend with factor `phi` so long horizons flatten out.
+    phi : float
+        Damping factor, ignored when `damped` is False.
+
+    Returns:
+    --------
+    numpy.ndarray
+        The forecast values.
+    """
+    y = np.asarray(values, dtype=float)
+    phi = phi if damped else 1.0
+    alpha, beta = np.meshgrid(_ALPHA_GRID, _BETA_GRID)
+    alpha = alpha.ravel()
+    beta = beta.ravel()
+
+    level = np.full(alpha.shape, y[0])
+    trend = np.full(alpha.shape, y[1] - y[0])
+    sse = np.zeros(alpha.shape)
+    for observation in y[1:]:
+        predicted = level + phi * trend
+        sse += (observation - predicted) ** 2
+        new_level = alpha * observation + (1 - alpha) * predicted
+        trend = beta * (new_level - level) + (1 - beta) * phi * trend
+        level = new_level
+
+    best = np.argmin(sse)
+    horizons = np.arange(1, steps + 1)
+    if phi == 1.0:
+        damping = horizons.astype(float)
+    else:
+        damping = phi * (1 - phi ** horizons) / (1 - phi)
+    return level[best] + damping * trend[best]
+
+
+@metrics.timed("forecast.arima_fit")
+def _arima_forecast_selected(feat, patient_id, values, steps):
+    # A serial search: this runs on request threads, which must not start a process pool each
+    order = get_order(patient_id, feat, values, default=DEFAULT_ORDER, max_workers=1)
+    return arima_forecast(values, steps, order)
+
+
+def _submit_arima_fit(feat, patient_id, values, steps):
+    """
+    Start the auto mode's ARIMA fit of a series on the executor, or join it if it is already running.
+
+    Fits outlive their latency budget, so without this every request for a series
+    whose fit is slow would queue another one, and once the workers are held by such
+    fits later requests would only wait out their budget behind them.
+
+    Returns:
+    --------
+    concurrent.futures.Future or None
+        The fit's future, or None when every worker is taken by fits of other series.
+    """
+    key = (str(patient_id), feat, int(steps), len(values))
+    with _arima_fits_lock:
+        future = _arima_fits.get(key)
+        if future is not None:
+            metrics.cache_lookup('arima_fit', True)
+            return future
+        if len(_arima_fits) >= ARIMA_WORKERS:
+            metrics.count("arima_fits_skipped_total")
+            return None
+        metrics.cache_lookup('arima_fit', False)
+        future = _arima_executor.submit(_arima_forecast_selected, feat, patient_id, values, steps)
+        _arima_fits[key] = future
+
+    def discard(done):
+        with _arima_fits_lock:
+            if _arima_fits.get(key) is done:
+                del _arima_fits[key]
+
+    future.add_done_callback(discard)
+    return future
+
+
+def select_forecast_method(n_points, mode="auto"):
+    """Pick 'fast' or 'arima' for a series of `n_points` observations under the given mode"""
+    if mode == "fast" or n_points < MIN_ARIMA_POINTS:
+        return "fast"
+    return mode
+
+
+@metrics.timed("forecast.forecast_with_budget")
+def forecast_with_budget(feat, duration, patient_id, mode="auto", latency_budget=DEFAULT_LATENCY_BUDGET,
+                         on_fast_result=None, progress=None):
+    """
+    Forecast a feature, trading accuracy for latency according to `mode`.
+
+    'fast' uses exponential smoothing only, 'arima' always waits for the ARIMA fit and
+    'auto' computes the smoothing forecast first and replaces it with ARIMA only if the
+    fit finishes within `latency_budget` seconds. A request for a series that is already
+    being fitted waits on that fit, and when every ARIMA worker is busy with other series
+    'auto' settles for the smoothing forecast at once. Series shorter than
+    MIN_ARIMA_POINTS always use the fast path.
+
+    Parameters:
+    -----------
+    on_fast_result : callable, optional
+        Called with the smoothing forecast as soon as it is available in 'auto' mode,
+        so the caller can show it while ARIMA is still fitting.
+    progress : callable, optional
+        Called as progress(stage, fraction) before every stage. An exception raised by
+        the callback aborts the forecast, which background jobs use for cancellation.
+
+    Returns:
+    --------
+    tuple or str
+        (forecast values, method used) where method is 'fast' or 'arima', or a message
+        explaining why no forecast can be made.
+    """
+    progress = progress or (lambda stage, fraction: None)
+
+    progress("Loading series", 0.1)
+    values = get_series(feat, patient_id)
+    if isinstance(values, str):
+        return values
+
+    method = select_forecast_method(len(values), mode)
+    if method == "arima":
+        progress("Fitting ARIMA", 0.3)
+        return np.asarray(_arima_forecast_selected(feat, patient_id, values, duration)), "arima"
+
+    progress("Exponential smoothing", 0.2)
+    fast_result = holt_forecast(values, duration)
+    if method == "fast":
+        return fast_result, "fast"
+
+    if on_fast_result:
+        on_fast_result(fast_result)
+
+    progress("Fitting ARIMA", 0.4)
+
+    future = _submit_arima_fit(feat, patient_id, values, duration)
+    if future is None:
+        return fast_result, "fast"
+    try:
+        result = np.asarray(future.result(timeout=latency_budget))
+    except FutureTimeoutError:
+        return fast_result, "fast"
+    except Exception:
+        # ARIMA failing to fit is no reason to withhold the smoothing forecast
+        return fast_result, "fast"
+
+    if not np.all(np.isfinite(result)):
+        return fast_result, "fast"
+    return result, "arima"
+
+
+@metrics.timed("forecast.forecasting")
+def forecasting(feat, duration, patient_id, order=None):
+    values = get_series(feat, patient_id)
+    if isinstance(values, str):
+        return values
+
+    # Fit on the bare values, a gappy DataFrame index cannot be extended by the forecaster
+    if order is None:
+        return _arima_forecast_selected(feat, patient_id, values, duration)
+    return arima_forecast(values, duration, order)
+# forecasting("oxygen_saturation", 5, 665677)
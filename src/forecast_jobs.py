@@ -0,0 +1,155 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src import metrics
+from src.forecast import DEFAULT_LATENCY_BUDGET, forecast_with_budget, get_dataset_version
+
+# Seconds a finished job is kept around so identical requests can reuse its result
+JOB_TTL = 600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class ForecastCancelled(Exception):
+    pass
+
+
+class ForecastJob(object):
+    """State of one background forecast, read by the UI while the job runs"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.stage = "Queued"
+        self.progress = 0.0
+        self.partial_result = None
+        self.result = None
+        self.method = None
+        self.message = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.subscribers = 1
+        self.future = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+
+class ForecastJobManager(object):
+    """
+    Runs forecasts on a background thread pool so the Streamlit script never blocks on a fit.
+
+    Jobs are keyed by their inputs and the version of the forecasting dataset. A
+    request for a series that is already queued, running or recently finished
+    subscribes to the existing job instead of starting a new fit, so concurrent
+    sessions asking for the same forecast share one result; once the dataset changes
+    the next request starts a new job.
+    A job is only cancelled once every subscriber has released it.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="forecast-job")
+        self._jobs = {}
+        self._jobs_by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, patient_id, feature, duration, mode="auto", latency_budget=DEFAULT_LATENCY_BUDGET):
+        """Start (or join) a forecast job and return its ID"""
+        key = (str(patient_id), feature, int(duration), mode, float(latency_budget), get_dataset_version())
+        with self._lock:
+            self._prune()
+            job = self._jobs_by_key.get(key)
+            if job and job.status not in (FAILED, CANCELLED):
+                job.subscribers += 1
+                metrics.cache_lookup('forecast_job', True)
+                return job.id
+            metrics.cache_lookup('forecast_job', False)
+
+            job = ForecastJob(key)
+            self._jobs[job.id] = job
+            self._jobs_by_key[key] = job
+            job.future = self._executor.submit(self._run, job)
+            return job.id
+
+    def get(self, job_id):
+        """Return the job with the given ID, or None if it is unknown or expired"""
+        return self._jobs.get(job_id)
+
+    def release(self, job_id):
+        """Drop one subscription to a job, cancelling it when nobody is waiting for it any more"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.finished:
+                return
+            job.subscribers -= 1
+            if job.subscribers > 0:
+                return
+
+            job.cancel_event.set()
+            job.future.cancel()
+            self._finish(job, CANCELLED, stage="Cancelled")
+
+    def _finish(self, job, status, stage, **fields):
+        job.status = status
+        job.stage = stage
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.finished_at = time.time()
+        if self._jobs_by_key.get(job.key) is job and status != DONE:
+            del self._jobs_by_key[job.key]
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > JOB_TTL:
+                del self._jobs[job_id]
+                if self._jobs_by_key.get(job.key) is job:
+                    del self._jobs_by_key[job.key]
+
+    def _run(self, job):
+        patient_id, feature, duration, mode, latency_budget, _ = job.key
+
+        def progress(stage, fraction):
+            with self._lock:
+                # Checked under the lock release() finishes the job with, so a cancelled job stays cancelled
+                if job.cancel_event.is_set() or job.finished:
+                    raise ForecastCancelled()
+                job.status = RUNNING
+                job.stage = stage
+                job.progress = fraction
+
+        def on_fast_result(values):
+            job.partial_result = np.asarray(values).tolist()
+
+        try:
+            outcome = forecast_with_budget(feature, duration, patient_id, mode=mode, latency_budget=latency_budget,
+                                           on_fast_result=on_fast_result, progress=progress)
+        except ForecastCancelled:
+            return
+        except Exception as e:
+            with self._lock:
+                if not job.finished:
+                    self._finish(job, FAILED, stage="Failed", message=f"{type(e).__name__}: {e}")
+            return
+
+        with self._lock:
+            # A job cancelled mid-fit keeps its cancelled state, the late result is discarded
+            if job.finished:
+                return
+            if isinstance(outcome, str):
+                self._finish(job, FAILED, stage="No forecast", message=outcome, progress=1.0)
+            else:
+                values, method = outcome
+                self._finish(job, DONE, stage="Done", result=np.asarray(values).tolist(), method=method,
+                             progress=1.0)
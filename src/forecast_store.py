@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from src import metrics
+from src.forecast import get_dataset_version
+
+FORECAST_STORE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'forecast_store.json'))
+
+_store_cache = {}
+
+
+def save_forecast_store(results, duration, path=FORECAST_STORE, dataset_version=None):
+    """
+    Write batch forecast results to the forecast store.
+
+    The file is written to a unique temporary file first and then moved into place so
+    readers never observe a partially written store and concurrent writers do not
+    overwrite each other's temporary file.
+
+    Parameters:
+    -----------
+    results : list
+        Task results as returned by the batch forecasting engine. Each result is a
+        dict with 'patient_id', 'feature', 'status' and, when successful, 'values'.
+    duration : int
+        Number of forecast steps that was computed for every series.
+    path : str
+        Location of the store file.
+    dataset_version : int, optional
+        Version of the forecasting dataset the forecasts were computed from, as
+        returned by get_dataset_version(). Defaults to the current version.
+    """
+    forecasts = {}
+    for result in results:
+        patient_forecasts = forecasts.setdefault(str(result['patient_id']), {})
+        patient_forecasts[result['feature']] = {
+            key: value for key, value in result.items() if key not in ('patient_id', 'feature')
+        }
+
+    store = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'dataset_version': get_dataset_version() if dataset_version is None else dataset_version,
+        'duration': duration,
+        'forecasts': forecasts
+    }
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as store_file:
+            json.dump(store, store_file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    _store_cache.pop(path, None)
+
+
+def load_forecast_store(path=FORECAST_STORE):
+    """Return the forecast store, re-reading it only when the file has changed"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _store_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r') as store_file:
+        store = json.load(store_file)
+    _store_cache[path] = (mtime, store)
+    return store
+
+
+def get_stored_forecast(patient_id, feature, duration, path=FORECAST_STORE):
+    """
+    Look up a precomputed forecast.
+
+    Returns:
+    --------
+    list or None
+        The first `duration` forecast values, or None if the store has no successful
+        forecast for the series, it was computed for a shorter horizon or from another
+        version of the forecasting dataset than the current one.
+    """
+    store = load_forecast_store(path)
+    entry = None
+    if (store and store.get('duration', 0) >= duration
+            and store.get('dataset_version') == get_dataset_version()):
+        entry = store['forecasts'].get(str(patient_id), {}).get(feature)
+    hit = bool(entry) and entry.get('status') == 'ok'
+    metrics.cache_lookup('forecast_store', hit)
+    return entry['values'][:duration] if hit else None
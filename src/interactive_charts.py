@@ -0,0 +1,228 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+
+from src import alignment, metrics, reference_ranges
+from src.chart_cache import fingerprint
+from src.fhir_client import calculate_ages
+from src.series_pyramid import MAX_WINDOW_POINTS, SeriesPyramid
+
+# Pyramids kept in memory, one per observation history
+PYRAMID_CACHE_SIZE = 128
+
+_pyramids = OrderedDict()
+_pyramids_lock = threading.Lock()
+
+
+def get_pyramid(*histories, derive=None):
+    """
+    Return the SeriesPyramid of an observation history, building it on first use.
+
+    Parameters:
+    -----------
+    histories : list
+        The observation history, or the histories a derived series is computed from.
+    derive : callable, optional
+        Called with the histories to return (dates, values) of a derived series,
+        e.g. BMI from weight and height.
+    """
+    key = fingerprint(derive.__name__ if derive else None, *histories)
+    with _pyramids_lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is not None:
+            _pyramids.move_to_end(key)
+            metrics.cache_lookup('pyramid', True)
+            return pyramid
+
+    metrics.cache_lookup('pyramid', False)
+
+    dates, values = derive(*histories) if derive else alignment.history_arrays(histories[0])
+    pyramid = SeriesPyramid(dates, values)
+    with _pyramids_lock:
+        _pyramids[key] = pyramid
+        while len(_pyramids) > PYRAMID_CACHE_SIZE:
+            _pyramids.popitem(last=False)
+    return pyramid
+
+
+def _bmi_from_weight_and_height(weight_history, height_history):
+    dates, weights, heights = alignment.align(weight_history, height_history)
+    return dates, weights / ((heights / 100) ** 2)
+
+
+def date_range(*histories):
+    """Return (first, last) observation date over all histories as datetime.date, or None when all are empty"""
+    ranges = [get_pyramid(history).date_range for history in histories if history]
+    if not ranges:
+        return None
+    return min(r[0] for r in ranges).astype(object), max(r[1] for r in ranges).astype(object)
+
+
+def _add_series(fig, pyramid, start, end, name, color, max_points, yaxis='y'):
+    """
+    Add the window of one series to a figure as WebGL traces.
+
+    Raw observations are drawn as a line with markers; aggregated buckets as their
+    mean with the min-max envelope shaded around it. Returns the window, so reference
+    ranges can be computed for the same buckets.
+    """
+    window = pyramid.window(start, end, max_points)
+    dates = window['date'].astype('datetime64[ms]')
+    if window['level'] == 0:
+        fig.add_trace(go.Scattergl(x=dates, y=window['mean'], mode='lines+markers', name=name, yaxis=yaxis,
+                                   line=dict(color=color, width=2), marker=dict(size=6)))
+        return window
+
+    readings = int(window['count'].max())
+    fig.add_trace(go.Scattergl(x=dates, y=window['min'], mode='lines', line=dict(color=color, width=0),
+                               yaxis=yaxis, showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scattergl(x=dates, y=window['max'], mode='lines', line=dict(color=color, width=0),
+                               fill='tonexty', opacity=0.3, yaxis=yaxis, name=f"{name} min-max", hoverinfo='skip'))
+    fig.add_trace(go.Scattergl(x=dates, y=window['mean'], mode='lines', name=f"{name} (mean of up to {readings})",
+                               yaxis=yaxis, line=dict(color=color, width=2)))
+    return window
+
+
+def _bucket_runs(dates, bounds, start, end):
+    """
+    Group consecutive buckets with the same reference ranges.
+
+    Parameters:
+    -----------
+    dates : numpy.ndarray
+        Bucket dates as datetime64[D], sorted.
+    bounds : numpy.ndarray
+        One row of thresholds per bucket; NaN thresholds compare equal.
+    start, end : datetime, optional
+        Window bounds; the first and last run are stretched to them.
+
+    Returns:
+    --------
+    list
+        (x0, x1, thresholds) per run, the runs meeting halfway between the buckets
+        on either side of a change.
+    """
+    if not len(dates):
+        return []
+    same = (bounds[1:] == bounds[:-1]) | (np.isnan(bounds[1:]) & np.isnan(bounds[:-1]))
+    changes = np.flatnonzero(~same.all(axis=1)) + 1
+    edges = [start if start is not None else dates[0].astype(object)]
+    edges += [(dates[i - 1] + (dates[i] - dates[i - 1]) // 2).astype(object) for i in changes]
+    edges.append(end if end is not None else dates[-1].astype(object))
+    firsts = np.concatenate([[0], changes])
+    return [(x0, x1, bounds[first]) for x0, x1, first in zip(edges[:-1], edges[1:], firsts)]
+
+
+def _add_bands(fig, dates, bounds, colors, start, end, yref='y'):
+    """
+    Shade reference-range bands that follow the buckets; bounds holds one row of band
+    boundaries, bottom to top, per bucket.
+    """
+    for x0, x1, row in _bucket_runs(dates, np.asarray(bounds, dtype=float), start, end):
+        for lower, upper, color in zip(row[:-1], row[1:], colors):
+            if np.isnan(lower) or np.isnan(upper):
+                continue
+            fig.add_shape(type='rect', xref='x', x0=x0, x1=x1, yref=yref, y0=lower, y1=upper, fillcolor=color,
+                          opacity=0.5, layer='below', line_width=0)
+
+
+def _measurements_at(history, dates):
+    """Measurement name of the reading on or before every date, the first reading's for earlier dates"""
+    reading_dates, _ = alignment.history_arrays(history)
+    order = np.argsort(reading_dates, kind='stable')
+    positions = np.searchsorted(reading_dates[order], dates, side='right') - 1
+    return [history[order[max(position, 0)]]['measurement'] for position in positions]
+
+
+def _layout(fig, title, y_title, start, end, **layout):
+    fig.update_layout(
+        title=title,
+        yaxis_title=y_title,
+        xaxis=dict(type='date', range=[start, end] if start is not None and end is not None else None),
+        height=400,
+        margin=dict(l=0, r=0, t=40, b=0),
+        hovermode="x unified",
+        legend=dict(orientation='h', yanchor='bottom', y=-0.3)
+    )
+    fig.update_layout(**layout)
+    return fig
+
+
+def weight_height_bmi_figure(weight_history, height_history, bmi_history, demographics, start=None, end=None,
+                             max_points=MAX_WINDOW_POINTS):
+    """Interactive weight, height and BMI chart, or None when there is no data"""
+    if not weight_history and not height_history and not bmi_history:
+        return None
+    birthdate, gender = demographics[2], demographics[4]
+
+    fig = go.Figure()
+    if weight_history:
+        _add_series(fig, get_pyramid(weight_history), start, end, "Weight", 'brown', max_points)
+    if height_history:
+        _add_series(fig, get_pyramid(height_history), start, end, "Height", '#004C99', max_points)
+
+    if bmi_history:
+        bmi = get_pyramid(bmi_history)
+    elif weight_history and height_history:
+        bmi = get_pyramid(weight_history, height_history, derive=_bmi_from_weight_and_height)
+    else:
+        bmi = None
+    if bmi is not None and len(bmi):
+        window = _add_series(fig, bmi, start, end, "BMI", 'black', max_points, yaxis='y2')
+        # Ranges for the age at every bucket's date, as the static charts use the age at every reading
+        normal, overweight, obese = reference_ranges.bmi_thresholds(gender, calculate_ages(birthdate, window['date']))
+        bounds = np.column_stack([np.zeros(len(normal)), normal, overweight, obese, np.full(len(normal), 50)])
+        _add_bands(fig, window['date'], bounds, ['#BDD7F5', '#C2DCC1', '#FFF2CC', '#F8CECC'], start, end,
+                   yref='y2')
+
+    return _layout(fig, "Weight, Height & BMI", "Weight (kg) & Height (cm)", start, end,
+                   yaxis=dict(range=[0, 210]),
+                   yaxis2=dict(title="BMI (kg/m²)", overlaying='y', side='right', range=[0, 50], showgrid=False))
+
+
+def glucose_figure(glucose_history, start=None, end=None, max_points=MAX_WINDOW_POINTS):
+    """Interactive blood glucose chart, or None when there is no data"""
+    if not glucose_history:
+        return None
+
+    fig = go.Figure()
+    window = _add_series(fig, get_pyramid(glucose_history), start, end, "Glucose", 'black', max_points)
+    # Bands of the measurement taken at every bucket's date; measurements without ranges get no background
+    prediabetes, diabetes = reference_ranges.glucose_thresholds(_measurements_at(glucose_history, window['date']))
+    bounds = np.column_stack([np.zeros(len(prediabetes)), prediabetes, diabetes, np.full(len(prediabetes), 400)])
+    _add_bands(fig, window['date'], bounds, ['#C2DCC1', '#FFF2CC', '#F8CECC'], start, end)
+    return _layout(fig, "Blood Glucose Levels", "Blood Glucose Level (mg/dL)", start, end)
+
+
+def blood_pressure_figure(systolic_history, diastolic_history, demographics, start=None, end=None,
+                          max_points=MAX_WINDOW_POINTS):
+    """Interactive blood pressure chart, or None when there is no data"""
+    if not systolic_history or not diastolic_history:
+        return None
+
+    fig = go.Figure()
+    window = _add_series(fig, get_pyramid(systolic_history), start, end, "Systolic", 'black', max_points)
+    _add_series(fig, get_pyramid(diastolic_history), start, end, "Diastolic", 'brown', max_points)
+    # Threshold lines for the age at every bucket's date, stepping where the age group changes
+    thresholds = reference_ranges.bp_thresholds(calculate_ages(demographics[2], window['date']))
+    for x0, x1, row in _bucket_runs(window['date'], np.column_stack(thresholds).astype(float), start, end):
+        for threshold, color in zip(row, ('blue', 'red', 'blue', 'red')):  # Low and elevated, systolic then diastolic
+            fig.add_shape(type='line', xref='x', x0=x0, x1=x1, y0=threshold, y1=threshold,
+                          line=dict(color=color, dash='dot'), opacity=0.6)
+    return _layout(fig, "Blood Pressure Levels", "Blood Pressure (mmHg)", start, end)
+
+
+def heart_rate_figure(hr_history, demographics, start=None, end=None, max_points=MAX_WINDOW_POINTS):
+    """Interactive heart rate chart, or None when there is no data"""
+    if not hr_history:
+        return None
+    birthdate, gender = demographics[2], demographics[4]
+
+    fig = go.Figure()
+    window = _add_series(fig, get_pyramid(hr_history), start, end, "Heart rate", 'black', max_points)
+    low, elevated = reference_ranges.hr_thresholds(gender, calculate_ages(birthdate, window['date']))
+    bounds = np.column_stack([np.zeros(len(low)), low, elevated, np.full(len(low), 200)])
+    _add_bands(fig, window['date'], bounds, ['#BDD7F5', '#C2DCC1', '#F8CECC'], start, end)
+    return _layout(fig, "Heart Rate", "Heart Rate (bpm)", start, end)
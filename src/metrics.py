@@ -0,0 +1,196 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Instrumentation is off unless METRICS_ENABLED=1; disabled, a timed call costs one flag check
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# Port of the local Prometheus endpoint started by the dashboard, none when unset
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "cardicare"
+
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_collectors = {}
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(flag):
+    """Turn recording on or off at runtime"""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def reset():
+    """Forget every recorded latency and count; counters that collectors read from the caches are kept"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def observe(stage, seconds):
+    """Record one call of a stage that took `seconds`"""
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        histogram[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+
+
+def timed(stage):
+    """Decorator recording the latency of every call under `stage` while metrics are enabled"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1, **labels):
+    """Add to a counter while metrics are enabled"""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def cache_lookup(cache, hit):
+    """Count a hit or a miss of the named cache layer"""
+    count("cache_hits_total" if hit else "cache_misses_total", cache=cache)
+
+
+def register_collector(collector, name=None):
+    """
+    Register a callable read at exposition time.
+
+    It returns (name, labels dict, value, type) samples, type being 'counter' or
+    'gauge'. Caches that keep their own counters are exposed this way, so they cost
+    nothing extra on their hot path.
+
+    A collector registered under a name replaces the one previously registered under
+    it, so an object created repeatedly exposes its latest instance only and the
+    earlier ones are not kept alive by the registry.
+    """
+    with _lock:
+        _collectors[collector if name is None else name] = collector
+
+
+def cache_stats_collector(cache, stats):
+    """Collector exposing a cache's stats() dict (hits, misses, evictions, entries, bytes)"""
+    counters = ('hits', 'misses', 'evictions')
+
+    def collect():
+        samples = []
+        for field, value in stats().items():
+            if field in counters:
+                samples.append((f"cache_{field}_total", {'cache': cache}, value, 'counter'))
+            else:
+                samples.append((f"cache_{field}", {'cache': cache}, value, 'gauge'))
+        return samples
+    return collect
+
+
+def snapshot():
+    """
+    Return the recorded metrics for display.
+
+    Returns:
+    --------
+    dict
+        'stages' maps a stage to its call count, total and mean seconds and the upper
+        bound of the bucket holding the 99th percentile; 'samples' lists every counter
+        and collector sample as (name, labels, value, type).
+    """
+    with _lock:
+        histograms = {stage: (list(buckets), total) for stage, (buckets, total) in _histograms.items()}
+        samples = [(name, dict(labels), value, 'counter') for (name, labels), value in _counters.items()]
+        collectors = list(_collectors.values())
+    for collector in collectors:
+        samples.extend(collector())
+
+    stages = {}
+    for stage, (buckets, total) in sorted(histograms.items()):
+        calls = sum(buckets)
+        running, p99 = 0, float('inf')
+        for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+            running += bucket
+            if running >= 0.99 * calls:
+                p99 = bound
+                break
+        stages[stage] = {'calls': calls, 'total_seconds': total, 'mean_seconds': total / calls if calls else 0.0,
+                         'p99_bucket_seconds': p99}
+    return {'stages': stages, 'samples': samples, 'histograms': histograms}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+def render_prometheus():
+    """Return every metric in the Prometheus text exposition format"""
+    metrics = snapshot()
+    lines = []
+
+    name = f"{PREFIX}_stage_duration_seconds"
+    lines.append(f"# HELP {name} Latency of instrumented stages")
+    lines.append(f"# TYPE {name} histogram")
+    for stage, (buckets, total) in sorted(metrics['histograms'].items()):
+        running = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            running += bucket
+            lines.append(f"{name}_bucket{_labels({'stage': stage, 'le': bound})} {running}")
+        lines.append(f"{name}_sum{_labels({'stage': stage})} {total}")
+        lines.append(f"{name}_count{_labels({'stage': stage})} {running}")
+
+    typed = set()
+    for sample_name, labels, value, sample_type in sorted(metrics['samples'], key=lambda sample: sample[0]):
+        full_name = f"{PREFIX}_{sample_name}"
+        if full_name not in typed:
+            typed.add(full_name)
+            lines.append(f"# TYPE {full_name} {sample_type}")
+        lines.append(f"{full_name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        data = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT, host="127.0.0.1"):
+    """Serve GET /metrics from a daemon thread of this process and return the server"""
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
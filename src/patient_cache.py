@@ -0,0 +1,157 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Memory budget for patient summaries shared by all sessions of the server process
+DEFAULT_MAX_BYTES = int(os.getenv("PATIENT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def estimate_size(obj):
+    """
+    Estimate the memory held by a patient summary in bytes.
+
+    Walks dicts, lists, tuples, sets and slotted records and adds up sys.getsizeof of every object
+    reached, counting shared objects (interned strings, repeated units) once.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(type(item), '__slots__'):
+            stack.extend(getattr(item, slot) for slot in type(item).__slots__ if hasattr(item, slot))
+    return total
+
+
+class PatientCache(object):
+    """
+    Thread-safe LRU cache of patient summaries bounded by their estimated size in bytes.
+
+    One instance is shared by every session of the server process. Sessions keep no
+    copies: they look the summary up on every rerun and get the cached object itself,
+    which must therefore be treated as read-only. Concurrent requests for the same
+    uncached patient wait for a single load.
+
+    Entries belong to one version of the patient data (FHIRClient.data_version). When
+    a client with newer data asks for a patient the whole cache is invalidated, and
+    invalidation hooks let caches of derived data drop their entries too. A load that
+    finishes after its data was replaced is returned but not cached.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.data_version = None
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def get(self, client, patient_id):
+        """Return the summary of a patient, loading it through `client` on a miss"""
+        with self._lock:
+            stale_client = self.data_version is not None and client.data_version < self.data_version
+            reloaded = self.data_version is not None and client.data_version > self.data_version
+            if not stale_client:
+                self.data_version = client.data_version
+        if stale_client:
+            # A session still holding older data must not mix it into the shared cache
+            return client.get_patient_summary(patient_id)
+        if reloaded:
+            self.invalidate()
+
+        with self._lock:
+            summary = self._lookup(patient_id)
+            if summary is not None:
+                return summary
+            loading = self._loading.setdefault(patient_id, threading.Lock())
+
+        try:
+            with loading:
+                with self._lock:
+                    summary = self._lookup(patient_id)
+                    if summary is not None:
+                        return summary
+                    self.misses += 1
+                data_version = client.data_version
+                summary = client.get_patient_summary(patient_id)
+                if client.data_version == data_version:
+                    self._put(patient_id, summary, data_version)
+                return summary
+        finally:
+            with self._lock:
+                # A waiter finishing after the first loader may find a newer load's lock registered
+                if self._loading.get(patient_id) is loading:
+                    del self._loading[patient_id]
+
+    def __contains__(self, patient_id):
+        with self._lock:
+            return patient_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, patient_id):
+        # Caller holds the lock
+        entry = self._entries.get(patient_id)
+        if entry is None:
+            return None
+        self._entries.move_to_end(patient_id)
+        self.hits += 1
+        return entry[0]
+
+    def _put(self, patient_id, summary, data_version):
+        size = estimate_size(summary)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if data_version != self.data_version:
+                # Loaded from data that was replaced (and invalidated) while it was loading
+                return
+            previous = self._entries.pop(patient_id, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[patient_id] = (summary, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def add_invalidation_hook(self, hook):
+        """Register hook(patient_id) to run on invalidation; patient_id is None when everything is dropped"""
+        with self._lock:
+            self._hooks.append(hook)
+
+    def invalidate(self, patient_id=None):
+        """Drop one patient, or every patient when patient_id is None, and run the invalidation hooks"""
+        with self._lock:
+            if patient_id is None:
+                self._entries.clear()
+                self.size = 0
+            else:
+                entry = self._entries.pop(patient_id, None)
+                if entry is not None:
+                    self.size -= entry[1]
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(patient_id)
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,101 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src import charts
+
+# Background threads warming patient data; chart rendering itself runs in the chart process pool
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 2))
+# Most patients warmed per request, so a broad search does not flood the caches
+PREFETCH_LIMIT = int(os.getenv("PREFETCH_LIMIT", 20))
+
+
+class Prefetcher(object):
+    """
+    Warms the patient cache and the chart cache on a background thread pool.
+
+    As soon as a session knows which patients it is about to show (search results,
+    or the doctor's panel at login) it hands them to prefetch(). Their summaries are
+    extracted into the shared PatientCache and their dashboard charts rendered into
+    charts.chart_cache, so the dashboard usually opens from warm caches.
+
+    Each owner (a session) has at most one pending batch. A new request, or cancel(),
+    drops the patients of the previous batch that have not started yet and stops the
+    running ones before their charts are rendered. A patient the dashboard asks for
+    while it is being prefetched is loaded once: PatientCache makes the second
+    request wait for the first.
+    """
+
+    def __init__(self, patient_cache, max_workers=PREFETCH_WORKERS):
+        self.patient_cache = patient_cache
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, owner, client, patient_ids, limit=PREFETCH_LIMIT):
+        """
+        Replace the owner's pending batch with one warming the given patients.
+
+        Parameters:
+        -----------
+        owner : hashable
+            Identifies the requester, usually the session.
+        client : FHIRClient
+            Client the patient summaries are extracted with.
+        patient_ids : list
+            Patients in the order they should be warmed.
+        limit : int
+            Most patients warmed, the rest of the list is ignored.
+        """
+        self.cancel(owner)
+        patient_ids = list(dict.fromkeys(patient_ids or []))[:limit]
+        if not patient_ids:
+            return
+        cancel_event = threading.Event()
+        with self._lock:
+            futures = [self._executor.submit(self._warm, cancel_event, client, patient_id)
+                       for patient_id in patient_ids]
+            self._batches[owner] = (cancel_event, futures)
+            self.submitted += len(futures)
+
+    def cancel(self, owner):
+        """Stop the owner's pending batch, if any"""
+        with self._lock:
+            batch = self._batches.pop(owner, None)
+            if batch is None:
+                return
+            cancel_event, futures = batch
+            cancel_event.set()
+            self.cancelled += sum(future.cancel() for future in futures)
+
+    def pending(self, owner):
+        """Number of the owner's patients not warmed yet"""
+        with self._lock:
+            batch = self._batches.get(owner)
+            return sum(not future.done() for future in batch[1]) if batch else 0
+
+    def _warm(self, cancel_event, client, patient_id):
+        try:
+            if cancel_event.is_set():
+                return
+            summary = self.patient_cache.get(client, patient_id)
+            if cancel_event.is_set():
+                return
+            charts.render_charts(charts.dashboard_chart_args(summary))
+        except Exception:
+            # Prefetching is best effort; the dashboard reports the error when it loads the patient
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            self.completed += 1
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {'submitted': self.submitted, 'completed': self.completed, 'cancelled': self.cancelled,
+                    'failed': self.failed}
@@ -0,0 +1,245 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+# Show the profiling panel to the logged-in administrator
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Where profile reports are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", 'data/profiles')
+# Seconds between two stack samples
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.002))
+# Rows of the hotspot tables
+TOP_N = 25
+# Stack depth kept for every traced allocation
+TRACEMALLOC_FRAMES = 10
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_requests = {}
+_requests_lock = threading.Lock()
+
+
+def request_profile(patient_id, cold=False, trace_allocations=False):
+    """
+    Profile the next dashboard run of a patient, in whichever session it happens.
+
+    Parameters:
+    -----------
+    cold : bool
+        Drop the cached data first, so the run extracts and renders everything again.
+    trace_allocations : bool
+        Also trace allocations with tracemalloc. Tracing slows Python code down several
+        times, so the timings of such a profile are only good for relative comparisons.
+    """
+    with _requests_lock:
+        _requests[str(patient_id)] = {'cold': cold, 'trace_allocations': trace_allocations}
+
+
+def take_profile_request(patient_id):
+    """Return the options of the profile requested for a patient and clear the request, or None"""
+    with _requests_lock:
+        return _requests.pop(str(patient_id), None)
+
+
+if os.getenv("PROFILE_PATIENT"):
+    request_profile(os.environ["PROFILE_PATIENT"], cold=os.getenv("PROFILE_COLD", "0") == "1",
+                    trace_allocations=os.getenv("PROFILE_ALLOCATIONS", "0") == "1")
+
+
+def _frame_key(code):
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+def _display_name(frame):
+    name, filename, line = frame
+    return f"{name} ({os.path.relpath(filename, REPO_ROOT) if filename.startswith(REPO_ROOT) else filename}:{line})"
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler sampling the stack of one thread from a background thread.
+
+    Every SAMPLE_INTERVAL the sampler reads the thread's current frame and adds the
+    time since the previous sample to that call stack. Sampling costs the profiled
+    thread only the GIL switches, so the timings stay close to those of an unprofiled
+    run, unlike deterministic profilers that hook every call.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = defaultdict(float)
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _sample(self):
+        previous = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame.f_code))
+                frame = frame.f_back
+            # Root first, as flame graphs draw them
+            self.stacks[tuple(reversed(stack))] += now - previous
+            previous = now
+
+    def hotspots(self, top=TOP_N):
+        """Return (function, self seconds, total seconds) of the `top` functions by self time"""
+        self_time = defaultdict(float)
+        total_time = defaultdict(float)
+        for stack, seconds in self.stacks.items():
+            self_time[stack[-1]] += seconds
+            for frame in set(stack):
+                total_time[frame] += seconds
+        ranked = sorted(self_time.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [(frame, seconds, total_time[frame]) for frame, seconds in ranked]
+
+    def write_folded(self, path):
+        """Collapsed stacks in microseconds, the input of flamegraph.pl and speedscope"""
+        with open(path, 'w') as folded_file:
+            for stack, seconds in self.stacks.items():
+                frames = ";".join(_display_name(frame).replace(";", ":") for frame in stack)
+                folded_file.write(f"{frames} {int(seconds * 1e6)}\n")
+
+    def write_speedscope(self, path, name):
+        """Sampled profile in the speedscope JSON format, open it at https://www.speedscope.app"""
+        frame_index = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, seconds in self.stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(frame_index[frame])
+            samples.append(sample)
+            weights.append(seconds)
+        document = {
+            '$schema': "https://www.speedscope.app/file-format-schema.json",
+            'shared': {'frames': frames},
+            'profiles': [{'type': 'sampled', 'name': name, 'unit': 'seconds', 'startValue': 0,
+                          'endValue': sum(weights), 'samples': samples, 'weights': weights}],
+            'name': name,
+            'activeProfileIndex': 0,
+            'exporter': "cardicare profiling"
+        }
+        with open(path, 'w') as speedscope_file:
+            json.dump(document, speedscope_file)
+
+
+def allocation_hotspots(before, after, top=TOP_N):
+    """
+    Attribute the memory allocated between two tracemalloc snapshots, and still alive, to repository code.
+
+    Each allocation is charged to the innermost frame of its traceback that lies in
+    this repository, so memory allocated inside numpy or matplotlib on behalf of, say,
+    charts.py shows up under the charts.py line that asked for it.
+
+    Returns:
+    --------
+    list
+        (location, bytes, allocations) of the `top` locations by bytes.
+    """
+    charged = defaultdict(lambda: [0, 0])
+    for stat in after.compare_to(before, 'traceback'):
+        if stat.size_diff <= 0:
+            continue
+        location = None
+        for frame in reversed(stat.traceback):
+            if frame.filename.startswith(REPO_ROOT):
+                location = f"{os.path.relpath(frame.filename, REPO_ROOT)}:{frame.lineno}"
+                break
+        if location is None:
+            frame = stat.traceback[-1]
+            location = f"{frame.filename}:{frame.lineno}"
+        charged[location][0] += stat.size_diff
+        charged[location][1] += max(stat.count_diff, 0)
+    ranked = sorted(charged.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return [(location, size, allocations) for location, (size, allocations) in ranked]
+
+
+class Profile(object):
+    """
+    Profile a block of code for time and memory and write the reports.
+
+    Used as a context manager around one dashboard run. On exit it writes, under
+    PROFILE_DIR, <label>_<timestamp> with the extensions:
+
+    - .speedscope.json: sampled flame graph for https://www.speedscope.app
+    - .folded: the same stacks collapsed, for flamegraph.pl
+    - .txt: the top functions by self time and, when allocations are traced, the top
+      allocation sites
+
+    Only the calling thread is sampled. Charts rendered in the chart process pool show
+    up as time waiting in render_charts; run with CHART_RENDER_WORKERS=0 to attribute
+    that time to the renderers.
+    """
+
+    def __init__(self, label, trace_allocations=False, output_dir=PROFILE_DIR, interval=SAMPLE_INTERVAL):
+        self.label = label
+        self.trace_allocations = trace_allocations
+        self.output_dir = output_dir
+        self.profiler = SamplingProfiler(interval=interval)
+        self.paths = {}
+        self.report = ""
+
+    def __enter__(self):
+        self._started_tracing = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            self._before = tracemalloc.take_snapshot()
+        self.profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.stop()
+        if self.trace_allocations:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if self._started_tracing:
+                tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.label}_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        self.paths = {'speedscope': f"{base}.speedscope.json", 'folded': f"{base}.folded", 'report': f"{base}.txt"}
+        self.profiler.write_speedscope(self.paths['speedscope'], self.label)
+        self.profiler.write_folded(self.paths['folded'])
+
+        lines = [f"Profile of {self.label}: {self.profiler.duration:.3f}s wall time", "",
+                 f"{'self (s)':>9} {'total (s)':>10}  function"]
+        for frame, self_seconds, total_seconds in self.profiler.hotspots():
+            lines.append(f"{self_seconds:>9.3f} {total_seconds:>10.3f}  {_display_name(frame)}")
+        if self.trace_allocations:
+            lines += ["", f"Peak traced memory {peak / 1e6:.1f} MB; times above are inflated by allocation tracing",
+                      "", f"{'bytes':>12} {'blocks':>8}  allocated at (still alive at the end)"]
+            for location, size, allocations in allocation_hotspots(self._before, after):
+                lines.append(f"{size:>12} {allocations:>8}  {location}")
+        self.report = "\n".join(lines) + "\n"
+        with open(self.paths['report'], 'w') as report_file:
+            report_file.write(self.report)
+        return False
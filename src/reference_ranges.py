@@ -0,0 +1,112 @@
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+
+_RANGE_FILES = ['female_bmi.csv', 'male_bmi.csv', 'female_hr_ranges.csv', 'male_hr_ranges.csv', 'BP_ranges.csv',
+                'glucose_ranges.csv']
+
+
+def _read_table(file_name):
+    with open(os.path.join(DATA_DIR, file_name), mode='r') as file:
+        return list(csv.DictReader(file, delimiter=';'))
+
+
+def _table_version():
+    # Changes whenever any range file changes, so caches of classified data can be keyed on it
+    digest = hashlib.sha1()
+    for file_name in _RANGE_FILES:
+        with open(os.path.join(DATA_DIR, file_name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+class AgeTable(object):
+    """
+    A reference-range table keyed by age, compiled into sorted NumPy arrays.
+
+    `match` decides which row an age maps to:
+    'floor' picks the last row whose age is <= the given age (the BMI tables, one row
+    per year up to an adult row); 'ceil' picks the first row whose age is >= the
+    given age (the heart rate and blood pressure tables, one row per age bracket).
+    Ages outside the table map to its first or last row.
+    """
+
+    def __init__(self, rows, match):
+        self.ages = np.array([int(row['age']) for row in rows])
+        self.columns = {name: np.array([float(row[name]) for row in rows]) for name in rows[0] if name != 'age'}
+        self.side = 'right' if match == 'floor' else 'left'
+        self.offset = 1 if match == 'floor' else 0
+
+    def row_indices(self, ages):
+        """Map an array of ages to table rows with a single searchsorted call"""
+        positions = np.searchsorted(self.ages, np.asarray(ages), side=self.side) - self.offset
+        return np.clip(positions, 0, len(self.ages) - 1)
+
+    def lookup(self, ages, *names):
+        """Return one threshold array per requested column, aligned with `ages`"""
+        rows = self.row_indices(ages)
+        return tuple(self.columns[name][rows] for name in names)
+
+
+BMI_TABLES = {
+    'female': AgeTable(_read_table('female_bmi.csv'), match='floor'),
+    'male': AgeTable(_read_table('male_bmi.csv'), match='floor')
+}
+HR_TABLES = {
+    'female': AgeTable(_read_table('female_hr_ranges.csv'), match='ceil'),
+    'male': AgeTable(_read_table('male_hr_ranges.csv'), match='ceil')
+}
+BP_TABLE = AgeTable(_read_table('BP_ranges.csv'), match='ceil')
+GLUCOSE_THRESHOLDS = {row['measurement']: (float(row['prediabetes']), float(row['diabetes']))
+                      for row in _read_table('glucose_ranges.csv')}
+
+TABLE_VERSION = _table_version()
+
+
+def _table_for(tables, gender):
+    return tables['female'] if gender == "female" else tables['male']
+
+
+def bmi_thresholds(gender, ages):
+    """Return (normal, overweight, obese) BMI thresholds for every age"""
+    return _table_for(BMI_TABLES, gender).lookup(ages, 'normal', 'overweight', 'obese')
+
+
+def hr_thresholds(gender, ages):
+    """Return (low, elevated) heart rate thresholds for every age"""
+    return _table_for(HR_TABLES, gender).lookup(ages, 'low', 'elevated')
+
+
+def bp_thresholds(ages):
+    """Return (systolic low, systolic elevated, diastolic low, diastolic elevated) thresholds for every age"""
+    return BP_TABLE.lookup(ages, 'systolic low', 'systolic elevated', 'diastolic low', 'diastolic elevated')
+
+
+def glucose_thresholds(measurements):
+    """
+    Return (prediabetes, diabetes) thresholds for every glucose measurement name.
+
+    Measurements without a reference range get NaN thresholds.
+    """
+    unknown = (np.nan, np.nan)
+    thresholds = np.array([GLUCOSE_THRESHOLDS.get(measurement, unknown) for measurement in measurements],
+                          dtype=float).reshape(-1, 2)
+    return thresholds[:, 0], thresholds[:, 1]
+
+
+def classify(values, *thresholds):
+    """
+    Assign every value the index of the range it falls in.
+
+    With thresholds t1 <= t2 <= ... a value below t1 is category 0, a value in
+    [t1, t2) is category 1 and so on. Values whose thresholds are unknown (NaN)
+    get category -1.
+    """
+    values = np.asarray(values, dtype=float)
+    bounds = np.column_stack(thresholds) if thresholds else np.empty((len(values), 0))
+    categories = np.sum(values[:, None] >= bounds, axis=1)
+    return np.where(np.isnan(bounds).any(axis=1), -1, categories)
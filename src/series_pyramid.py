@@ -0,0 +1,89 @@
+import numpy as np
+
+# Buckets of one level merged into a bucket of the level above
+FANOUT = 4
+# Most buckets a window query returns
+MAX_WINDOW_POINTS = 400
+
+
+class SeriesPyramid(object):
+    """
+    Multi-resolution min/max/mean summary of one vital-sign series.
+
+    Level 0 holds the observations themselves. Each level above it merges FANOUT
+    consecutive buckets of the level below, keeping the date span, minimum,
+    maximum, sum and count of every bucket. The pyramid is built once in O(n).
+    A window query reads a single level, the finest one that fits the point
+    budget, so a zoomed-out view of a long history costs as little as a
+    zoomed-in view of a short one.
+    """
+
+    def __init__(self, dates, values, fanout=FANOUT):
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        values = np.asarray(values, dtype=float)
+        order = np.argsort(dates, kind='stable')
+        dates, values = dates[order], values[order]
+
+        level = {'start': dates, 'end': dates, 'min': values, 'max': values, 'sum': values,
+                 'count': np.ones(len(values), dtype=int)}
+        self.levels = [level]
+        while len(level['start']) > 1:
+            edges = np.arange(0, len(level['start']), fanout)
+            last = np.append(edges[1:], len(level['start'])) - 1
+            level = {
+                'start': level['start'][edges],
+                'end': level['end'][last],
+                'min': np.minimum.reduceat(level['min'], edges),
+                'max': np.maximum.reduceat(level['max'], edges),
+                'sum': np.add.reduceat(level['sum'], edges),
+                'count': np.add.reduceat(level['count'], edges)
+            }
+            self.levels.append(level)
+
+    def __len__(self):
+        return len(self.levels[0]['start'])
+
+    @property
+    def date_range(self):
+        """(first, last) observation date, or None for an empty series"""
+        if not len(self):
+            return None
+        return self.levels[0]['start'][0], self.levels[0]['end'][-1]
+
+    def window(self, start=None, end=None, max_points=MAX_WINDOW_POINTS):
+        """
+        Return the buckets covering a date window.
+
+        Parameters:
+        -----------
+        start, end : datetime or numpy.datetime64, optional
+            Inclusive window bounds, the whole series when omitted.
+        max_points : int
+            Largest number of buckets to return.
+
+        Returns:
+        --------
+        dict
+            'date' (bucket midpoints), 'min', 'max', 'mean' and 'count' arrays, plus
+            'level', which is 0 when the buckets are the raw observations.
+        """
+        start = np.datetime64(start, 'D') if start is not None else None
+        end = np.datetime64(end, 'D') if end is not None else None
+
+        for level_index, level in enumerate(self.levels):
+            # Buckets that overlap the window: ending on or after start and starting on or before end
+            first = np.searchsorted(level['end'], start, side='left') if start is not None else 0
+            stop = np.searchsorted(level['start'], end, side='right') if end is not None else len(level['start'])
+            if stop - first <= max(max_points, 1):
+                break
+
+        bucket = slice(first, max(first, stop))
+        starts, ends = level['start'][bucket], level['end'][bucket]
+        return {
+            'date': starts + (ends - starts) // 2,
+            'min': level['min'][bucket],
+            'max': level['max'][bucket],
+            'mean': level['sum'][bucket] / level['count'][bucket],
+            'count': level['count'][bucket],
+            'level': level_index
+        }
@@ -0,0 +1,46 @@
+import importlib
+import threading
+
+from src import metrics
+
+# Heavy packages imported on first use instead of when the app starts, the login page
+# needs none of them. benchmarks/import_time.py fails if any of their modules is imported
+# at startup again.
+DEFERRED_PACKAGES = ['matplotlib', 'statsmodels']
+# The modules of those packages the charts and the forecasts use
+CHART_MODULES = ['matplotlib.figure', 'matplotlib.backends.backend_agg', 'matplotlib.collections',
+                 'matplotlib.font_manager', 'matplotlib.lines', 'matplotlib.patches']
+FORECAST_MODULES = ['statsmodels.tsa.arima.model']
+DEFERRED_MODULES = CHART_MODULES + FORECAST_MODULES
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+@metrics.timed("startup.import_deferred")
+def import_deferred(modules=DEFERRED_MODULES):
+    """Import the given deferred modules; the ones already imported cost nothing"""
+    for name in modules:
+        importlib.import_module(name)
+
+
+def start_warm_up(modules=DEFERRED_MODULES):
+    """
+    Import the deferred modules in a background thread, once per process.
+
+    Started right after login, so the first chart or forecast a clinician opens does
+    not wait for matplotlib and statsmodels to load. A render that needs a module still
+    being imported waits on Python's import lock for the rest of that import only.
+
+    Returns:
+    --------
+    threading.Thread
+        The warm-up thread, started by this call or an earlier one.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=import_deferred, args=(modules,), name="import-warm-up",
+                                               daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread